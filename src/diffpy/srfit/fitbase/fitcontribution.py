@@ -25,6 +25,8 @@ See the examples in the documention for how to use a FitContribution.
 
 __all__ = ["FitContribution"]
 
+import numpy
+
 from diffpy.srfit.fitbase.parameterset import ParameterSet
 from diffpy.srfit.fitbase.recipeorganizer import equationFromString
 from diffpy.srfit.fitbase.parameter import ParameterProxy
@@ -59,6 +61,14 @@ class FitContribution(ParameterSet):
     _xname          --  Name of the x-variable
     _yname          --  Name of the y-variable
     _dyname         --  Name of the dy-variable
+    _chiv           --  Flag for the default chiv residual equation.
+    _chunksize      --  Number of points for the chunked evaluation of the
+                        residual or None, see setChunkSize.
+    _chunkeval      --  Function that evaluates the profile equation over a
+                        slice of the calculation points.  It is False when
+                        the equations cannot be evaluated in chunks and None
+                        when it needs to be created after a change of the
+                        equations, profile or chunk size.
 
     Properties
     names           --  Variable names (read only). See getNames.
@@ -75,6 +85,9 @@ class FitContribution(ParameterSet):
         self._xname = None
         self._yname = None
         self._dyname = None
+        self._chiv = False
+        self._chunksize = None
+        self._chunkeval = None
 
         self._generators = {}
         self._manage(self._generators)
@@ -106,6 +119,7 @@ class FitContribution(ParameterSet):
 
         # Set the Profile and add its parameters to this organizer.
         self.profile = profile
+        self._chunkeval = None
 
         if xname is None:
             xname = self.profile.xpar.name
@@ -209,11 +223,14 @@ class FitContribution(ParameterSet):
         self._eqfactory.registerOperator("eq", eq)
         self._eqfactory.wipeout(self._eq)
         self._eq = eq
+        self._chunkeval = None
 
         # Set the residual if we need to
         if self.profile is not None and self._reseq is None:
             self.setResidualEquation('chiv')
 
+        # Notify observers that the profile equation has changed.
+        self._flush(other=(self,))
         return
 
 
@@ -268,7 +285,11 @@ class FitContribution(ParameterSet):
         reseq = equationFromString(eqstr, self._eqfactory)
         self._eqfactory.wipeout(self._reseq)
         self._reseq = reseq
+        self._chiv = (eqstr == chivstr)
+        self._chunkeval = None
 
+        # Notify observers that the residual has changed.
+        self._flush(other=(self,))
         return
 
 
@@ -285,7 +306,102 @@ class FitContribution(ParameterSet):
         return rv
 
 
-    def residual(self):
+    def setDtype(self, dtype):
+        """Set the floating point type of the profile and generator outputs.
+
+        The observed and calculated arrays of the profile and the outputs of
+        its ProfileGenerators are kept in dtype.  The residual is returned
+        in double precision and the FitRecipe accumulates chi2 and its
+        derivatives in float64.  Single precision halves the memory
+        bandwidth of large profiles, at the cost of relative errors of about
+        1e-7 in the calculated profile.
+
+        dtype   --  numpy floating point type, e.g., numpy.float32.
+
+        Raises SrFitError if the Profile is not yet defined.
+        Raises ValueError if dtype is not a real floating point type.
+        """
+        if self.profile is None:
+            raise SrFitError("Assign the Profile first")
+        self.profile.setDtype(dtype)
+        return
+
+
+    def getDtype(self):
+        """Get the floating point type of the profile arrays."""
+        if self.profile is None:
+            return Profile.dtype
+        return self.profile.dtype
+
+
+    def setChunkSize(self, chunksize):
+        """Set the number of points for chunked evaluation of the residual.
+
+        The residual of a long profile is then evaluated over consecutive
+        chunks of its calculation points and written to the output array
+        chunk by chunk, so that the temporary arrays of the equations do not
+        grow with the profile length.  The chunked evaluation is used only
+        when the profile equation is pointwise and the residual equation is
+        the default chiv.  The profile equation is pointwise if it consists
+        of numpy ufuncs, such as the arithmetic operators, and of
+        ProfileGenerators and other operators with the pointwise attribute
+        set to True.  Its array arguments can be only the x, y and dy arrays
+        of the profile.  The equations are checked when they, the profile
+        or the chunk size change.
+
+        chunksize   --  Positive number of points in a chunk.  Use None
+                        (default) to evaluate the whole profile at once.
+
+        Raises ValueError if chunksize is not positive.
+        """
+        if chunksize is not None:
+            chunksize = int(chunksize)
+            if chunksize < 1:
+                raise ValueError("chunksize must be positive.")
+        self._chunksize = chunksize
+        self._chunkeval = None
+        return
+
+
+    def getChunkSize(self):
+        """Get the number of points for chunked evaluation or None."""
+        return self._chunksize
+
+
+    def isChunked(self):
+        """Check if the residual is evaluated in chunks.
+
+        Return True when the chunk size is set, the profile is longer than
+        one chunk and the equations allow chunked evaluation, see
+        setChunkSize.
+        """
+        prof = self.profile
+        rv = (self._chunksize is not None and
+              prof is not None and prof.x is not None and
+              len(prof.x) > self._chunksize and
+              bool(self._getChunkEvaluator()))
+        return rv
+
+
+    def _getChunkEvaluator(self):
+        """Get the function that evaluates the equation over a slice.
+
+        The function is created once after a change of the equations,
+        profile or chunk size.
+
+        Return the function or False if the equations are not pointwise.
+        """
+        if self._chunkeval is None:
+            prof = self.profile
+            f = None
+            if self._chiv and self._eq is not None:
+                pars = (prof.xpar, prof.ypar, prof.dypar)
+                f = _compileChunked(self._eq, pars)
+            self._chunkeval = f or False
+        return self._chunkeval
+
+
+    def residual(self, out=None):
         """Calculate the residual for this fitcontribution.
 
         When this method is called, it is assumed that all parameters have been
@@ -299,12 +415,47 @@ class FitContribution(ParameterSet):
         The residual equation can be changed with the setResidualEquation
         method.
 
+        out --  Optional output array for the residual.  The residual is
+                evaluated in chunks when isChunked is True.
+
         """
+        if self.isChunked():
+            return self._chunkedResidual(out)
         # Assign the calculated profile
         self.profile.ycalc = self._eq()
         # Note that equations only recompute when their inputs are modified, so
         # the following will not recompute the equation.
-        return self._reseq()
+        rv = self._reseq()
+        if out is not None:
+            out[...] = rv
+            rv = out
+        elif self.profile.dtype != numpy.float64:
+            rv = numpy.asarray(rv, dtype=float)
+        return rv
+
+
+    def _chunkedResidual(self, out):
+        """Evaluate the residual over chunks of the calculation points.
+
+        The chunks of the profile arrays are passed to the function from
+        _getChunkEvaluator, the profile is changed only by the assignment
+        of the calculated ycalc at the end.
+        """
+        prof = self.profile
+        y, dy = prof.y, prof.dy
+        n = len(y)
+        if out is None:
+            out = numpy.empty(n, dtype=float)
+        ycalc = numpy.empty(n, dtype=prof.dtype)
+        feq = self._getChunkEvaluator()
+        for i0 in range(0, n, self._chunksize):
+            s = slice(i0, i0 + self._chunksize)
+            ycalc[s] = feq(s)
+            # chiv = (eq - y) / dy
+            numpy.subtract(ycalc[s], y[s], out=out[s])
+            numpy.divide(out[s], dy[s], out=out[s])
+        prof.ycalc = ycalc
+        return out
 
 
     def evaluate(self):
@@ -361,4 +512,50 @@ class FitContribution(ParameterSet):
             raise SrFitError("residual evaluates to None")
         return
 
+# End of class FitContribution
+
+# Local helpers --------------------------------------------------------------
+
+def _compileChunked(literal, pars):
+    """Compile an equation to a function that evaluates it over a slice.
+
+    literal --  Literal at the top of the equation tree.
+    pars    --  Tuple of the Parameters of the profile arrays that are split
+                to the chunks.  The first one holds the calculation points.
+
+    Return a function of a slice of the calculation points or None when
+    an operator is not pointwise or an array argument is not in pars.
+    """
+    from diffpy.srfit.equation import Equation
+    from diffpy.srfit.equation.literals.operators import Operator
+    from diffpy.srfit.fitbase.profilegenerator import ProfileGenerator
+    if isinstance(literal, Equation):
+        return _compileChunked(literal.root, pars)
+    if isinstance(literal, ProfileGenerator):
+        if not literal.pointwise:
+            return None
+        xpar = pars[0]
+        def evalgenerator(s):
+            return literal.profile._cast(literal(xpar.getValue()[s]))
+        return evalgenerator
+    if isinstance(literal, Operator):
+        if not (getattr(literal, "pointwise", False) or
+                isinstance(literal.operation, numpy.ufunc)):
+            return None
+        fargs = [_compileChunked(a, pars) for a in literal.args]
+        if any(f is None for f in fargs):
+            return None
+        operation = literal.operation
+        def evaloperator(s):
+            return operation(*[f(s) for f in fargs])
+        return evaloperator
+    par = literal
+    while isinstance(par, ParameterProxy):
+        par = par.par
+    if any(par is p for p in pars):
+        return lambda s: par.getValue()[s]
+    if isinstance(literal.getValue(), numpy.ndarray):
+        return None
+    return lambda s: literal.getValue()
+
 # End of file
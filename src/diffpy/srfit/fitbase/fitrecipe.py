@@ -34,12 +34,17 @@ using FitRecipe.
 
 __all__ = ["FitRecipe"]
 
+import pickle
+import struct
 from collections import OrderedDict
-from numpy import array, concatenate, sqrt, dot
+from numpy import array, asarray, empty, multiply, sqrt, dot, isscalar
+from numpy import finfo
 import six
 
 from diffpy.srfit.interface import _fitrecipe_interface
 from diffpy.srfit.util.tagmanager import TagManager
+from diffpy.srfit.util.lrucache import LRUCache
+from diffpy.srfit.util.observable import notifyAll
 from diffpy.srfit.fitbase.parameter import ParameterProxy
 from diffpy.srfit.fitbase.recipeorganizer import RecipeOrganizer
 from diffpy.srfit.fitbase.fithook import PrintFitHook
@@ -53,6 +58,14 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
     fithooks        --  List of FitHook instances that can pass information out
                         of the system during a refinement. By default, the is
                         populated by a PrintFitHook instance.
+    generatormemo   --  LRUCache of profiles shared by the ProfileGenerators
+                        within one residual calculation.  It is emptied
+                        after each residual call.  Its hits counter gives
+                        the number of saved generator evaluations.
+    residualcache   --  LRUCache of the residual vectors indexed by the free
+                        variable values and the generation of the recipe
+                        state. Its hits and misses counters can be used for
+                        tuning. Use setResidualCacheSize to change its size.
     _constraints    --  A dictionary of Constraints, indexed by the constrained
                         Parameter. Constraints can be added using the
                         'constrain' method.
@@ -77,6 +90,12 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
                         FitContribution when determining the overall residual.
     _fixedtag       --  "__fixed", used for tagging variables as fixed. Don't
                         use this tag unless you want issues.
+    _statelayout    --  Cached list of Parameters whose values are stored by
+                        'snapshot' together with the configuration generation
+                        of the recipe hierarchy, or None.
+    _generation     --  Counter of changes in the recipe that are not made by
+                        the residual method.  Used for the residualcache keys.
+    _inresidual     --  A flag indicating the residual is being computed.
 
     Properties
     names           --  Variable names (read only). See getNames.
@@ -101,12 +120,17 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
     def __init__(self, name = "fit"):
         """Initialization."""
         RecipeOrganizer.__init__(self, name)
+        self._generation = 0
+        self._inresidual = False
+        self.residualcache = LRUCache(4)
+        self.generatormemo = LRUCache(32)
         self.fithooks = []
         self.pushFitHook(PrintFitHook())
         self._restraintlist = []
         self._oconstraints = []
         self._ready = False
         self._fixedtag = "__fixed"
+        self._statelayout = None
 
         self._weights = []
         self._tagmanager = TagManager()
@@ -181,6 +205,7 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
         """Set the weight of a FitContribution."""
         idx = list(self._contributions.values()).index(con)
         self._weights[idx] = weight
+        self._generation += 1
         return
 
     def addParameterSet(self, parset):
@@ -219,12 +244,66 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
         dot(chiv, chiv) = chi^2 + restraints.
         """
 
-        # Prepare, if necessary
-        self._prepare()
+        # Prepare, if necessary.  The validation evaluates the generators,
+        # which can share their evaluations as in the residual.
+        self._setGeneratorMemo(self.generatormemo)
+        try:
+            self._prepare()
+        finally:
+            self._setGeneratorMemo(None)
 
         for fithook in self.fithooks:
             fithook.precall(self)
 
+        # Look up the residual for these variable values.
+        key = entry = None
+        if self.residualcache.maxsize:
+            pcur = asarray(self.getValues(), dtype=float)
+            pvec = array(p, dtype=float) if len(p) else pcur
+            key = (pvec.tobytes(), self._generation)
+            entry = self.residualcache.get(key)
+
+        if entry is not None:
+            chiv, ycalcs = entry
+            chiv = chiv.copy()
+            self._inresidual = True
+            try:
+                # Variables must be assigned when returning to older point.
+                # This is a change made by the residual method, which does
+                # not invalidate the other cached entries.
+                if pvec.tobytes() != pcur.tobytes():
+                    self._applyValues(p)
+                    for con in self._oconstraints:
+                        con.update()
+                for ci, yc in zip(self._contributions.values(), ycalcs):
+                    ci.profile.ycalc = _copyArray(yc)
+            finally:
+                self._inresidual = False
+            for fithook in self.fithooks:
+                fithook.postcall(self, chiv)
+            return chiv
+
+        self._inresidual = True
+        try:
+            chiv = self._evaluateResidual(p)
+        finally:
+            self._inresidual = False
+
+        if key is not None:
+            ycalcs = [_copyArray(ci.profile.ycalc)
+                      for ci in self._contributions.values()]
+            self.residualcache.put(key, (chiv.copy(), ycalcs))
+
+        for fithook in self.fithooks:
+            fithook.postcall(self, chiv)
+
+        return chiv
+
+    def _evaluateResidual(self, p):
+        """Apply variable values and calculate the residual vector.
+
+        See the residual method.
+        """
         # Update the variable parameters.
         self._applyValues(p)
 
@@ -233,21 +312,61 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
         for con in self._oconstraints:
             con.update()
 
-        # Calculate the bare chiv
-        chiv = concatenate([
-            wi * ci.residual().flatten()
-            for wi, ci in zip(self._weights, self._contributions.values())])
+        # Calculate the bare chiv.  Generators can share their evaluations
+        # through the memo while the variables stay the same.  Chunked
+        # contributions write directly to the output array.
+        contribs = list(zip(self._weights, self._contributions.values()))
+        self._setGeneratorMemo(self.generatormemo)
+        try:
+            blocks = [None if ci.isChunked() else ci.residual().flatten()
+                      for wi, ci in contribs]
+            sizes = [len(ci.profile.x) if b is None else len(b)
+                     for (wi, ci), b in zip(contribs, blocks)]
+            n = sum(sizes)
+            chiv = empty(n + len(self._restraintlist), dtype=float)
+            i0 = 0
+            for (wi, ci), b, size in zip(contribs, blocks, sizes):
+                cv = chiv[i0:i0 + size]
+                if b is None:
+                    ci.residual(out=cv)
+                    cv *= wi
+                else:
+                    multiply(wi, b, out=cv)
+                i0 += size
+        finally:
+            self._setGeneratorMemo(None)
 
         # Calculate the point-average chi^2
-        w = dot(chiv, chiv)/len(chiv)
+        w = dot(chiv[:n], chiv[:n])/n
         # Now we must append the restraints
-        penalties = [ sqrt(res.penalty(w)) for res in self._restraintlist ]
-        chiv = concatenate( [ chiv, penalties ] )
+        chiv[n:] = [ sqrt(res.penalty(w)) for res in self._restraintlist ]
+        return chiv
 
-        for fithook in self.fithooks:
-            fithook.postcall(self, chiv)
+    def setResidualCacheSize(self, size):
+        """Set the number of residual vectors cached by the residual method.
 
-        return chiv
+        The residual is reused when it is requested again for the same
+        values of the free variables and no other change was made to the
+        recipe in the meantime.  The caching is disabled when size is 0.
+
+        size    --  Maximum number of cached residual vectors.
+
+        Raises ValueError if size is negative.
+        """
+        self.residualcache.resize(size)
+        return
+
+    def getResidualEpsilon(self):
+        """Get the relative precision of the residual.
+
+        Return the machine epsilon of the least precise floating point type
+        of the contributions, see FitContribution.setDtype.  Numeric
+        derivatives of the residual must use relative steps well above this
+        value.
+        """
+        dtypes = [con.getDtype() for con in self._contributions.values()]
+        eps = [finfo(float).eps] + [finfo(dt).eps for dt in dtypes]
+        return float(max(eps))
 
     def scalarResidual(self, p = []):
         """Calculate the scalar residual to be optimized.
@@ -271,6 +390,18 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
         """Same as scalarResidual method."""
         return self.scalarResidual(p)
 
+    def _setGeneratorMemo(self, memo):
+        """Set the memo shared by the generators of all contributions.
+
+        memo    --  LRUCache for the generator evaluations or None to stop
+                    sharing.  The memo is emptied in either case.
+        """
+        self.generatormemo.clear()
+        for ci in self._contributions.values():
+            for g in ci._generators.values():
+                g._memo = memo
+        return
+
     def _prepare(self):
         """Prepare for the residual calculation, if necessary.
 
@@ -286,6 +417,7 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
         # hierarchy.
         if self._ready:
             return
+        self._generation += 1
 
         # Inform the fit hooks that we're updating things
         for fithook in self.fithooks:
@@ -620,6 +752,7 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
         # Fix all of these
         for var in varargs:
             self._tagmanager.tag(var, self._fixedtag)
+        self._generation += 1
 
         # Set the kw values
         for name, val in kw.items():
@@ -647,6 +780,7 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
         for var in varargs:
             if not var.constrained:
                 self._tagmanager.untag(var, self._fixedtag)
+        self._generation += 1
 
         # Set the kw values
         for name, val in kw.items():
@@ -789,17 +923,221 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
                     scaled = scaled)
         return
 
+    def snapshot(self):
+        """Get the values of all scalar Parameters in the recipe hierarchy.
+
+        This stores free, fixed and constrained values of variables and of
+        Parameters in contributions and ParameterSets. Parameters with
+        array or None values, such as the profile arrays, are not included.
+        Proxies are resolved to the proxied Parameter, so every value is
+        stored only once.
+
+        Returns a numpy array of float values that can be passed to
+        'restore'.  The order of values is given by a layout that is cached
+        until the configuration of the recipe changes.
+        """
+        pars = self._getStateLayout()
+        return array([p.getValue() for p in pars], dtype=float)
+
+    def restore(self, state):
+        """Restore Parameter values saved by 'snapshot'.
+
+        The changed values are assigned with the setValue method of each
+        Parameter with its notification silenced.  The observers of the
+        changed Parameters are notified afterwards, each one only once.
+
+        state   --  Array of values returned by 'snapshot' for a recipe of
+                    the same configuration.
+
+        Raises ValueError if state does not match the recipe layout.
+        """
+        pars = self._getStateLayout()
+        state = asarray(state, dtype=float)
+        if state.shape != (len(pars),):
+            emsg = "State of shape %s does not match %i parameters" % (
+                    state.shape, len(pars))
+            raise ValueError(emsg)
+        changed = []
+        for par, val in zip(pars, state.tolist()):
+            if par.getValue() != val:
+                _setValueQuietly(par, val)
+                changed.append(par)
+        notifyAll(changed)
+        return
+
+    def dumps(self, buffers=None):
+        """Serialize the recipe to a compact versioned bytes object.
+
+        The recipe hierarchy is pickled together with its equations,
+        constraints, restraints, parameter values and tags.  With pickle
+        protocol 5 the contiguous numpy arrays, such as the profile data,
+        are stored as raw buffers outside of the pickle stream.
+
+        buffers --  Optional list for out-of-band storage of the raw
+                    buffers.  When specified, the buffers are appended to
+                    this list and not included in the returned bytes.  They
+                    must be passed to 'loads' in the same order.
+
+        Returns bytes that can be restored with FitRecipe.loads.
+        """
+        oob = []
+        if pickle.HIGHEST_PROTOCOL >= 5:
+            payload = pickle.dumps(self, protocol=5,
+                                   buffer_callback=oob.append)
+        else:
+            payload = pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+        raws = [b.raw() for b in oob]
+        inline = buffers is None
+        sizes = [r.nbytes for r in raws]
+        header = struct.pack(_DUMPS_HEADER, _DUMPS_MAGIC, _DUMPS_VERSION,
+                             inline, len(raws), len(payload))
+        header += struct.pack('<%iQ' % len(sizes), *sizes)
+        chunks = [header, payload]
+        if inline:
+            chunks.extend(raws)
+        else:
+            buffers.extend(raws)
+        return b''.join(chunks)
+
+    @staticmethod
+    def loads(data, buffers=None):
+        """Restore a FitRecipe serialized with the 'dumps' method.
+
+        data    --  The bytes returned by 'dumps'.
+        buffers --  List of raw buffers that were stored out of band by
+                    'dumps'. This is only needed if they were not included
+                    in data.
+
+        Returns the restored FitRecipe.
+
+        Raises ValueError if data are not in a supported format.
+        """
+        data = memoryview(data)
+        hsize = struct.calcsize(_DUMPS_HEADER)
+        if len(data) < hsize:
+            raise ValueError("Invalid FitRecipe data")
+        magic, version, inline, nbuf, npayload = struct.unpack(
+                _DUMPS_HEADER, data[:hsize])
+        if magic != _DUMPS_MAGIC:
+            raise ValueError("Invalid FitRecipe data")
+        if version > _DUMPS_VERSION:
+            emsg = "Unsupported FitRecipe data version %i" % version
+            raise ValueError(emsg)
+        fmtsizes = '<%iQ' % nbuf
+        offset = hsize + struct.calcsize(fmtsizes)
+        sizes = struct.unpack(fmtsizes, data[hsize:offset])
+        payload = data[offset:offset + npayload]
+        offset += npayload
+        if inline:
+            # copy to a writable buffer so that restored arrays are writable
+            blob = memoryview(bytearray(data[offset:]))
+            buffers = []
+            for n in sizes:
+                buffers.append(blob[:n])
+                blob = blob[n:]
+        if buffers is None or len(buffers) != nbuf:
+            emsg = "Expected %i out-of-band buffers" % nbuf
+            raise ValueError(emsg)
+        if nbuf:
+            return pickle.loads(payload, buffers=buffers)
+        return pickle.loads(payload)
+
+    def _getStateLayout(self):
+        """Get the cached list of Parameters stored by 'snapshot'.
+
+        The list is rebuilt when objects were added to or removed from
+        any RecipeContainer, e.g., a Parameter to a FitContribution.
+        """
+        confgen = RecipeOrganizer._confgeneration
+        if self._statelayout is not None and self._statelayout[0] == confgen:
+            return self._statelayout[1]
+        pars = []
+        seen = set()
+        for par in self.iterPars():
+            while isinstance(par, ParameterProxy):
+                par = par.par
+            if id(par) in seen:
+                continue
+            seen.add(id(par))
+            value = par.getValue()
+            if isscalar(value) and not isinstance(value, six.string_types):
+                pars.append(par)
+        self._statelayout = (confgen, pars)
+        return pars
+
+    def _addObject(self, obj, d, check = True):
+        """Overloaded to invalidate the cached residual vectors.
+
+        See RecipeContainer._addObject
+        """
+        RecipeOrganizer._addObject(self, obj, d, check)
+        self._generation += 1
+        return
+
+    def _removeObject(self, obj, d):
+        """Overloaded to invalidate the cached residual vectors.
+
+        See RecipeContainer._removeObject
+        """
+        RecipeOrganizer._removeObject(self, obj, d)
+        self._generation += 1
+        return
+
+    def _flush(self, other):
+        """Invalidate cached state.
+
+        This is overloaded to count changes made outside of the residual
+        method, which invalidate the cached residual vectors.
+        """
+        if not self._inresidual:
+            self._generation += 1
+        RecipeOrganizer._flush(self, other)
+        return
+
     def _applyValues(self, p):
         """Apply variable values to the variables."""
         if len(p) == 0: return
         vargen = (v for v in self._parameters.values() if self.isFree(v))
-        for var, pval in zip(vargen, p):
+        # Python floats do not promote single precision profiles
+        for var, pval in zip(vargen, asarray(p, dtype=float).tolist()):
             var.setValue(pval)
         return
 
     def _updateConfiguration(self):
         """Notify RecipeContainers in hierarchy of configuration change."""
         self._ready = False
+        self._generation += 1
         return
 
+# Local helpers --------------------------------------------------------------
+
+def _copyArray(a):
+    """Copy of array a or None."""
+    return None if a is None else a.copy()
+
+
+def _setValueQuietly(par, val):
+    """Set value of Parameter par without notifying its observers.
+
+    The setValue method of the Parameter class is used, so that adapters
+    update their wrapped objects.
+    """
+    par.notify = _skipNotify
+    try:
+        par.setValue(val)
+    finally:
+        del par.notify
+    return
+
+
+def _skipNotify(other=()):
+    """Replacement of Observable.notify that does nothing."""
+    return
+
+# Header of FitRecipe.dumps data with magic bytes, format version,
+# flag for inline buffers, number of buffers and size of the pickle payload.
+_DUMPS_HEADER = '<6sHBIQ'
+_DUMPS_MAGIC = b'SRFITR'
+_DUMPS_VERSION = 1
+
 # End of file
@@ -193,6 +193,11 @@ class FitResults(object):
         """
         recipe = self.recipe
         step = self.derivstep
+        # Single precision contributions need larger steps.  The step of
+        # about eps**(1/3) is optimal for the center point formula.
+        eps = recipe.getResidualEpsilon()
+        if eps > numpy.finfo(float).eps:
+            step = max(step, eps ** (1.0 / 3))
 
         # Make sure the input vector is an array
         pvals = numpy.asarray(self.varvals)
@@ -236,7 +241,9 @@ class FitResults(object):
             pvals[k] = v
             r.append(rk/(2*h))
 
-        # Reset the constrained parameters to their original values
+        # Reset the variables and constrained parameters to their original
+        # values
+        recipe._applyValues(pvals)
         for con in recipe._oconstraints:
             con.update()
 
@@ -256,7 +263,9 @@ class FitResults(object):
             cc2w = con.weight * con.cumchi2
             c2last = cumchi2[-1:].sum()
             cumchi2 = numpy.concatenate([cumchi2, c2last + cc2w])
-            yw2tot += con.weight * (con.chi2 / con.rw**2)
+            # same as chi2 / rw**2, but defined also for a perfect fit
+            yw = numpy.abs(con.y) / con.dy
+            yw2tot += con.weight * (numpy.dot(yw, yw) or 1.0)
             numpoints += len(con.x)
 
         chi2 = cumchi2[-1:].sum()
@@ -580,14 +589,14 @@ class ContributionResults(object):
         self.weight = weight
 
         # First the residual
-        res = con.residual()
+        res = _asDouble(con.residual())
         self.residual = numpy.dot(res, res)
 
-        # The arrays
-        self.x = numpy.array(con.profile.x)
-        self.y = numpy.array(con.profile.y)
-        self.dy = numpy.array(con.profile.dy)
-        self.ycalc = numpy.array(con.profile.ycalc)
+        # The arrays, the metrics are accumulated in double precision.
+        self.x = _asDouble(con.profile.x)
+        self.y = _asDouble(con.profile.y)
+        self.dy = _asDouble(con.profile.dy)
+        self.ycalc = _asDouble(con.profile.ycalc)
 
         # The other metrics
         self._calculateMetrics()
@@ -672,3 +681,13 @@ def initializeRecipe(recipe, results):
             var.value = float(value)
 
     return
+
+# Local helpers --------------------------------------------------------------
+
+def _asDouble(a):
+    """Copy array a with the floating point type promoted to float64.
+
+    Complex arrays are promoted to complex128.
+    """
+    a = numpy.asarray(a)
+    return numpy.array(a, dtype=numpy.promote_types(a.dtype, float))
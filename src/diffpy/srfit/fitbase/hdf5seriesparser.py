@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2008 The Trustees of Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE_DANSE.txt for license information.
+#
+##############################################################################
+
+"""Parser for series of profiles stored in HDF5 files.
+
+HDF5SeriesParser reads the frames of time-resolved or in-situ measurements
+as banks of a ProfileParser.  The frames are read with h5py one at a time
+when they are selected.  h5py is imported only when a file is parsed.
+
+See the class documentation for the layout of the file.
+"""
+
+__all__ = ["HDF5SeriesParser"]
+
+import io
+import functools
+
+import numpy
+
+from diffpy.srfit.exceptions import ParseError
+from diffpy.srfit.fitbase.profileparser import ProfileParser
+
+
+class HDF5SeriesParser(ProfileParser):
+    """Parser for a series of profiles in an HDF5 file.
+
+    Each frame of the series is one bank.  Only the selected frame is held
+    in memory, the data of the previously selected frame are released.
+
+    The file contains these datasets, their names can be set in the
+    constructor:
+
+    x       --  The independent variable, a 1-D dataset shared by all
+                frames or a 2-D dataset of shape (nframes, npoints).
+    y       --  The profiles, a 2-D dataset of shape (nframes, npoints).
+    dx, dy  --  The optional uncertainties, with the same layout as x.
+    meta    --  Optional group of 1-D datasets of length nframes with the
+                per-frame metadata, such as temperature.  The values for the
+                selected frame are set in the metadata dictionary.
+
+    Attributes of the root group and of the y dataset are added to the
+    metadata dictionary for all frames.
+
+    Attributes
+
+    names       --  Dictionary of the dataset names for the "x", "y", "dx",
+                    "dy" arrays and of the "meta" group.
+    _file       --  The open h5py.File or None.
+    _datasets   --  Dictionary of the datasets indexed by the array names.
+    _framemeta  --  Dictionary of the per-frame metadata datasets.
+    _shared     --  Dictionary of the arrays that are shared by all frames.
+    _loaded     --  Index of the frame that is held in _banks or None.
+
+    See ProfileParser for the other attributes.
+
+    General Metadata
+
+    nframes     --  The number of frames, same as nbanks.
+    """
+
+    _format = "HDF5"
+
+    def __init__(self, x="x", y="y", dx="dx", dy="dy", meta="meta"):
+        """Initialize the attributes.
+
+        x, y, dx, dy    --  Names of the datasets for the profile arrays.
+                            The dx and dy datasets are optional.
+        meta            --  Name of the group with the per-frame metadata.
+                            The group is optional.
+        """
+        ProfileParser.__init__(self)
+        self.names = dict(x=x, y=y, dx=dx, dy=dy, meta=meta)
+        self._file = None
+        self._datasets = {}
+        self._framemeta = {}
+        self._shared = {}
+        self._loaded = None
+        return
+
+
+    def parseString(self, patstring):
+        """Parse the binary content of an HDF5 file.
+
+        This wipes out the currently loaded data and selected bank number.
+
+        Arguments
+        patstring   --  bytes with the content of the HDF5 file
+
+        Raises ImportError if h5py is not installed
+        Raises ParseError if the content cannot be parsed
+
+        """
+        import h5py
+        try:
+            h5file = h5py.File(io.BytesIO(patstring), "r")
+        except (OSError, IOError, ValueError) as err:
+            raise ParseError(err)
+        self._setFile(h5file)
+        return
+
+
+    def parseFile(self, filename, cache=False):
+        """Parse a file and set the _x, _y, _dx, _dy and _meta variables.
+
+        This wipes out the currently loaded data and selected bank number.
+        Only the first frame is read, the other frames are read when they
+        are selected.
+
+        Arguments
+        filename    --  The name of the file to parse
+        cache       --  Ignored.  The frames are read from the HDF5 file
+                        when selected, storing them in the on-disk cache
+                        would read the whole series.
+
+        Raises ImportError if h5py is not installed
+        Raises IOError if the file cannot be read
+        Raises ParseError if the file cannot be parsed
+
+        """
+        import h5py
+        # report missing or unreadable files as IOError
+        open(filename, "rb").close()
+        try:
+            h5file = h5py.File(filename, "r")
+        except (OSError, IOError) as err:
+            raise ParseError(err)
+        self._setFile(h5file)
+        self._meta["filename"] = filename
+        self.selectBank(0)
+        return
+
+
+    def selectBank(self, index):
+        """Select which frame to use.
+
+        This reads the frame data and updates the per-frame metadata.  See
+        ProfileParser.selectBank.
+
+        Raises IndexError if requesting a frame that does not exist
+
+        """
+        ProfileParser.selectBank(self, index)
+        i = self._meta["bank"]
+        if self._loaded is not None and self._loaded != i:
+            self._banks[self._loaded] = self._frameLoader(self._loaded)
+        self._loaded = i
+        for name, ds in self._framemeta.items():
+            self._meta[name] = _metaValue(ds[i])
+        return
+
+
+    def close(self):
+        """Close the HDF5 file.
+
+        The data of the selected frame remain available, but other frames
+        cannot be selected anymore.
+        """
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        return
+
+
+    def _setFile(self, h5file):
+        """Set up the datasets and lazy frames of the opened file."""
+        self.close()
+        self._banks = []
+        self._meta = {}
+        self._datasets = {}
+        self._framemeta = {}
+        self._shared = {}
+        self._loaded = None
+        self._file = h5file
+        names = self.names
+        try:
+            for key in ("x", "y", "dx", "dy"):
+                name = names[key]
+                if name is not None and name in h5file:
+                    self._datasets[key] = h5file[name]
+            x = self._datasets.get("x")
+            y = self._datasets.get("y")
+            if x is None or y is None:
+                raise ParseError("The file does not contain x and y data.")
+            if y.ndim != 2:
+                raise ParseError("The y data must be a 2-D dataset.")
+            nframes, npoints = y.shape
+            for key, ds in self._datasets.items():
+                if ds.shape not in ((npoints,), (nframes, npoints)):
+                    emsg = "The %s data do not match the y data." % key
+                    raise ParseError(emsg)
+            mgroup = names["meta"]
+            if mgroup is not None and mgroup in h5file:
+                for name, ds in h5file[mgroup].items():
+                    if getattr(ds, "shape", None) == (nframes,):
+                        self._framemeta[name] = ds
+            for attrs in (h5file.attrs, y.attrs):
+                for name, value in attrs.items():
+                    self._meta[name] = _metaValue(value)
+        except ParseError:
+            self.close()
+            raise
+        self._meta["nframes"] = nframes
+        self._banks = [self._frameLoader(i) for i in range(nframes)]
+        return
+
+
+    def _frameLoader(self, index):
+        """Make the function that reads the bank of the frame at index."""
+        return functools.partial(self._readFrame, index)
+
+
+    def _readFrame(self, index):
+        """Read the (x, y, dx, dy) arrays of the frame at index."""
+        if self._file is None:
+            raise ParseError("The HDF5 file is closed.")
+        rv = []
+        for key in ("x", "y", "dx", "dy"):
+            ds = self._datasets.get(key)
+            if ds is None:
+                a = None
+            elif ds.ndim == 1:
+                # shared by all frames, read it only once
+                if key not in self._shared:
+                    self._shared[key] = numpy.asarray(ds[()], dtype=float)
+                a = self._shared[key]
+            else:
+                a = numpy.asarray(ds[index], dtype=float)
+            rv.append(a)
+        return rv
+
+# End of class HDF5SeriesParser
+
+# Local helpers --------------------------------------------------------------
+
+def _metaValue(value):
+    """Convert HDF5 attribute or dataset value to a metadata value."""
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    if isinstance(value, numpy.generic):
+        return _metaValue(value.item())
+    return value
+
+# End of file
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2008 The Trustees of Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE_DANSE.txt for license information.
+#
+##############################################################################
+
+"""Multi-resolution refinement on decimated calculation grids.
+
+Profiles on very fine grids, such as a PDF with dr = 0.001 over 100 A,
+have many redundant points.  The PDF is fully determined by its values on
+the Nyquist grid with the step pi / qmax, so the first iterations of a
+refinement can run on a much coarser grid.  MultiResolutionRefinement
+refines the recipe on every stride-th point of the calculation grids of
+its profiles and then on progressively finer grids, until it finishes on
+the full grids set by setCalculationRange.  Decimated grids of the
+observed points are used as views of the observed arrays.
+
+Example:
+
+    mr = MultiResolutionRefinement(recipe, qmax=25)
+    mr.run(compare=True)
+    print(mr.formatReport())
+"""
+
+__all__ = ["MultiResolutionRefinement", "nyquistStride"]
+
+import math
+import time
+from collections import OrderedDict
+
+import numpy
+
+from diffpy.srfit.fitbase.refinement import leastsqRefine
+
+
+class MultiResolutionRefinement(object):
+    """Refine a recipe from coarse to full calculation grids.
+
+    A level of the schedule ends when the refine function converges on its
+    grid and the next finer level then starts from the refined values.  The
+    intermediate levels are skipped when the variables change by less than
+    xtol between two levels.  The full grids of the profiles are restored
+    after the refinement.
+
+    Attributes
+
+    recipe      --  The FitRecipe to refine.
+    strides     --  OrderedDict of the decimation strides for each
+                    contribution, from the coarsest level to 1.
+    refine      --  Function that refines the recipe passed as its argument.
+                    It may return the number of residual evaluations.
+    xtol        --  Relative change of the variables between levels below
+                    which the refinement continues on the full grids.
+    report      --  List of the records of the refined levels, see the
+                    run method.
+    reference   --  Record of the direct refinement on the full grids or
+                    None.
+    """
+
+    def __init__(self, recipe, strides=None, qmax=None, factor=2,
+                 refine=None, xtol=1e-3):
+        """Set up the schedule of the decimation strides.
+
+        recipe  --  A configured FitRecipe with variables.
+        strides --  Sequence of the strides from the coarsest level, e.g.,
+                    (8, 4, 2).  The full grids are always refined last.
+                    Use the Nyquist strides from qmax when None (default).
+        qmax    --  Maximum scattering vector for the Nyquist strides.  When
+                    None, use qmax from the metadata of each profile.
+        factor  --  Ratio of the strides of consecutive levels for the
+                    Nyquist schedule (default 2).
+        refine  --  Function that refines the recipe.  Use
+                    scipy.optimize.leastsq when None (default).
+        xtol    --  Relative change of the variables for skipping the
+                    intermediate levels (default 1e-3).
+
+        Raises ValueError if the strides are not positive integers, if
+        factor is less than 2 or if qmax is not known for a contribution.
+        """
+        self.recipe = recipe
+        self.refine = leastsqRefine if refine is None else refine
+        self.xtol = xtol
+        self.strides = OrderedDict()
+        if strides is not None:
+            strides = [int(s) for s in strides]
+            if not all(s > 0 for s in strides):
+                raise ValueError("strides must be positive integers.")
+            if not strides or strides[-1] != 1:
+                strides.append(1)
+            for name in recipe._contributions:
+                self.strides[name] = strides
+        elif not factor >= 2:
+            raise ValueError("factor must be at least 2.")
+        else:
+            for name, con in recipe._contributions.items():
+                q = qmax if qmax is not None else con.profile.meta.get("qmax")
+                if q is None:
+                    emsg = "qmax is not known for contribution %r." % name
+                    raise ValueError(emsg)
+                smax = nyquistStride(con.profile.x, q)
+                self.strides[name] = _makeSchedule(smax, factor)
+        # all contributions get the same number of levels
+        nlevels = max([len(s) for s in self.strides.values()] + [1])
+        for name, s in self.strides.items():
+            self.strides[name] = [s[0]] * (nlevels - len(s)) + s
+        self.report = []
+        self.reference = None
+        return
+
+
+    def run(self, compare=False):
+        """Refine the recipe on all levels of the schedule.
+
+        compare --  Also refine the recipe on the full grids from the same
+                    starting values and keep the record in the reference
+                    attribute (default False).  This doubles the work, but
+                    measures the timing gain.  The recipe keeps the values
+                    from the multi-resolution refinement.
+
+        Return the report list of records of the refined levels.  A record
+        is a dictionary with the keys
+            strides --  list of the strides of the contributions
+            npoints --  total number of calculation points
+            nfev    --  number of residual evaluations or None
+            time    --  time of the refinement in seconds
+            chi2    --  chi2 of the refined level
+        """
+        recipe = self.recipe
+        state0 = recipe.snapshot()
+        self.report = []
+        self.reference = None
+        profiles = [recipe._contributions[n].profile for n in self.strides]
+        xfull = [p.x for p in profiles]
+        nlevels = len(list(self.strides.values())[0]) if self.strides else 1
+        try:
+            lastvalues = None
+            for level in range(nlevels):
+                strides = [s[level] for s in self.strides.values()]
+                if level < nlevels - 1 and max(strides) == 1:
+                    continue
+                for p, x, s in zip(profiles, xfull, strides):
+                    p.setCalculationPoints(x[::s])
+                self.report.append(self._refineLevel(strides))
+                values = numpy.array(recipe.getValues())
+                if level == nlevels - 1:
+                    break
+                if (lastvalues is not None and
+                        _relativeChange(lastvalues, values) < self.xtol):
+                    # converged, continue on the full grids
+                    for p, x in zip(profiles, xfull):
+                        p.setCalculationPoints(x)
+                    self.report.append(self._refineLevel([1] * len(profiles)))
+                    break
+                lastvalues = values
+        finally:
+            for p, x in zip(profiles, xfull):
+                p.setCalculationPoints(x)
+        if compare:
+            state = recipe.snapshot()
+            recipe.restore(state0)
+            self.reference = self._refineLevel([1] * len(profiles))
+            recipe.restore(state)
+        return self.report
+
+
+    def getTimingGain(self):
+        """Get ratio of the direct and multi-resolution refinement times.
+
+        Return None when the refinement was not run with compare=True.
+        """
+        if self.reference is None or not self.report:
+            return None
+        total = sum(r["time"] for r in self.report)
+        return self.reference["time"] / total if total > 0 else None
+
+
+    def formatReport(self):
+        """Format the report of the refined levels as a string."""
+        header = "%-16s %10s %8s %10s %14s" % (
+                "strides", "npoints", "nfev", "time [s]", "chi2")
+        lines = [header, "-" * len(header)]
+        def _fmt(label, r):
+            nfev = "-" if r["nfev"] is None else str(r["nfev"])
+            return "%-16s %10i %8s %10.4f %14.6g" % (label, r["npoints"],
+                    nfev, r["time"], r["chi2"])
+        for r in self.report:
+            label = ",".join(str(s) for s in r["strides"])
+            lines.append(_fmt(label, r))
+        total = sum(r["time"] for r in self.report)
+        lines.append("%-16s %10s %8s %10.4f" % ("total", "", "", total))
+        if self.reference is not None:
+            lines.append(_fmt("direct", self.reference))
+            lines.append("timing gain %.2f" % self.getTimingGain())
+        return "\n".join(lines)
+
+
+    def _refineLevel(self, strides):
+        """Refine the recipe on the current grids and make its record."""
+        recipe = self.recipe
+        t0 = time.time()
+        nfev = self.refine(recipe)
+        t1 = time.time()
+        res = recipe.residual()
+        record = OrderedDict()
+        record["strides"] = list(strides)
+        record["npoints"] = sum(len(recipe._contributions[n].profile.x)
+                                for n in self.strides)
+        record["nfev"] = nfev
+        record["time"] = t1 - t0
+        record["chi2"] = float(numpy.dot(res, res))
+        return record
+
+# End of class MultiResolutionRefinement
+
+
+def nyquistStride(x, qmax):
+    """Get the largest decimation stride within the Nyquist step pi/qmax.
+
+    x       --  Array of the calculation points with a uniform step.
+    qmax    --  Maximum scattering vector of the data.
+
+    Return a positive integer.
+    """
+    n = len(x)
+    if n < 2 or not qmax > 0:
+        return 1
+    dx = (x[-1] - x[0]) / (n - 1.0)
+    if not dx > 0:
+        return 1
+    # allow for the round-off in the step
+    rv = int(math.floor(math.pi / qmax / dx * (1 + 1e-8)))
+    return max(1, rv)
+
+# Local helpers --------------------------------------------------------------
+
+def _makeSchedule(smax, factor):
+    """List strides from smax to 1 decreasing by the factor."""
+    rv = [smax]
+    while rv[-1] > 1:
+        rv.append(max(1, int(rv[-1] // factor)))
+    return rv
+
+
+def _relativeChange(v0, v1):
+    """Get the largest relative change between two arrays of values."""
+    if not len(v0):
+        return 0.0
+    scale = numpy.maximum(numpy.fabs(v0), numpy.fabs(v1))
+    diff = numpy.fabs(v1 - v0)
+    rel = numpy.where(scale > 0, diff / numpy.where(scale > 0, scale, 1), 0)
+    return float(rel.max())
+
+# End of file
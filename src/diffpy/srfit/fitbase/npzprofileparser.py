@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2008 The Trustees of Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE_DANSE.txt for license information.
+#
+##############################################################################
+
+"""Binary profile format based on the NumPy npz container.
+
+The profile arrays x, y, dx, dy are stored as uncompressed npy members of a
+zip archive, as written by numpy.savez.  The metadata dictionary is stored
+as JSON text in the "meta" member and the format version in the "version"
+member.  Arrays that are not available, such as dx, are omitted.  Files
+with several banks store the arrays of the first bank under the same names
+and those of bank i in "bank<i>/x", "bank<i>/y", etc.
+
+NpzProfileParser reads the arrays directly from the memory-mapped file, so
+that loading a profile does not copy or parse the data.  Use
+saveProfileData or Profile.save to write the files and convertProfileFile
+to convert text data files.  Files can be converted from the command line
+with
+
+    python -m diffpy.srfit.fitbase.npzprofileparser file1.gr file2.gr ...
+"""
+
+__all__ = ["NpzProfileParser", "saveProfileData", "saveProfileBanks",
+           "convertProfileFile"]
+
+import io
+import json
+import struct
+import zipfile
+
+import numpy
+from numpy.lib import format as npyformat
+
+from diffpy.srfit.exceptions import ParseError
+from diffpy.srfit.fitbase.profileparser import ProfileParser
+
+# Version of the file format written by saveProfileData.
+FORMAT_VERSION = 1
+
+_arraynames = ("x", "y", "dx", "dy")
+
+
+class NpzProfileParser(ProfileParser):
+    """Parser for profiles saved in the binary npz format.
+
+    The arrays are read-only views of the parsed buffer, which is the
+    memory-mapped file for parseFile.
+
+    Attributes
+
+    mmap        --  Flag for using the arrays from the parsed buffer without
+                    a copy (default True).  When False, the arrays are
+                    copied and the file is not kept open.
+
+    See ProfileParser for the other attributes.
+    """
+
+    _format = "NPZ"
+
+    def __init__(self, mmap=True):
+        """Initialize the attributes.
+
+        mmap    --  Use the arrays from the mapped file without a copy
+                    (default True).
+        """
+        ProfileParser.__init__(self)
+        self.mmap = mmap
+        return
+
+
+    def parseString(self, patstring):
+        """Parse the binary content of a file.
+
+        This wipes out the currently loaded data and selected bank number.
+
+        Arguments
+        patstring   --  bytes with the content of an npz profile file
+
+        Raises ParseError if the content cannot be parsed
+
+        """
+        self._parseBuffer(patstring)
+        return
+
+
+    def _parseBuffer(self, buf):
+        """Read the arrays and metadata from the buffer.
+
+        See ProfileParser._parseBuffer.
+        """
+        try:
+            members = _readMembers(buf)
+        except (zipfile.BadZipfile, ValueError, struct.error) as err:
+            raise ParseError(err)
+        version = int(members.pop("version", 0))
+        if not 0 < version <= FORMAT_VERSION:
+            emsg = "Unsupported profile format version %i." % version
+            raise ParseError(emsg)
+        if "meta" in members:
+            meta = members.pop("meta").tobytes().decode("utf-8")
+            self._meta.update(json.loads(meta))
+        for i in range(len(members)):
+            prefix = _bankPrefix(i)
+            bank = [members.get(prefix + n) for n in _arraynames]
+            if bank[0] is None or bank[1] is None:
+                break
+            if not self.mmap:
+                bank = [None if a is None else a.copy() for a in bank]
+            self._banks.append(bank)
+        if not self._banks:
+            raise ParseError("The file does not contain x and y arrays.")
+        return
+
+# End of class NpzProfileParser
+
+
+def saveProfileData(fname, x, y, dx=None, dy=None, meta=None):
+    """Save profile arrays and metadata in the binary npz format.
+
+    fname   --  name of the output file or a writable binary file object.
+                The name is used as is, the ".npz" suffix is not added.
+    x, y    --  arrays of the independent variable and the profile.
+    dx, dy  --  arrays of the uncertainties in x and y or None if they are
+                not available (default None).
+    meta    --  dictionary of the metadata.  The values must be convertible
+                to JSON (default None).
+
+    Raises ValueError if the arrays have different lengths.
+    Raises TypeError if the metadata cannot be converted to JSON.
+    """
+    saveProfileBanks(fname, [(x, y, dx, dy)], meta)
+    return
+
+
+def saveProfileBanks(fname, banks, meta=None):
+    """Save several banks of profile arrays in the binary npz format.
+
+    fname   --  name of the output file or a writable binary file object.
+    banks   --  list of (x, y, dx, dy) tuples of the bank arrays, dx and dy
+                can be None.
+    meta    --  dictionary of the metadata.  The values must be convertible
+                to JSON (default None).
+
+    Raises ValueError if the arrays in a bank have different lengths.
+    Raises TypeError if the metadata cannot be converted to JSON.
+    """
+    arrays = {}
+    for i, bank in enumerate(banks):
+        prefix = _bankPrefix(i)
+        for n, a in zip(_arraynames, bank):
+            if a is None:
+                continue
+            a = numpy.ascontiguousarray(a, dtype=float)
+            if len(a) != len(bank[0]):
+                raise ValueError("x and %s are different lengths" % n)
+            arrays[prefix + n] = a
+    metatext = json.dumps(dict(meta or {}), sort_keys=True)
+    arrays["meta"] = numpy.frombuffer(metatext.encode("utf-8"), numpy.uint8)
+    arrays["version"] = numpy.array(FORMAT_VERSION)
+    if hasattr(fname, "write"):
+        numpy.savez(fname, **arrays)
+    else:
+        with open(fname, "wb") as fp:
+            numpy.savez(fp, **arrays)
+    return
+
+
+def convertProfileFile(filename, outfile=None, parser=None):
+    """Convert a text data file to the binary npz format.
+
+    filename    --  name of the data file.
+    outfile     --  name of the output file.  Use filename with the ".npz"
+                    suffix when None (default).
+    parser      --  ProfileParser instance that reads the data file.  Use a
+                    PDFParser when None (default).
+
+    All banks of the data file are read, the output files of banks after
+    the first one have the bank number in their name, e.g., "data-1.npz".
+
+    Return a list of the output file names.
+    Raises IOError if the file cannot be read or written.
+    Raises ParseError if the data file cannot be parsed.
+    """
+    import os.path
+    if parser is None:
+        from diffpy.srfit.pdf.pdfparser import PDFParser
+        parser = PDFParser()
+    if outfile is None:
+        outfile = filename + ".npz"
+    parser.parseFile(filename)
+    rv = []
+    for i in range(parser.getNumBanks()):
+        x, y, dx, dy = parser.getData(i)
+        meta = dict(parser.getMetaData())
+        fname = outfile
+        if i > 0:
+            base, ext = os.path.splitext(outfile)
+            fname = "%s-%i%s" % (base, i, ext)
+        saveProfileData(fname, x, y, dx, dy, meta)
+        rv.append(fname)
+    return rv
+
+
+def main(argv=None):
+    """Convert the data files given in the command line arguments."""
+    import sys
+    args = sys.argv[1:] if argv is None else argv
+    if not args or args[0] in ("-h", "--help"):
+        print("usage: python -m diffpy.srfit.fitbase.npzprofileparser "
+              "FILE...\n\nConvert PDF data files to the binary npz format.")
+        return 0 if args else 1
+    for f in args:
+        for fout in convertProfileFile(f):
+            print("%s -> %s" % (f, fout))
+    return 0
+
+# Local helpers --------------------------------------------------------------
+
+def _bankPrefix(index):
+    """Get prefix of the member names for the bank at index."""
+    return "bank%i/" % index if index else ""
+
+
+def _readMembers(buf):
+    """Read the npy members of an npz archive in the buffer.
+
+    The uncompressed members are read-only views of the buffer.
+
+    Return a dictionary of arrays indexed by the member names without
+    the ".npy" suffix.
+    """
+    fp = buf if hasattr(buf, "seek") else io.BytesIO(buf)
+    view = memoryview(buf)
+    rv = {}
+    with zipfile.ZipFile(fp) as zf:
+        for info in zf.infolist():
+            name = info.filename
+            if name.endswith(".npy"):
+                name = name[:-4]
+            if info.compress_type != zipfile.ZIP_STORED:
+                with zf.open(info) as mfp:
+                    rv[name] = npyformat.read_array(mfp, allow_pickle=False)
+                continue
+            # skip the local file header to the npy data
+            fp.seek(info.header_offset)
+            lfh = fp.read(30)
+            nlen, elen = struct.unpack("<HH", lfh[26:30])
+            fp.seek(info.header_offset + 30 + nlen + elen)
+            npyversion = npyformat.read_magic(fp)
+            if npyversion == (1, 0):
+                shape, fortran, dtype = npyformat.read_array_header_1_0(fp)
+            elif npyversion == (2, 0):
+                shape, fortran, dtype = npyformat.read_array_header_2_0(fp)
+            else:
+                raise ValueError("Unsupported npy version %i.%i." % npyversion)
+            if dtype.hasobject:
+                raise ValueError("Object arrays are not supported.")
+            count = int(numpy.prod(shape))
+            a = numpy.frombuffer(view, dtype=dtype, count=count,
+                                 offset=fp.tell())
+            order = 'F' if fortran else 'C'
+            rv[name] = a.reshape(shape, order=order)
+    return rv
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
+
+# End of file
@@ -23,7 +23,8 @@ Parameters encapsulate an adjustable parameter within SrFit.
 # IDEA - Add tags to parameters so they can be easily retrieved.
 # IDEA - Consider scaling parameters to avoid precision issues in optimizers.
 
-__all__ = ["Parameter", "ParameterProxy", "ParameterAdapter"]
+__all__ = ["Parameter", "ParameterProxy", "ParameterAdapter",
+           "ArrayAdapterGroup"]
 
 from functools import wraps
 
@@ -33,6 +34,7 @@ from diffpy.srfit.exceptions import SrFitError
 from diffpy.srfit.equation.literals import Argument
 from diffpy.srfit.util.nameutils import validateName
 from diffpy.srfit.util.argbinders import bind2nd
+from diffpy.srfit.util.observable import notifyAll
 from diffpy.srfit.interface import _parameter_interface
 from diffpy.srfit.fitbase.validatable import Validatable
 
@@ -210,10 +212,27 @@ class ParameterProxy(Parameter):
         return
 
 
+    # share the observer registry with the proxied Parameter
+
     @property
     def _observers(self):
         return self.par._observers
 
+    @_observers.setter
+    def _observers(self, value):
+        self.par._observers = value
+        return
+
+
+    @property
+    def _obstuple(self):
+        return self.par._obstuple
+
+    @_obstuple.setter
+    def _obstuple(self, value):
+        self.par._obstuple = value
+        return
+
     # wrap Parameter methods to use the target object ------------------------
 
     @wraps(Parameter.setValue)
@@ -328,4 +347,135 @@ class ParameterAdapter(Parameter):
 
 # End class ParameterAdapter
 
+
+class ArrayAdapterGroup(object):
+    """A group of ParameterAdapters that wrap elements of one numpy array.
+
+    Adapters in the group keep their scalar getValue and setValue methods.
+    The group provides a vectorized write path, where a vector of new values
+    is scattered into the array with one fancy-indexed assignment and the
+    observers of the changed adapters are notified once.
+
+    Attributes
+    obj     --  The object that holds the array.
+    attr    --  The name of the array attribute of obj. The array is read
+                as getattr(obj, attr) and written back with setattr(obj,
+                attr, array). This works for array properties such as
+                diffpy.structure.Structure.xyz and Structure.U.
+    pars    --  List of the grouped ParameterAdapters (read only).
+    _pars   --  List of the grouped ParameterAdapters.
+    _rdidx  --  Tuple of index arrays that read one value per adapter.
+    _wridx  --  Tuple of index arrays for all array elements that are written.
+    _wrsrc  --  Index of the value in the group vector for each written
+                element.
+
+    """
+
+    pars = property(lambda self: self._pars[:])
+
+    def __init__(self, obj, attr):
+        """Initialization.
+
+        obj     --  The object that holds the array.
+        attr    --  The name of the array attribute of obj.
+
+        """
+        self.obj = obj
+        self.attr = attr
+        self._pars = []
+        self._rdlist = []
+        self._wrlist = []
+        self._wrsrc = numpy.empty(0, dtype=int)
+        self._rdidx = self._wridx = None
+        return
+
+    def __len__(self):
+        """Get the number of grouped adapters."""
+        return len(self._pars)
+
+    def addAdapter(self, par, index, *mirrors):
+        """Add an adapter to the group.
+
+        par     --  The ParameterAdapter (or ParameterProxy) whose value is
+                    stored at array[index].
+        index   --  The index tuple of the adapted element in the array.
+        mirrors --  Index tuples of other array elements that must be
+                    assigned the same value, e.g., U[i,1,0] for U[i,0,1].
+
+        Raises ValueError if par is already in the group.
+
+        """
+        if par in self._pars:
+            raise ValueError("'%s' is already in the group" % par.name)
+        idx = len(self._pars)
+        self._pars.append(par)
+        self._rdlist.append(tuple(index))
+        self._wrlist.append(tuple(index))
+        self._wrlist.extend(tuple(m) for m in mirrors)
+        wrsrc = [idx] * (1 + len(mirrors))
+        self._wrsrc = numpy.append(self._wrsrc, wrsrc)
+        self._rdidx = self._wridx = None
+        return
+
+    def getValues(self):
+        """Get the values of the grouped adapters as an array."""
+        arr = numpy.asarray(getattr(self.obj, self.attr))
+        return arr[self._getReadIndex()]
+
+    def setValues(self, values):
+        """Set the values of the grouped adapters.
+
+        values  --  Array of new values in the order the adapters were added.
+
+        Only the adapters with a changed value notify their observers. Each
+        observer is called once, even if it observes several of them.
+
+        Raises ValueError if values do not match the size of the group.
+
+        Returns self so that mutators can be chained.
+
+        """
+        values = numpy.asarray(values, dtype=float)
+        if values.shape != (len(self._pars),):
+            emsg = "Expected %i values, got shape %s" % (
+                    len(self._pars), values.shape)
+            raise ValueError(emsg)
+        arr = numpy.asarray(getattr(self.obj, self.attr), dtype=float)
+        changed = arr[self._getReadIndex()] != values
+        if not changed.any():
+            return self
+        # the array is written back with setattr, copy only read-only views
+        if not arr.flags.writeable:
+            arr = arr.copy()
+        arr[self._getWriteIndex()] = values[self._wrsrc]
+        setattr(self.obj, self.attr, arr)
+        self._notifyChanged(changed)
+        return self
+
+    def _getReadIndex(self):
+        if self._rdidx is None:
+            self._rdidx = _toIndexArrays(self._rdlist)
+        return self._rdidx
+
+    def _getWriteIndex(self):
+        if self._wridx is None:
+            self._wridx = _toIndexArrays(self._wrlist)
+        return self._wridx
+
+    def _notifyChanged(self, changed):
+        """Notify observers of the changed adapters, each one only once."""
+        pars = [p for p, flag in zip(self._pars, changed) if flag]
+        notifyAll(pars)
+        return
+
+# End class ArrayAdapterGroup
+
+# Local helpers --------------------------------------------------------------
+
+def _toIndexArrays(indices):
+    """Convert a list of index tuples to a tuple of index arrays."""
+    if not indices:
+        return (numpy.empty(0, dtype=int),)
+    return tuple(numpy.array(indices, dtype=int).T)
+
 # End of file
@@ -30,6 +30,7 @@ from diffpy.srfit.util.observable import Observable
 from diffpy.srfit.fitbase.parameter import Parameter
 from diffpy.srfit.fitbase.validatable import Validatable
 from diffpy.srfit.exceptions import SrFitError
+from diffpy.srfit.util.lrucache import LRUCache
 
 # This is the roundoff tolerance for selecting bounds on arrays.
 epsilon = 1e-8
@@ -66,9 +67,24 @@ class Profile(Observable, Validatable):
                 constrained to.
     meta    --  A dictionary of metadata. This is only set if provided by a
                 parser.
+    xversion -- Counter of changes of the calculation points x.  This can be
+                used to check if x is unchanged without comparing arrays.
+    _gridcache -- LRUCache of the setup for resampling the observed profile
+                to the calculation points.  This is cleared when the observed
+                profile changes.
+    _xsorted -- Flag for xobs in ascending order.
+    _dyunit -- Flag for unit uncertainties dyobs.
+    dtype   --  numpy floating point type of the observed and calculated
+                arrays (default float64), see setDtype.
+
+    Contiguous parts of the observed profile are set as the calculation
+    points without a copy, the x, y and dy arrays are then views of xobs,
+    yobs and dyobs.
 
     """
 
+    dtype = numpy.dtype(float)
+
     def __init__(self):
         """Initialize the attributes."""
         Observable.__init__(self)
@@ -80,6 +96,10 @@ class Profile(Observable, Validatable):
         self.dypar = Parameter("dy")
         self.ycpar = Parameter("ycalc")
         self.meta = {}
+        self.xversion = 0
+        self._gridcache = LRUCache(8)
+        self._xsorted = True
+        self._dyunit = False
 
         # Observable
         self.xpar.addObserver(self._flush)
@@ -95,7 +115,7 @@ class Profile(Observable, Validatable):
     dy = property( lambda self : self.dypar.getValue(),
                    lambda self, val : self.dypar.setValue(val) )
     ycalc = property( lambda self : self.ycpar.getValue(),
-                  lambda self, val : self.ycpar.setValue(val) )
+                  lambda self, val : self.ycpar.setValue(self._cast(val)) )
 
     # We want xobs, yobs and dyobs to be read-only
     xobs = property( lambda self: self._xobs )
@@ -106,6 +126,8 @@ class Profile(Observable, Validatable):
         """Load parsed data from a ProfileParser.
 
         This sets the xobs, yobs, dyobs arrays as well as the metadata.
+        Arrays of the profile dtype are used without a copy, e.g., they stay
+        memory-mapped when loaded with NpzProfileParser.
 
         """
         x, y, junk, dy = parser.getData()
@@ -132,13 +154,16 @@ class Profile(Observable, Validatable):
         if dyobs is not None and len(dyobs) != len(xobs):
             raise ValueError("xobs and dyobs are different lengths")
 
-        self._xobs = numpy.asarray(xobs, dtype=float)
-        self._yobs = numpy.asarray(yobs, dtype=float)
+        self._xobs = numpy.asarray(xobs, dtype=self.dtype)
+        self._yobs = numpy.asarray(yobs, dtype=self.dtype)
 
         if dyobs is None:
-            self._dyobs = numpy.ones_like(xobs)
+            self._dyobs = numpy.ones_like(self._xobs)
         else:
-            self._dyobs = numpy.asarray(dyobs, dtype=float)
+            self._dyobs = numpy.asarray(dyobs, dtype=self.dtype)
+        self._gridcache.clear()
+        self._xsorted = bool(numpy.all(self._xobs[1:] >= self._xobs[:-1]))
+        self._dyunit = bool(numpy.all(self._dyobs == 1))
 
         # Set the default calculation points
         if self.x is None:
@@ -235,10 +260,13 @@ class Profile(Observable, Validatable):
         epshi = abs(hi) * epsilon + epsilon
         # process the new grid.
         if clip:
-            indices = (lo - epslo <= self.xobs) & (self.xobs <= hi + epshi)
-            self.x = self.xobs[indices]
-            self.y = self.yobs[indices]
-            self.dy = self.dyobs[indices]
+            if self._xsorted:
+                i0 = self.xobs.searchsorted(lo - epslo, side='left')
+                i1 = self.xobs.searchsorted(hi + epshi, side='right')
+                indices = slice(i0, i1)
+            else:
+                indices = (lo - epslo <= self.xobs) & (self.xobs <= hi + epshi)
+            self._setObservedPoints(indices)
         else:
             x1 = numpy.arange(lo, hi + epshi, step)
             self.setCalculationPoints(x1)
@@ -256,22 +284,90 @@ class Profile(Observable, Validatable):
         dyobs exist.
 
         """
-        x = numpy.asarray(x)
+        x = self._cast(numpy.asarray(x))
         if self.xobs is not None:
             x = x[ x >= self.xobs[0] - epsilon ]
             x = x[ x <= self.xobs[-1] + epsilon ]
+        if self.xobs is None or self.yobs is None:
+            self.x = x
+            return
+        # resample the observed profile, the setup is cached per grid
+        key = x.tobytes()
+        setup = self._gridcache.get(key)
+        if setup is None:
+            setup = _rebinSetup(self.xobs, x) if self._xsorted else False
+            self._gridcache.put(key, setup)
+        if isinstance(setup, slice):
+            self._setObservedPoints(setup)
+            return
         self.x = x
-        if self.yobs is not None:
-            self.y = rebinArray(self.yobs, self.xobs, self.x)
-        if self.dyobs is not None:
-            # work around for interpolation issue making some of these non-1
-            if (self.dyobs == 1).all():
-                self.dy = numpy.ones_like(self.x)
-            else:
+        if setup:
+            self.y = self._cast(_rebinApply(self.yobs, setup))
+        else:
+            self.y = self._cast(rebinArray(self.yobs, self.xobs, self.x))
+        # work around for interpolation issue making some of these non-1
+        if self._dyunit:
+            self.dy = numpy.ones_like(self.x)
+        elif setup:
             # FIXME - This does not follow error propogation rules and it
             # introduces (more) correlation between the data points.
-                self.dy = rebinArray(self.dyobs, self.xobs, self.x)
+            self.dy = self._cast(_rebinApply(self.dyobs, setup))
+        else:
+            self.dy = self._cast(rebinArray(self.dyobs, self.xobs, self.x))
+
+        return
+
+
+    def setDtype(self, dtype):
+        """Set the floating point type of the profile arrays.
+
+        The observed arrays, the calculation points and the calculated
+        profile are converted to dtype.  Use numpy.float32 to halve the
+        memory and bandwidth of large profiles where single precision is
+        sufficient.
+
+        dtype   --  numpy floating point type, e.g., numpy.float32.
+
+        Raises ValueError if dtype is not a real floating point type.
+        """
+        dtype = numpy.dtype(dtype)
+        if dtype.kind != "f":
+            raise ValueError("dtype must be a floating point type.")
+        if dtype == self.dtype:
+            return
+        self.dtype = dtype
+        x = self.x
+        # Parameters keep their values when they are set to equal arrays
+        for par in (self.xpar, self.ypar, self.dypar, self.ycpar):
+            par.setValue(None)
+        if self.xobs is not None:
+            self.setObservedProfile(self.xobs, self.yobs, self.dyobs)
+        if x is not None:
+            self.setCalculationPoints(x)
+        return
+
+
+    def _cast(self, a):
+        """Convert floating point array a to the dtype of the profile.
+
+        Other values are returned unchanged.
+        """
+        if (isinstance(a, numpy.ndarray) and a.dtype.kind == "f" and
+                a.dtype != self.dtype):
+            a = a.astype(self.dtype)
+        return a
+
+
+    def _setObservedPoints(self, indices):
+        """Use the observed profile at indices as the calculation points.
 
+        indices --  slice or boolean mask of the observed points.  The slice
+                    gives views of the observed arrays, so that in-place
+                    changes of x, y or dy apply also to the observed data.
+        """
+        self.x = self.xobs[indices]
+        self.y = self.yobs[indices]
+        self.dy = self.dyobs[indices]
         return
 
     def loadtxt(self, *args, **kw):
@@ -343,12 +439,48 @@ class Profile(Observable, Validatable):
         return
 
 
+    def save(self, fname, format="npy"):
+        """Save the observed profile and metadata to a file.
+
+        Parameters
+        ----------
+        fname : filename or file handle
+            The output file.  The name is used as is, without adding
+            a suffix.
+        format : str, optional
+            The file format.  Only "npy" is supported, which saves
+            xobs, yobs, dyobs and meta in the binary npz container that
+            can be read with `NpzProfileParser`.
+
+        Raises
+        ------
+        SrFitError
+            When the observed profile has not been set.
+        ValueError
+            When the format is not supported.
+
+        See also
+        --------
+        diffpy.srfit.fitbase.npzprofileparser
+        """
+        from diffpy.srfit.fitbase.npzprofileparser import saveProfileData
+        if format != "npy":
+            raise ValueError("Unsupported profile format %r." % (format,))
+        if self.xobs is None:
+            raise SrFitError("The observed profile is not set")
+        saveProfileData(fname, self.xobs, self.yobs, dy=self.dyobs,
+                        meta=self.meta)
+        return
+
+
     def _flush(self, other):
         """Invalidate cached state.
 
         This will force any observer to invalidate its state.
 
         """
+        if other and other[0] is self.xpar:
+            self.xversion += 1
         self.ycalc = None
         self.notify(other)
         return
@@ -389,3 +521,40 @@ def rebinArray(A, xold, xnew):
     if numpy.array_equal(xold, xnew):
         return A
     return numpy.interp(xnew, xold, A)
+
+
+def _rebinSetup(xold, xnew):
+    """Prepare linear interpolation from sorted xold to xnew.
+
+    Return a slice of xold when xnew is its contiguous or evenly strided
+    part, otherwise a tuple of (i, w) arrays such that the interpolated
+    values of A are A[i] + w * (A[i + 1] - A[i]).  Return None if xold has
+    less than 2 points.
+    """
+    n = len(xnew)
+    i0 = xold.searchsorted(xnew[0]) if n else 0
+    if numpy.array_equal(xold[i0:i0 + n], xnew):
+        return slice(i0, i0 + n)
+    # decimated grid, e.g., from the multiresolution module
+    stride = xold.searchsorted(xnew[1]) - i0 if n > 1 else 0
+    if stride > 1:
+        indices = slice(i0, i0 + stride * (n - 1) + 1, stride)
+        if numpy.array_equal(xold[indices], xnew):
+            return indices
+    if len(xold) < 2:
+        return None
+    i = xold.searchsorted(xnew, side='right') - 1
+    i = numpy.clip(i, 0, len(xold) - 2)
+    dx = xold[i + 1] - xold[i]
+    w = numpy.zeros_like(xnew, dtype=float)
+    numpy.divide(xnew - xold[i], dx, out=w, where=(dx != 0))
+    # values outside of xold are constant as in numpy.interp
+    numpy.clip(w, 0, 1, out=w)
+    return (i, w)
+
+
+def _rebinApply(A, setup):
+    """Interpolate array A using the setup from _rebinSetup."""
+    i, w = setup
+    A0 = A[i]
+    return A0 + w * (A[i + 1] - A0)
@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2008 The Trustees of Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE_DANSE.txt for license information.
+#
+##############################################################################
+
+"""On-disk cache of parsed profiles.
+
+ProfileCache stores the banks and metadata parsed by a ProfileParser in
+the binary npz format of the npzprofileparser module, so that the same
+data file is parsed only once by many refinement jobs.  It is used by
+ProfileParser.parseFile(filename, cache=True).  Banks of parsers that parse
+them lazily are added to the cache entry when they are selected.
+
+The cache entries are written to temporary files that are atomically
+renamed, which makes the cache safe to share between processes.  Entries
+are evicted when they have not been used for longer than maxage, or when
+the cache grows over maxsize.
+
+The default cache is in the directory given by the DIFFPY_SRFIT_CACHE
+environment variable or in ~/.cache/diffpy.srfit/profiles.
+"""
+
+__all__ = ["ProfileCache", "profilecache"]
+
+import os
+import json
+import time
+import errno
+import hashlib
+import tempfile
+
+import six
+
+from diffpy.srfit.exceptions import ParseError
+from diffpy.srfit.fitbase.npzprofileparser import NpzProfileParser
+from diffpy.srfit.fitbase.npzprofileparser import saveProfileBanks
+
+
+class ProfileCache(object):
+    """Directory with the parsed data of profile files.
+
+    The entries are keyed on the parser class, its _cacheversion and the
+    version of diffpy.srfit, and on the path, size and modification time
+    of the data file or on its content.
+
+    Attributes
+
+    cachedir    --  Path of the cache directory.  It is created when the
+                    first entry is stored.
+    maxsize     --  Maximum total size of the cache files in bytes
+                    (default 1 GiB).
+    maxage      --  Maximum time in seconds since an entry was last used
+                    (default 30 days).
+    hashcontent --  Flag for keying the entries on the SHA-1 hash of the
+                    file content instead of its path, size and modification
+                    time (default False).
+    """
+
+    suffix = ".npz"
+
+    def __init__(self, cachedir=None, maxsize=2**30, maxage=30*86400,
+                 hashcontent=False):
+        """Initialize the cache.
+
+        cachedir    --  Path of the cache directory.  Use the default
+                        directory when None (default).
+        maxsize     --  Maximum total size of the cache in bytes.
+        maxage      --  Maximum time in seconds since an entry was used.
+        hashcontent --  Key the entries on the file content.
+        """
+        if cachedir is None:
+            cachedir = os.environ.get("DIFFPY_SRFIT_CACHE")
+        if cachedir is None:
+            cachedir = os.path.join(os.path.expanduser("~"), ".cache",
+                                    "diffpy.srfit", "profiles")
+        self.cachedir = cachedir
+        self.maxsize = maxsize
+        self.maxage = maxage
+        self.hashcontent = hashcontent
+        return
+
+
+    def getKey(self, parser, filename):
+        """Get the key of the cache entry for the file.
+
+        parser      --  ProfileParser instance.
+        filename    --  Name of the data file.
+
+        Return a hexadecimal string.
+        Raises OSError if the file does not exist.
+        """
+        from diffpy.srfit.version import __version__
+        cls = type(parser)
+        h = hashlib.sha1()
+        pinfo = (cls.__module__, cls.__name__, parser.getFormat(),
+                 getattr(parser, "_cacheversion", 0), __version__)
+        h.update(repr(pinfo).encode("utf-8"))
+        if self.hashcontent:
+            with open(filename, "rb") as fp:
+                for block in iter(lambda: fp.read(1 << 20), b""):
+                    h.update(block)
+        else:
+            h.update(repr(_fileStamp(filename)).encode("utf-8"))
+        return h.hexdigest()
+
+
+    def load(self, parser, filename):
+        """Load the cached banks and metadata of the file to the parser.
+
+        Only entries that contain all banks of the file are loaded, see
+        store.
+
+        parser      --  ProfileParser instance.  Its _banks and _meta are
+                        replaced when the file is in the cache.
+        filename    --  Name of the data file.
+
+        Return True if the entry was found, False otherwise.
+        """
+        try:
+            path = self._entryPath(self.getKey(parser, filename))
+            banks, meta = _readEntry(path)
+        except (OSError, IOError, ParseError):
+            return False
+        if any(b is None for b in banks):
+            return False
+        # mark the entry as used for the eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        parser._banks = banks
+        parser._meta = meta
+        return True
+
+
+    def store(self, parser, filename, key=None):
+        """Store the parsed banks and metadata of the file.
+
+        Banks that are not parsed yet, i.e., functions in parser._banks,
+        are taken from an existing entry of the file when it has them.
+        Otherwise they are replaced with functions that add the bank to
+        the entry when it is parsed.  Metadata that cannot be saved as JSON
+        are left out of the entry.
+
+        parser      --  ProfileParser that has parsed the file.
+        filename    --  Name of the data file.
+        key         --  Key of the file obtained before it was parsed.  The
+                        entry is not stored if the file has changed since.
+                        Ignored when None (default).
+
+        Return True if the entry was stored, False otherwise.
+        """
+        tmpname = None
+        try:
+            newkey = self.getKey(parser, filename)
+            if key is not None and key != newkey:
+                return False
+            key = newkey
+            path = self._entryPath(key)
+            cached = self._mergeEntry(parser, path)
+            indices = []
+            for i, bank in enumerate(parser._banks):
+                if not callable(bank):
+                    indices.append(i)
+                elif not isinstance(bank, _StoringBank):
+                    parser._banks[i] = _StoringBank(self, parser, filename,
+                                                    key, i, bank)
+            # the entry is stored when there are new parsed banks
+            if cached.issuperset(indices):
+                return bool(indices)
+            banks = [parser._banks[i] for i in indices]
+            meta = _jsonMeta(parser._meta)
+            meta["_cachebanks"] = indices
+            meta["_cachenbanks"] = len(parser._banks)
+            _makedirs(self.cachedir)
+            fd, tmpname = tempfile.mkstemp(suffix=".tmp", dir=self.cachedir)
+            with os.fdopen(fd, "wb") as fp:
+                saveProfileBanks(fp, banks, meta)
+            _replace(tmpname, path)
+            tmpname = None
+        except (OSError, IOError, TypeError, ValueError):
+            return False
+        finally:
+            if tmpname is not None:
+                _remove(tmpname)
+        self.evict()
+        return True
+
+
+    def evict(self):
+        """Remove expired entries and the least recently used entries
+        that exceed maxsize.
+        """
+        now = time.time()
+        entries = []
+        for path in self._listFiles():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            # also remove temporary files left over by killed processes
+            istmp = path.endswith(".tmp")
+            if now - st.st_mtime > (3600 if istmp else self.maxage):
+                _remove(path)
+            elif not istmp:
+                entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        total = sum(e[1] for e in entries)
+        for mtime, size, path in entries:
+            if total <= self.maxsize:
+                break
+            _remove(path)
+            total -= size
+        return
+
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        for path in self._listFiles():
+            _remove(path)
+        return
+
+
+    def _entryPath(self, key):
+        """Get path of the cache file for the key."""
+        return os.path.join(self.cachedir, key + self.suffix)
+
+
+    def _mergeEntry(self, parser, path):
+        """Use banks of the existing entry for the unparsed parser banks.
+
+        Return the set of bank indices in the existing entry.
+        """
+        try:
+            banks = _readEntry(path)[0]
+        except (OSError, IOError, ParseError):
+            return set()
+        if len(banks) != len(parser._banks):
+            return set()
+        for i, bank in enumerate(banks):
+            if bank is not None and callable(parser._banks[i]):
+                parser._banks[i] = bank
+        rv = set(i for i, bank in enumerate(banks) if bank is not None)
+        return rv
+
+
+    def _listFiles(self):
+        """List paths of the entries and temporary files in the cache."""
+        try:
+            names = os.listdir(self.cachedir)
+        except OSError:
+            return []
+        rv = [os.path.join(self.cachedir, n) for n in names
+              if n.endswith(self.suffix) or n.endswith(".tmp")]
+        return rv
+
+# End of class ProfileCache
+
+# The default cache used by ProfileParser.parseFile.
+profilecache = ProfileCache()
+
+# Local helpers --------------------------------------------------------------
+
+class _StoringBank(object):
+    """Bank function that adds the parsed bank to the cache entry."""
+
+    def __init__(self, cache, parser, filename, key, index, loader):
+        self.cache = cache
+        self.parser = parser
+        self.filename = filename
+        self.key = key
+        self.index = index
+        self.loader = loader
+        return
+
+    def __call__(self):
+        bank = self.loader()
+        self.parser._banks[self.index] = bank
+        self.cache.store(self.parser, self.filename, self.key)
+        return bank
+
+# End of class _StoringBank
+
+
+def _readEntry(path):
+    """Read the banks and metadata of a cache entry.
+
+    Return a tuple of (banks, meta), where banks has None for the banks
+    that are not in the entry.
+    Raises IOError if the entry cannot be read.
+    Raises ParseError if the entry is invalid.
+    """
+    npzparser = NpzProfileParser()
+    npzparser.parseFile(path)
+    meta = npzparser.getMetaData()
+    for name in ("filename", "bank", "nbanks"):
+        meta.pop(name, None)
+    stored = npzparser._banks
+    indices = meta.pop("_cachebanks", list(range(len(stored))))
+    nbanks = meta.pop("_cachenbanks", len(stored))
+    banks = nbanks * [None]
+    for i, bank in zip(indices, stored):
+        banks[i] = bank
+    return banks, meta
+
+
+def _jsonMeta(meta):
+    """Get the metadata items that can be saved as JSON."""
+    rv = {}
+    for name, value in meta.items():
+        if name in ("filename", "bank", "nbanks"):
+            continue
+        if not isinstance(name, six.string_types):
+            continue
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            continue
+        rv[name] = value
+    return rv
+
+
+def _fileStamp(filename):
+    """Get (path, size, mtime) tuple that identifies the file version."""
+    st = os.stat(filename)
+    mtime = getattr(st, "st_mtime_ns", st.st_mtime)
+    return (os.path.abspath(filename), st.st_size, mtime)
+
+
+def _makedirs(path):
+    """Create the directory and its parents if they do not exist."""
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
+    return
+
+
+def _replace(src, dst):
+    """Rename src to dst, replacing dst atomically where possible."""
+    if hasattr(os, "replace"):
+        os.replace(src, dst)
+    else:
+        if os.name == "nt" and os.path.exists(dst):
+            _remove(dst)
+        os.rename(src, dst)
+    return
+
+
+def _remove(path):
+    """Remove the file, ignore it if it was removed by another process."""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    return
+
+# End of file
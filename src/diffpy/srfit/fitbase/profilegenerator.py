@@ -65,6 +65,15 @@ class ProfileGenerator(Operator, ParameterSet):
     eq              --  The Equation object used to wrap this ProfileGenerator.
                         This is set when the ProfileGenerator is added to a
                         FitContribution.
+    pointwise       --  Flag for a pointwise-separable profile, where the
+                        value at each point depends only on that point of
+                        profile.x (class attribute, default False).  Such a
+                        generator can be evaluated over chunks of the
+                        profile, see FitContribution.setChunkSize.
+    _memo           --  LRUCache shared by the generators of a FitRecipe
+                        while it calculates the residual, otherwise None.
+                        Generators can store their results there so that
+                        identical generators evaluate only once.
     _calculators    --  A managed dictionary of Calculators, indexed by name.
     _constraints    --  A set of constrained Parameters. Constraints can be
                         added using the 'constrain' methods.
@@ -95,6 +104,9 @@ class ProfileGenerator(Operator, ParameterSet):
     nin = 0
     nout = 1
 
+    # Overload as True for pointwise-separable profiles.
+    pointwise = False
+
 
     def __init__(self, name):
         """Initialize the attributes."""
@@ -102,6 +114,7 @@ class ProfileGenerator(Operator, ParameterSet):
         ParameterSet.__init__(self, name)
         self.profile = None
         self.meta = {}
+        self._memo = None
         return
 
 
@@ -126,10 +139,11 @@ class ProfileGenerator(Operator, ParameterSet):
     def operation(self):
         """Evaluate the profile.
 
-        Return the result of __call__(profile.x).
+        Return the result of __call__(profile.x) converted to the dtype of
+        the profile.
         """
         y = self.__call__(self.profile.x)
-        return y
+        return self.profile._cast(y)
 
 
     def setProfile(self, profile):
@@ -22,6 +22,10 @@ format must be encapsulated in a ProfileParser subclass.
 See the class documentation for more information.
 """
 
+import io
+import mmap
+
+import six
 
 from diffpy.srfit.exceptions import ParseError
 
@@ -46,6 +50,9 @@ class ProfileParser(object):
                     dy      --  A numpy array containing the uncertainty read
                                 from the file. This is None if the uncertainty
                                 cannot be read.
+                    A bank can also be a function without arguments that
+                    parses and returns the bank tuple.  The function is
+                    called when the bank is selected for the first time.
     _x          --  Indpendent variable from the chosen bank
     _y          --  Profile from the chosen bank
     _dx         --  Uncertainty in independent variable from the chosen bank
@@ -62,6 +69,9 @@ class ProfileParser(object):
     """
 
     _format = ""
+    # Version of the parsed data for ProfileCache.  It must be incremented
+    # when the parser changes the data read from the same file.
+    _cacheversion = 1
 
     def __init__(self):
         """Initialize the attributes."""
@@ -93,24 +103,58 @@ class ProfileParser(object):
         """
         raise NotImplementedError()
 
-    def parseFile(self, filename):
+    def parseFile(self, filename, cache=False):
         """Parse a file and set the _x, _y, _dx, _dy and _meta variables.
 
         This wipes out the currently loaded data and selected bank number.
+        Parsers that overload _parseBuffer get the memory-mapped file.  They
+        can defer parsing of the banks to functions in _banks, bank 0 is
+        then parsed when it is selected at the end of parseFile and the
+        other banks when they are selected later.  Other parsers get the
+        file content as a string in parseString.
 
         Arguments
         filename    --  The name of the file to parse
+        cache       --  Use the parsed data stored in the on-disk cache and
+                        store them there after parsing.  This can be True
+                        for the default cache or a ProfileCache instance
+                        (see diffpy.srfit.fitbase.profilecache).  The cache
+                        is not used when False (default).
 
         Raises IOError if the file cannot be read
         Raises ParseError if the file cannot be parsed
 
         """
-        infile = open(filename, 'r')
+        if cache is True:
+            from diffpy.srfit.fitbase.profilecache import profilecache
+            cache = profilecache
+        key = None
+        if cache:
+            if cache.load(self, filename):
+                self._meta["filename"] = filename
+                self.selectBank(0)
+                return
+            try:
+                key = cache.getKey(self, filename)
+            except OSError:
+                pass
         self._banks = []
         self._meta = {}
-        filestring = infile.read()
-        self.parseString(filestring)
-        infile.close()
+        if _parsesBuffer(self):
+            with open(filename, 'rb') as infile:
+                try:
+                    buf = mmap.mmap(infile.fileno(), 0,
+                                    access=mmap.ACCESS_READ)
+                except ValueError:
+                    # empty files cannot be mapped
+                    buf = b""
+            self._parseBuffer(buf)
+        else:
+            with io.open(filename, 'r', encoding='utf-8',
+                         errors='replace') as infile:
+                self.parseString(infile.read())
+        if key is not None and self._banks:
+            cache.store(self, filename, key)
         self._meta["filename"] = filename
 
         if len(self._banks) < 1:
@@ -119,6 +163,23 @@ class ProfileParser(object):
         self.selectBank(0)
         return
 
+    def _parseBuffer(self, buf):
+        """Parse the content of a file for parseFile.
+
+        Subclasses can overload this to scan only the header and bank
+        boundaries in the buffer and to add functions that parse the banks
+        to _banks (see the class documentation).  parseFile uses parseString
+        for parsers that do not overload this method.
+
+        Arguments
+        buf         --  Read-only buffer, normally a memory map, with the
+                        content of the file.
+
+        Raises ParseError if the buffer cannot be parsed
+
+        """
+        raise NotImplementedError()
+
     def getNumBanks(self):
         """Get the number of banks read by the parser."""
         return len(self._banks)
@@ -152,7 +213,11 @@ class ProfileParser(object):
 
         self._meta["bank"] = index
         self._meta["nbanks"] = numbanks
-        self._x, self._y, self._dx, self._dy = self._banks[index]
+        bank = self._banks[index]
+        # banks that are not loaded yet are functions that parse them
+        if callable(bank):
+            bank = self._banks[index] = bank()
+        self._x, self._y, self._dx, self._dy = bank
         return
 
     def getData(self, index = None):
@@ -180,3 +245,21 @@ class ProfileParser(object):
         return self._meta
 
 # End of ProfileParser
+
+# Local helpers --------------------------------------------------------------
+
+def _decodeText(data):
+    """Convert bytes read from a file to a string with universal newlines.
+
+    Bytes that are not valid UTF-8 are replaced with the U+FFFD character.
+    """
+    rv = data.decode("utf-8", "replace")
+    rv = rv.replace("\r\n", "\n").replace("\r", "\n")
+    return rv
+
+
+def _parsesBuffer(parser):
+    """Check if the parser class overloads ProfileParser._parseBuffer.
+    """
+    f = six.get_unbound_function(type(parser)._parseBuffer)
+    return f is not six.get_unbound_function(ProfileParser._parseBuffer)
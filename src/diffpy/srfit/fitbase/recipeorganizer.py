@@ -84,6 +84,10 @@ class RecipeContainer(Observable, Configurable, Validatable):
     names = property(lambda self: self.getNames())
     values = property(lambda self: self.getValues())
 
+    # Counter of objects added to or removed from any RecipeContainer.
+    # This tells if the layout of a recipe hierarchy may have changed.
+    _confgeneration = 0
+
     def __init__(self, name):
         Observable.__init__(self)
         Configurable.__init__(self)
@@ -275,6 +279,7 @@ class RecipeContainer(Observable, Configurable, Validatable):
 
         # Store this as a configurable object
         self._storeConfigurable(obj)
+        RecipeContainer._confgeneration += 1
         return
 
     def _removeObject(self, obj, d):
@@ -288,6 +293,7 @@ class RecipeContainer(Observable, Configurable, Validatable):
 
         del d[obj.name]
         obj.removeObserver(self._flush)
+        RecipeContainer._confgeneration += 1
 
         return
 
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2008 The Trustees of Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE_DANSE.txt for license information.
+#
+##############################################################################
+
+"""Default refinement function for the recipe runners.
+
+The refinement function takes a FitRecipe, refines its variables in place
+and returns the number of residual evaluations.  It is used by default in
+StreamingRunner and MultiResolutionRefinement.
+"""
+
+__all__ = ["leastsqRefine"]
+
+
+def leastsqRefine(recipe):
+    """Refine the recipe with scipy.optimize.leastsq.
+
+    The numeric derivatives use steps suitable for the precision of the
+    residual, see FitRecipe.getResidualEpsilon.
+
+    Return the number of residual evaluations.
+    """
+    from scipy.optimize import leastsq
+    rv = leastsq(recipe.residual, recipe.values, full_output=True,
+                 epsfcn=recipe.getResidualEpsilon())
+    return rv[2]["nfev"]
+
+# End of file
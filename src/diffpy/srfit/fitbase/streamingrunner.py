@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2008 The Trustees of Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE_DANSE.txt for license information.
+#
+##############################################################################
+
+"""Streaming refinement of a recipe on a series of data files.
+
+StreamingRunner refines the same FitRecipe on each new data file from a
+source of file names, such as a watched directory or a queue.  Each frame
+is started from the results of the last refined frame.  The results are
+kept in the runner and appended to a results store, e.g., a ResultsTable
+file.
+
+Example:
+
+    runner = StreamingRunner(recipe, PDFParser, store="results.dat")
+    runner.run(watchDirectory("/data/run42", "*.gr", timeout=600))
+
+File names can be also read from a local queue with a None sentinel
+
+    runner.run(iter(queue.get, None))
+"""
+
+__all__ = ["StreamingRunner", "ResultsTable", "watchDirectory",
+           "leastsqRefine"]
+
+import os
+import time
+import fnmatch
+from collections import OrderedDict, deque
+
+import six
+
+from diffpy.srfit.exceptions import ParseError
+from diffpy.srfit.fitbase.fitresults import FitResults, initializeRecipe
+from diffpy.srfit.fitbase.profileparser import ProfileParser
+from diffpy.srfit.fitbase.refinement import leastsqRefine
+
+
+class StreamingRunner(object):
+    """Refine a recipe on each data file from a stream of file names.
+
+    The frames are refined in the order of the source.  When nworkers is
+    positive the refinements run in a pool of worker processes, each with
+    its own copy of the recipe.  A frame is then started from the results
+    of the last completed frame, which may be a few frames behind.  At most
+    nworkers frames are refined at once, so that the runner does not build
+    up a backlog and the delay of the results stays bounded.
+
+    Attributes
+
+    recipe      --  The FitRecipe to refine.
+    parser      --  The ProfileParser used to read the data files.
+    contribution -- Name of the FitContribution whose profile is set to the
+                    parsed data.
+    refine      --  Function that refines the recipe passed as its argument.
+    store       --  Function called with the record of each refined frame or
+                    None.
+    nworkers    --  Number of worker processes.  The frames are refined in
+                    this process when 0.
+    warmstart   --  Flag for starting each frame from the results of the
+                    last refined frame (default True).
+    results     --  List of the records of the refined frames.  A record is
+                    a dictionary with the keys
+                    filename    --  name of the data file
+                    values      --  OrderedDict of the refined variables
+                    chi2, rchi2, rw --  the fit metrics
+                    results     --  the FitResults output, which can be
+                                    used with initializeRecipe
+                    elapsed     --  time of the refinement in seconds
+                    latency     --  time from receiving the file name to
+                                    the record in seconds
+                    error       --  message of a failed refinement, the
+                                    other results are then missing.
+    """
+
+    def __init__(self, recipe, parser, contribution=None, refine=None,
+                 store=None, nworkers=0, warmstart=True):
+        """Create the runner.
+
+        recipe      --  A configured FitRecipe with variables.
+        parser      --  ProfileParser class or instance for the data files.
+        contribution -- Name of the FitContribution that receives the data.
+                        This can be None (default) if the recipe has only
+                        one contribution.
+        refine      --  Function that refines the recipe passed as its
+                        argument.  Use scipy.optimize.leastsq when None
+                        (default).  This must be picklable when nworkers
+                        is positive.
+        store       --  Function called with the record of each refined
+                        frame or the name of a ResultsTable file.  Do not
+                        store the records when None (default).
+        nworkers    --  Number of worker processes (default 0).
+        warmstart   --  Start frames from the previous results (default
+                        True).
+
+        Raises TypeError if parser is not a ProfileParser.
+        Raises ValueError if the contribution cannot be found.
+        """
+        self.recipe = recipe
+        if isinstance(parser, type):
+            parser = parser()
+        if not isinstance(parser, ProfileParser):
+            raise TypeError("parser must be a ProfileParser.")
+        self.parser = parser
+        if contribution is None:
+            cnames = list(recipe._contributions.keys())
+            if len(cnames) != 1:
+                emsg = "contribution must be specified for %i contributions."
+                raise ValueError(emsg % len(cnames))
+            contribution = cnames[0]
+        if contribution not in recipe._contributions:
+            raise ValueError("Unknown contribution %r." % (contribution,))
+        self.contribution = contribution
+        self.refine = leastsqRefine if refine is None else refine
+        if isinstance(store, six.string_types):
+            store = ResultsTable(store)
+        self.store = store
+        self.nworkers = nworkers
+        self.warmstart = warmstart
+        self.results = []
+        self._lastresults = None
+        return
+
+
+    def run(self, source):
+        """Refine the recipe on each file from the source.
+
+        source  --  Iterable of the data file names, e.g., watchDirectory
+                    or iter(queue.get, None) for a queue.Queue.  The runner
+                    stops when the source is exhausted.
+
+        Return the list of records of the refined frames.
+        """
+        if self.nworkers < 1:
+            for filename in source:
+                self._addRecord(self.refineFile(filename))
+            return self.results
+        import multiprocessing
+        state = (self.recipe, self.parser, self.contribution, self.refine)
+        pool = multiprocessing.Pool(self.nworkers, initializer=_initWorker,
+                                    initargs=(state,))
+        pending = deque()
+        try:
+            for filename in source:
+                args = (filename, self._getWarmStart(), time.time())
+                pending.append(pool.apply_async(_refineInWorker, args))
+                # wait for a free worker, collect all finished frames
+                while pending and (len(pending) >= self.nworkers or
+                                   pending[0].ready()):
+                    self._addRecord(pending.popleft().get())
+            while pending:
+                self._addRecord(pending.popleft().get())
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        return self.results
+
+
+    def refineFile(self, filename):
+        """Refine the recipe on one data file in this process.
+
+        filename    --  Name of the data file.
+
+        Return the record of the refined frame, see the results attribute.
+        """
+        state = (self.recipe, self.parser, self.contribution, self.refine)
+        return _refineFrame(state, filename, self._getWarmStart(),
+                            time.time())
+
+
+    def _getWarmStart(self):
+        """Get the results that start the next frame or None."""
+        return self._lastresults if self.warmstart else None
+
+
+    def _addRecord(self, record):
+        """Keep and store the record of a refined frame."""
+        self.results.append(record)
+        if "error" in record:
+            return
+        self._lastresults = record["results"]
+        if self.store is not None:
+            self.store(record)
+        return
+
+# End of class StreamingRunner
+
+
+class ResultsTable(object):
+    """Results store that appends the refined values to a text file.
+
+    Each frame is written as one line with the data file name, the rchi2,
+    rw and the variable values.  The header line with the column names is
+    written for a new file.  The table can be loaded with numpy.loadtxt
+    using usecols to skip the file name column.
+
+    Attributes
+
+    filename    --  Name of the results file.
+    """
+
+    def __init__(self, filename):
+        """Create the store for the results file."""
+        self.filename = filename
+        return
+
+
+    def __call__(self, record):
+        """Append the record of a refined frame to the file."""
+        names = ["filename", "rchi2", "rw"] + list(record["values"])
+        values = [record["rchi2"], record["rw"]]
+        values += list(record["values"].values())
+        row = [record["filename"]] + [repr(float(v)) for v in values]
+        newfile = (not os.path.exists(self.filename) or
+                   os.path.getsize(self.filename) == 0)
+        with open(self.filename, "a") as fp:
+            if newfile:
+                fp.write("# " + " ".join(names) + "\n")
+            fp.write(" ".join(row) + "\n")
+        return
+
+# End of class ResultsTable
+
+
+def watchDirectory(path, pattern="*", poll=1.0, timeout=None, existing=False):
+    """Generate names of the new files in a directory.
+
+    A file is reported once its size and modification time are the same
+    in two consecutive polls, so that files that are still being written
+    are not used.  The new files are reported in the order of their
+    modification times.
+
+    path        --  Path of the watched directory.
+    pattern     --  Shell pattern of the reported file names (default "*").
+    poll        --  Time in seconds between the checks of the directory.
+    timeout     --  Stop after this time in seconds without a new file.
+                    Watch forever when None (default).
+    existing    --  Report also the files that are in the directory when
+                    it starts to be watched (default False).
+
+    Yield the paths of the new files.
+    """
+    reported = set()
+    if not existing:
+        reported.update(_listStamps(path, pattern))
+    laststamps = {}
+    tlast = time.time()
+    while True:
+        stamps = _listStamps(path, pattern)
+        ready = sorted((stamps[f][1], f) for f in stamps
+                       if f not in reported and stamps[f] == laststamps.get(f))
+        for mtime, f in ready:
+            reported.add(f)
+            yield os.path.join(path, f)
+        if ready:
+            tlast = time.time()
+        elif timeout is not None and time.time() - tlast > timeout:
+            return
+        laststamps = stamps
+        time.sleep(poll)
+
+# Local helpers --------------------------------------------------------------
+
+def _listStamps(path, pattern):
+    """Get dictionary of (size, mtime) of the matching files in path."""
+    rv = {}
+    for f in fnmatch.filter(os.listdir(path), pattern):
+        try:
+            st = os.stat(os.path.join(path, f))
+        except OSError:
+            continue
+        rv[f] = (st.st_size, st.st_mtime)
+    return rv
+
+
+def _refineFrame(state, filename, warmstart, treceived):
+    """Parse the data file and refine the recipe.
+
+    state       --  tuple of (recipe, parser, contribution, refine).
+    filename    --  Name of the data file.
+    warmstart   --  FitResults output to initialize the recipe or None.
+    treceived   --  Time when the file name was received.
+
+    Return the record of the refined frame.
+    """
+    recipe, parser, cname, refine = state
+    record = OrderedDict(filename=filename)
+    t0 = time.time()
+    try:
+        parser.parseFile(filename)
+        recipe._contributions[cname].profile.loadParsedData(parser)
+        if warmstart is not None:
+            initializeRecipe(recipe, warmstart)
+        refine(recipe)
+        res = FitResults(recipe)
+    except (IOError, OSError, ParseError, ValueError) as e:
+        record["error"] = "%s: %s" % (type(e).__name__, e)
+        return record
+    t1 = time.time()
+    record["values"] = OrderedDict(zip(res.varnames, res.varvals))
+    record["chi2"] = res.chi2
+    record["rchi2"] = res.rchi2
+    record["rw"] = res.rw
+    record["results"] = res.formatResults()
+    record["elapsed"] = t1 - t0
+    record["latency"] = t1 - treceived
+    return record
+
+
+# Recipe, parser, contribution name and refine function in a worker process.
+_workerstate = None
+
+def _initWorker(state):
+    """Set up the state of a worker process."""
+    global _workerstate
+    _workerstate = state
+    return
+
+
+def _refineInWorker(filename, warmstart, treceived):
+    """Refine one frame in a worker process."""
+    return _refineFrame(_workerstate, filename, warmstart, treceived)
+
+# End of file
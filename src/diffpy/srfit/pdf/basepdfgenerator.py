@@ -46,7 +46,27 @@ class BasePDFGenerator(ProfileGenerator):
     stru    --  The structure objected adapted by _phase.
     _lastr  --  The last value of r over which the PDF was calculated. This is
                 used to configure the calculator when r changes.
-    _pool   --  A multiprocessing.Pool for managing parallel computation.
+    _lastxkey -- Tuple of (profile, xversion) when _lastr is the x array of
+                the profile or None.  This replaces comparison of r with
+                _lastr while the profile x is not changed.
+    _interp --  Tuple of (n, indices, weights) for linear interpolation
+                from the calculator grid of n points to _lastr, where
+                indices is None if the grids are the same.  None when not
+                yet set up.
+    _pool   --  The shared CalculatorPool for parallel computation or None.
+    _ncpu   --  Number of parts of the parallel computation in _pool.
+    _poolkey -- Key of this generator in the _pool or None.
+    _poolblob -- Tuple of (version, blob, layout) with the pickled calculator
+                and structure sent to the _pool workers or None when it
+                needs to be created.  See CalculatorPool.evaluate.  False
+                when the structure cannot be pickled and the PDF is
+                calculated in this process.
+    _barepdf -- Tuple of (rcalc, PDF calculated with unit scale and zero
+                qdamp) from the last calculation or None if that cannot be
+                reused.  This is reset when any other Parameter, the
+                structure or the calculator configuration changes.
+    _fullrange -- Tuple of (rmin, rmax, rstep) of the fixed calculation
+                grid or None.  See setFullRange.
 
     Managed Parameters:
     scale   --  Scale factor
@@ -82,14 +102,24 @@ class BasePDFGenerator(ProfileGenerator):
         self.stru = None
         self.meta = {}
         self._lastr = numpy.empty(0)
+        self._lastxkey = None
+        self._interp = None
         self._calc = None
+        self._barepdf = None
+        self._fullrange = None
 
         self._pool = None
+        self._ncpu = 1
+        self._poolkey = None
+        self._poolblob = None
 
         return
 
     _parnames = ['delta1', 'delta2', 'qbroad', 'scale', 'qdamp']
 
+    # Parameters applied as r-space envelopes of the calculated PDF.
+    _envelopenames = ('scale', 'qdamp')
+
     def _setCalculator(self, calc):
         """Set the SrReal calulator instance.
 
@@ -98,6 +128,7 @@ class BasePDFGenerator(ProfileGenerator):
 
         """
         self._calc = calc
+        self._resetCalculation()
         for pname in self.__class__._parnames:
             self.addParameter(
                 ParameterAdapter(pname, self._calc, attr = pname)
@@ -110,7 +141,9 @@ class BasePDFGenerator(ProfileGenerator):
 
         ncpu    -- Number of parallel processes.  Revert to serial mode when 1.
         mapfunc -- A mapping function to use. If this is None (default),
-                   multiprocessing.Pool.imap_unordered will be used.
+                   the calculation is split into ncpu parts, which are
+                   evaluated by the worker processes shared by all PDF
+                   generators.  See calculatorpool.getCalculatorPool.
 
         No return value.
         """
@@ -118,21 +151,91 @@ class BasePDFGenerator(ProfileGenerator):
         calc_serial = self._calc
         if hasattr(calc_serial, 'pqobj'):
             calc_serial = calc_serial.pqobj
+        self._calc = calc_serial
+        self._releasePool()
+        self._resetCalculation()
         # revert to serial calculator for ncpu <= 1
         if ncpu <= 1:
-            self._calc = calc_serial
-            self._pool = None
             return
         # Why don't we let the user shoot his foot or test on single CPU?
         # ncpu = min(ncpu, multiprocessing.cpu_count())
         if mapfunc is None:
-            import multiprocessing
-            self._pool = multiprocessing.Pool(ncpu)
-            mapfunc = self._pool.imap_unordered
+            from diffpy.srfit.pdf.calculatorpool import getCalculatorPool
+            self._pool = getCalculatorPool()
+            self._ncpu = ncpu
+            return
 
         self._calc = createParallelCalculator(calc_serial, ncpu, mapfunc)
         return
 
+    def _releasePool(self):
+        """Stop using the shared CalculatorPool."""
+        if self._pool is not None and self._poolkey is not None:
+            self._pool.unregister(self._poolkey)
+        self._pool = None
+        self._ncpu = 1
+        self._poolkey = None
+        self._poolblob = None
+        return
+
+    def _resetCalculation(self):
+        """Reset cached results after a change of calculator configuration.
+        """
+        self._barepdf = None
+        self._poolblob = None
+        return
+
+    def _getPoolLayout(self):
+        """Get the ParameterAdapters that are applied in the pool workers.
+        """
+        from diffpy.srfit.fitbase.parameter import ParameterProxy
+        rv = []
+        seen = set()
+        for par in self.iterPars():
+            while isinstance(par, ParameterProxy):
+                par = par.par
+            if id(par) in seen or not isinstance(par, ParameterAdapter):
+                continue
+            seen.add(id(par))
+            rv.append(par)
+        return rv
+
+    def _evaluateInPool(self, stru):
+        """Calculate the PDF in the shared CalculatorPool.
+
+        stru    --  The SrReal-compatible structure from the phase.
+
+        Return a tuple of (rcalc, y) arrays.  The PDF is calculated in this
+        process if the structure cannot be pickled.
+        """
+        import pickle
+        pool = self._pool
+        if self._poolkey is None:
+            self._poolkey = pool.register(self)
+        layout = self._getPoolLayout()
+        values = [par.getValue() for par in layout]
+        pb = self._poolblob
+        sendblob = (pb is None or
+                    list(map(id, pb[2])) != list(map(id, layout)))
+        if sendblob:
+            try:
+                adapters = [(par.obj, par.setter) for par in layout]
+                blob = pickle.dumps((self._calc, self.stru,
+                    self._phase.usingSymmetry(), adapters))
+            except Exception:
+                # Structure cannot be pickled, e.g., a pyobjcryst Crystal.
+                # Do not try again until the calculation is reset.
+                self._poolblob = False
+                return self._calc(stru)
+            pb = self._poolblob = (pool.newVersion(), blob, layout)
+        results = pool.evaluate(self._poolkey, pb[0], pb[1], values,
+                                self._ncpu, sendblob)
+        calc = self._calc
+        calc.setStructure(stru)
+        for pdata in results:
+            calc._mergeParallelData(pdata, self._ncpu)
+        return calc.rgrid, calc.pdf
+
     def processMetaData(self):
         """Process the metadata once it gets set."""
         ProfileGenerator.processMetaData(self)
@@ -167,6 +270,7 @@ class BasePDFGenerator(ProfileGenerator):
         Raises ValueError for unknown scattering type.
         """
         self._calc.setScatteringFactorTableByType(stype)
+        self._resetCalculation()
         # update the meta dictionary only if there was no exception
         self.meta["stype"] = self.getScatteringType()
         return
@@ -178,6 +282,7 @@ class BasePDFGenerator(ProfileGenerator):
     def setQmax(self, qmax):
         """Set the qmax value."""
         self._calc.qmax = qmax
+        self._resetCalculation()
         self.meta["qmax"] = self.getQmax()
         return
 
@@ -189,6 +294,7 @@ class BasePDFGenerator(ProfileGenerator):
         """Set the qmin value.
         """
         self._calc.qmin = qmin
+        self._resetCalculation()
         self.meta["qmin"] = self.getQmin()
         return
 
@@ -196,6 +302,49 @@ class BasePDFGenerator(ProfileGenerator):
         """Get the qmin value."""
         return self._calc.qmin
 
+    def setFullRange(self, rmin = None, rmax = None, rstep = None):
+        """Set a fixed calculation grid for fits of r-windows.
+
+        The PDF is calculated over the full range and the r-grids within
+        this range are sliced or interpolated from it.  The calculated PDF
+        is thus kept when the fitted window changes, for example in a
+        box-car refinement that slides a window over the data.  r-grids
+        outside of the full range are calculated as usual.
+
+        rmin    --  Lower bound of the full range.
+        rmax    --  Upper bound of the full range, inclusive.
+        rstep   --  Spacing of the full grid.  Use the same spacing as the
+                    data so that the windows are slices of the full grid.
+
+        Call without arguments to restore calculation over the requested
+        r-grids.
+
+        Raises ValueError if only some arguments are given, if rstep is not
+        positive or if rmax is smaller than rmin.
+        """
+        args = (rmin, rmax, rstep)
+        if all(a is None for a in args):
+            self._fullrange = None
+        elif any(a is None for a in args):
+            raise ValueError("rmin, rmax and rstep must be all specified.")
+        elif not rstep > 0:
+            raise ValueError("rstep must be positive.")
+        elif rmax < rmin:
+            raise ValueError("rmax must not be smaller than rmin.")
+        else:
+            self._fullrange = (float(rmin), float(rmax), float(rstep))
+        # prepare the calculator again upon the next evaluation
+        self._lastr = numpy.empty(0)
+        self._lastxkey = None
+        return
+
+    def getFullRange(self):
+        """Get the (rmin, rmax, rstep) of the fixed calculation grid.
+
+        Return None when the PDF is calculated over the requested r-grids.
+        """
+        return self._fullrange
+
     def setStructure(self, stru, name = "phase", periodic = True):
         """Set the structure that will be used to calculate the PDF.
 
@@ -243,6 +392,7 @@ class BasePDFGenerator(ProfileGenerator):
         # Store the ParameterSet for easy access
         self._phase = parset
         self.stru = self._phase.stru
+        self._resetCalculation()
 
         # Put this ParameterSet in the ProfileGenerator.
         self.addParameterSet(parset)
@@ -251,16 +401,143 @@ class BasePDFGenerator(ProfileGenerator):
         self._phase.useSymmetry(periodic)
         return
 
+    def __getstate__(self):
+        """Return state without the registration in the CalculatorPool."""
+        state = ProfileGenerator.__getstate__(self)
+        state['_poolkey'] = None
+        state['_poolblob'] = None
+        return state
+
+    def _getCalculatorStructure(self):
+        """Get the structure object for the calculator."""
+        return self._phase._getSrRealStructure()
+
     def _prepare(self, r):
         """Prepare the calculator when a new r-value is passed."""
         self._lastr = r.copy()
+        prof = self.profile
+        self._lastxkey = None
+        if prof is not None and r is prof.x:
+            self._lastxkey = (prof, prof.xversion)
+        self._interp = None
         lo, hi = r.min(), r.max()
         ndiv = max(len(r) - 1, 1)
-        self._calc.rstep = (hi - lo) / ndiv
-        self._calc.rmin = lo
-        self._calc.rmax = hi + 0.5*self._calc.rstep
+        rstep = (hi - lo) / ndiv
+        fr = self._fullrange
+        if fr is not None:
+            eps = 1e-8 * fr[2]
+            if fr[0] - eps <= lo and hi <= fr[1] + eps:
+                lo, hi, rstep = fr
+        rmax = hi + 0.5*rstep
+        calc = self._calc
+        if (calc.rmin, calc.rmax, calc.rstep) != (lo, rmax, rstep):
+            calc.rstep = rstep
+            calc.rmin = lo
+            calc.rmax = rmax
+            self._resetCalculation()
+        return
+
+    def _flush(self, other):
+        """Invalidate cached state.
+
+        This is overloaded to keep the last calculated PDF when the change
+        comes only from the scale or qdamp Parameters, which are applied as
+        envelopes on the calculated PDF.
+        """
+        src = other[0] if other else None
+        name = getattr(src, 'name', None)
+        # Changes of the profile r-grid are handled in _prepare.
+        envchange = (name in self._envelopenames and src is self.get(name))
+        if not envchange and src is not self.profile:
+            self._barepdf = None
+        ProfileGenerator._flush(self, other)
         return
 
+    def _isPrepared(self, r):
+        """Check if the calculator is configured for the r-grid.
+        """
+        key = self._lastxkey
+        if key is not None and key[0] is self.profile:
+            prof = key[0]
+            if r is prof.x and key[1] == prof.xversion:
+                return True
+        return numpy.array_equal(r, self._lastr)
+
+    def _interpolate(self, rcalc, y):
+        """Interpolate y from the calculator grid rcalc to _lastr.
+
+        The interpolation indices and weights are evaluated once for the
+        prepared r-grid.  Return y itself when the grids are the same.
+        """
+        r = self._lastr
+        n = len(rcalc)
+        if self._interp is None or self._interp[0] != n:
+            self._interp = _interpolationSetup(r, rcalc)
+        idx, w = self._interp[1:]
+        if idx is None:
+            return y
+        if isinstance(idx, slice):
+            return y[idx]
+        if w is None:
+            return numpy.interp(r, rcalc, y)
+        rv = y[idx] * (1 - w)
+        rv += y[idx + 1] * w
+        return rv
+
+    def _getMemoKey(self):
+        """Get key of the calculation in the memo shared by generators.
+
+        Generators have the same key when they use the same phase object
+        and the same calculator configuration, which includes its r-grid,
+        the peak width model, the scattering factor table and the pair
+        masks.
+        """
+        calc = getattr(self._calc, 'pqobj', self._calc)
+        cfg = tuple((n, calc._getDoubleAttr(n))
+                    for n in sorted(calc._namesOfDoubleAttributes()))
+        rv = (type(calc), self.getScatteringType(), cfg,
+              tuple(getattr(calc, 'usedenvelopetypes', ())),
+              getattr(calc, 'peakprofiletype', None),
+              _peakWidthKey(calc), _scatteringFactorKey(calc),
+              _pairMaskKey(calc, self._getCalculatorStructure()),
+              id(self._phase), self._phase.usingSymmetry())
+        return rv
+
+    def _hasEnvelopes(self):
+        """Check if the calculator applies the scale and qdamp envelopes.
+        """
+        calc = getattr(self._calc, 'pqobj', self._calc)
+        used = getattr(calc, 'usedenvelopetypes', ())
+        return 'scale' in used and 'qresolution' in used
+
+    def _getEnvelope(self, rcalc):
+        """Evaluate the scale and qdamp envelopes at the rcalc points.
+
+        Return an array of the envelope values.
+        """
+        scale = self.scale.getValue()
+        qdamp = self.qdamp.getValue()
+        env = scale * numpy.ones_like(rcalc)
+        if qdamp > 0:
+            env *= numpy.exp(-0.5 * (qdamp * rcalc)**2)
+        return env
+
+    def _calculateBare(self):
+        """Calculate the PDF with unit scale and zero qdamp.
+
+        Return a tuple of (rcalc, y) arrays.
+        """
+        calc = self._calc
+        scale, qdamp = calc.scale, calc.qdamp
+        calc.scale = 1.0
+        calc.qdamp = 0.0
+        try:
+            rv = self._calculate()
+        finally:
+            calc.scale = scale
+            calc.qdamp = qdamp
+        return rv
+
     def _validate(self):
         """Validate my state.
 
@@ -286,16 +563,144 @@ class BasePDFGenerator(ProfileGenerator):
         created in setCrystal. Thus, we need only call pdf with the internal
         structure object.
 
+        The PDF is calculated with unit scale and zero qdamp and these
+        envelopes are applied afterwards.  Only when the scale or qdamp
+        Parameters changed since the last call, the previous result is
+        reused without recalculating the pair sums.  Changes of any other
+        Parameter, including the peak widths delta1, delta2 and qbroad,
+        require a full calculation.  In a FitRecipe residual calculation
+        generators with the same phase and calculator configuration share
+        one evaluation.  With setFullRange the generators share it also
+        when they fit different r-windows.
+
         """
-        if not numpy.array_equal(r, self._lastr):
+        if not self._isPrepared(r):
             self._prepare(r)
 
-        rcalc, y = self._calc(self._phase._getSrRealStructure())
+        if self._hasEnvelopes():
+            # Only the envelopes changed, reuse the last calculated PDF.
+            if self._barepdf is None:
+                rcalc, ybare = self._calculateBare()
+                if not numpy.isnan(ybare).any():
+                    self._barepdf = (rcalc, ybare)
+            else:
+                rcalc, ybare = self._barepdf
+            y = ybare * self._getEnvelope(rcalc)
+        else:
+            rcalc, y = self._calculate()
 
         if numpy.isnan(y).any():
             y = numpy.zeros_like(r)
         else:
-            y = numpy.interp(r, rcalc, y)
+            y = self._interpolate(rcalc, y)
         return y
 
+    def _calculate(self):
+        """Calculate the PDF of the phase over the calculator grid.
+
+        The result is shared through the _memo of the generators.
+
+        Return a tuple of (rcalc, y) arrays.
+        """
+        memo = self._memo
+        if memo is not None:
+            key = self._getMemoKey()
+            rv = memo.get(key)
+            if rv is not None:
+                return rv[0], rv[1].copy()
+        stru = self._getCalculatorStructure()
+        if self._pool is not None and self._poolblob is not False:
+            rcalc, y = self._evaluateInPool(stru)
+        else:
+            rcalc, y = self._calc(stru)
+        if memo is not None:
+            memo.put(key, (rcalc, y.copy()))
+        return rcalc, y
+
 # End class BasePDFGenerator
+
+# Local helpers --------------------------------------------------------------
+
+def _peakWidthKey(calc):
+    """Return hashable settings of the peak width model of calc or None.
+    """
+    pwm = getattr(calc, 'peakwidthmodel', None)
+    if pwm is None:
+        return None
+    cfg = tuple((n, pwm._getDoubleAttr(n))
+                for n in sorted(pwm._namesOfDoubleAttributes()))
+    return (pwm.type(), cfg)
+
+
+def _scatteringFactorKey(calc):
+    """Return hashable settings of the scattering factor table or None.
+
+    The key contains the table type and its custom values.  Tables that do
+    not report custom values are identified by the object itself.
+    """
+    sftable = getattr(calc, 'scatteringfactortable', None)
+    if sftable is None and hasattr(calc, 'getScatteringFactorTable'):
+        sftable = calc.getScatteringFactorTable()
+    if sftable is None:
+        return None
+    if not hasattr(sftable, 'getCustomSymbols'):
+        return (type(sftable), id(sftable))
+    custom = tuple((smbl, sftable.lookup(smbl))
+                   for smbl in sorted(sftable.getCustomSymbols()))
+    return (type(sftable), sftable.type(), custom)
+
+
+def _pairMaskKey(calc, stru):
+    """Return hashable pair masks of calc for structure stru or None.
+
+    The key contains the default and atom-type masks and the excluded
+    pairs of sites.  Masks of structures with more than _MAXMASKSITES
+    sites are not probed, the key is then the id of calc, so that the
+    calculation is shared only by generators with the same calculator.
+    Return None for calculators without pair masks.
+    """
+    if not hasattr(calc, 'getPairMask'):
+        return None
+    from diffpy.srreal.structureadapter import createStructureAdapter
+    adpt = createStructureAdapter(stru)
+    n = adpt.countSites()
+    if n > _MAXMASKSITES:
+        return id(calc)
+    types = [''] + sorted(set(adpt.siteAtomType(i) for i in range(n)))
+    tmasks = tuple(calc.getTypeMask(a, b) for a in types for b in types)
+    excluded = tuple((i, j) for i in range(n) for j in range(i, n)
+                     if not calc.getPairMask(i, j))
+    return (tmasks, excluded)
+
+# Maximum number of sites for comparing the pair masks in _pairMaskKey.
+_MAXMASKSITES = 200
+
+
+def _interpolationSetup(r, rcalc):
+    """Return (n, indices, weights) for linear interpolation to r.
+
+    indices and weights are None for identical grids.  indices is a slice
+    and weights None when r is a contiguous part of rcalc.  weights are None
+    when the interpolation cannot be precomputed.
+    """
+    n = len(rcalc)
+    if n == len(r):
+        eps = 1e-8 * (abs(rcalc[-1] - rcalc[0]) / max(n - 1, 1) + 1e-8)
+        if numpy.allclose(r, rcalc, rtol=0, atol=eps):
+            return (n, None, None)
+    if 0 < len(r) < n and n > 1:
+        dr = rcalc[1] - rcalc[0]
+        i0 = int(round((r[0] - rcalc[0]) / dr)) if dr > 0 else -1
+        i1 = i0 + len(r)
+        eps = 1e-8 * (abs(dr) + 1e-8)
+        if (0 <= i0 and i1 <= n and
+                numpy.allclose(r, rcalc[i0:i1], rtol=0, atol=eps)):
+            return (n, slice(i0, i1), None)
+    if n < 2:
+        return (n, numpy.empty(0, dtype=int), None)
+    idx = numpy.searchsorted(rcalc, r, side='right') - 1
+    idx = numpy.clip(idx, 0, n - 2)
+    w = (r - rcalc[idx]) / (rcalc[idx + 1] - rcalc[idx])
+    # values outside of rcalc are equal to the boundary values
+    w = numpy.clip(w, 0, 1)
+    return (n, idx, w)
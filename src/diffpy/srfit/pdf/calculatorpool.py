@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2008 The Trustees of Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE_DANSE.txt for license information.
+#
+##############################################################################
+
+"""Pool of worker processes shared by parallel PDF generators.
+
+The CalculatorPool class manages one multiprocessing.Pool, which evaluates
+partial PDF calculations for any number of BasePDFGenerator instances.
+Each worker keeps a cache of the calculators and structures it has seen.
+A generator ships its pickled calculator and structure only when their
+configuration changes, otherwise the workers receive just the vector of
+the current Parameter values.
+
+getCalculatorPool   --  Return the process-wide CalculatorPool instance.
+"""
+
+__all__ = ["CalculatorPool", "getCalculatorPool"]
+
+import weakref
+
+from diffpy.srfit.util.lrucache import LRUCache
+
+
+class CalculatorPool(object):
+    """Process pool for parallel evaluation of SrReal calculators.
+
+    Attributes
+    ncpu        --  Number of worker processes (read only).
+                    See setWorkerCount.
+    _ncpu       --  Number of worker processes.
+    _pool       --  The multiprocessing.Pool instance or None when the
+                    workers are not running.
+    _clients    --  Dictionary of weak references to the registered
+                    clients indexed by their key.
+    _lastkey    --  Key that was last assigned to a client.
+    _lastversion -- Version that was last assigned to a client blob.
+
+    The worker processes are started when needed and shut down when the
+    last registered client is unregistered.  Deallocated clients are only
+    removed from the registry, because joining the workers from a garbage
+    collector callback could deadlock.  The idle workers are then shut down
+    with the shutdown method, at the end of a with block or when the
+    Python interpreter exits.
+    """
+
+    ncpu = property(lambda self: self._ncpu)
+
+    def __init__(self, ncpu = None):
+        """Initialization.
+
+        ncpu    --  Number of worker processes.  Use the number of CPUs
+                    when None (default).
+        """
+        self._ncpu = None
+        self._pool = None
+        self._clients = {}
+        self._lastkey = 0
+        self._lastversion = 0
+        self.setWorkerCount(ncpu)
+        return
+
+    def setWorkerCount(self, ncpu = None):
+        """Set the total number of worker processes.
+
+        Running workers are shut down and the pool is restarted with the
+        new size upon the next evaluation.
+
+        ncpu    --  Number of worker processes.  Use the number of CPUs
+                    when None (default).
+
+        Raises ValueError if ncpu is smaller than 1.
+        """
+        if ncpu is None:
+            import multiprocessing
+            ncpu = multiprocessing.cpu_count()
+        ncpu = int(ncpu)
+        if ncpu < 1:
+            raise ValueError("ncpu must be at least 1.")
+        if ncpu != self._ncpu:
+            self.shutdown()
+        self._ncpu = ncpu
+        return
+
+    def register(self, client):
+        """Register a client of the pool.
+
+        client  --  The object that uses the pool.  The client is
+                    automatically removed from the registry when it is
+                    deallocated, but the workers keep running.
+
+        Return unique key identifying the client data in the workers.
+        """
+        self._lastkey += 1
+        key = self._lastkey
+        wself = weakref.ref(self)
+        def release(wr, key=key):
+            pool = wself()
+            if pool is not None:
+                pool._clients.pop(key, None)
+            return
+        self._clients[key] = weakref.ref(client, release)
+        return key
+
+    def unregister(self, key):
+        """Unregister a client and shut down the workers if it was the last.
+
+        key     --  The key returned by the register method.
+        """
+        self._clients.pop(key, None)
+        if not self._clients:
+            self.shutdown()
+        return
+
+    def newVersion(self):
+        """Return a new unique version number for the evaluate method."""
+        self._lastversion += 1
+        return self._lastversion
+
+    def evaluate(self, key, version, blob, values, nparts, sendblob = False):
+        """Evaluate partial results of a calculator in the worker processes.
+
+        key     --  The client key from the register method.
+        version --  Integer version of the blob from the newVersion method.
+                    The workers reuse their cached calculator when its
+                    version matches.
+        blob    --  Pickled tuple of (calculator, structure, usesymmetry,
+                    adapters), where adapters is a list of (obj, setter)
+                    pairs that apply the values.
+        values  --  List of values applied with the adapters before the
+                    evaluation.
+        nparts  --  Number of parts the calculation is split into.
+        sendblob -- Send the blob to all workers.  When False (default),
+                    the blob is only sent to workers that do not have the
+                    current version.
+
+        Return a list of the partial data from all parts.
+        """
+        pool = self._getPool()
+        tasks = [(key, version, blob if sendblob else None, values, i, nparts)
+                 for i in range(nparts)]
+        results = pool.map(_evaluatePart, tasks)
+        retry = [t[:2] + (blob,) + t[3:]
+                 for t, r in zip(tasks, results) if r is None]
+        rv = [r for r in results if r is not None]
+        if retry:
+            rv += pool.map(_evaluatePart, retry)
+        return rv
+
+    def shutdown(self):
+        """Shut down the worker processes.
+
+        The workers are restarted if the pool is used again.
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+        self._pool = None
+        return
+
+    def __enter__(self):
+        """Use the pool in a with block that shuts down the workers."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        return False
+
+    def _getPool(self):
+        """Get the multiprocessing.Pool and start it if necessary."""
+        if self._pool is None:
+            import multiprocessing
+            self._pool = multiprocessing.Pool(self._ncpu)
+        return self._pool
+
+    def __reduce__(self):
+        """Pickle as a reference to the shared pool of the process."""
+        return (getCalculatorPool, ())
+
+# End class CalculatorPool
+
+# Routines -------------------------------------------------------------------
+
+def getCalculatorPool():
+    """Return the CalculatorPool shared within this process.
+
+    The pool is created upon the first call.  Use its setWorkerCount
+    method to configure the total number of worker processes.
+    """
+    global _sharedpool
+    if _sharedpool is None:
+        _sharedpool = CalculatorPool()
+    return _sharedpool
+
+_sharedpool = None
+
+# Local helpers --------------------------------------------------------------
+
+# Calculators cached in a worker process indexed by the client key.
+_workercache = LRUCache(16)
+
+
+def _evaluatePart(args):
+    # Evaluate one part of the calculation in a worker process.
+    # Return None when the cached calculator does not match the version.
+    import pickle
+    key, version, blob, values, cpuindex, nparts = args
+    entry = _workercache.get(key)
+    if blob is not None:
+        entry = (version,) + pickle.loads(blob)
+        _workercache.put(key, entry)
+    if entry is None or entry[0] != version:
+        return None
+    calc, stru, usesymmetry, adapters = entry[1:]
+    for (obj, setter), v in zip(adapters, values):
+        setter(obj, v)
+    if not usesymmetry:
+        from diffpy.srreal.structureadapter import nosymmetry
+        stru = nosymmetry(stru)
+    calc._setupParallelRun(cpuindex, nparts)
+    calc.eval(stru)
+    return calc._getParallelData()
+
+# End of file
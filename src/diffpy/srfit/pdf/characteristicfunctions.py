@@ -23,6 +23,19 @@ Gcryst(f) is the crystal PDF.
 
 These functions are meant to be imported and added to a FitContribution using
 the 'registerFunction' method of that class.
+
+The spheroidalCF, spheroidalCF2, lognormalSphericalCF, shellCF and shellCF2
+functions are expensive to evaluate.  They keep their recent results on
+uniform r-grids in the spheroidalcache, lognormalcache and shellcache
+LRUCache-s, where they are indexed by the (r0, dr, npoints) of the grid and
+the shape parameters.  The cache keeps read-only arrays and the functions
+return their writable copies.  The sphericalCF function is cheaper to
+calculate than to look up and is not cached.
+
+The shape parameters of sphericalCF, spheroidalCF, spheroidalCF2,
+lognormalSphericalCF, shellCF and shellCF2 can be arrays, in which case the
+functions return an array of shape (parameters shape) + (r shape) with one
+characteristic function per combination of the broadcast shape parameters.
 """
 
 __all__ = ["sphericalCF", "spheroidalCF", "spheroidalCF2",
@@ -32,10 +45,16 @@ import numpy
 from numpy import pi, sqrt, log, exp, log2, ceil, sign
 from numpy import arctan as atan
 from numpy import arctanh as atanh
-from numpy.fft import ifft, fftfreq
+from numpy.fft import rfft
 from scipy.special import erf
 
 from diffpy.srfit.fitbase.calculator import Calculator
+from diffpy.srfit.util.lrucache import LRUCache
+
+# Recently calculated expensive characteristic functions.
+spheroidalcache = LRUCache(4)
+lognormalcache = LRUCache(4)
+shellcache = LRUCache(4)
 
 
 def sphericalCF(r, psize):
@@ -48,12 +67,15 @@ def sphericalCF(r, psize):
     (converted from radius to diameter)
 
     """
-    f = numpy.zeros(numpy.shape(r), dtype=float)
-    if psize > 0:
-        x = numpy.array(r, dtype=float) / psize
-        inside = (x < 1.0)
-        xin = x[inside]
-        f[inside] = 1.0 - 1.5*xin + 0.5*xin*xin*xin
+    return _evaluateCF(_sphericalCF, True, None, r, psize)
+
+def _sphericalCF(r, psize):
+    """Calculate sphericalCF elementwise for broadcast r and psize."""
+    r, psize = numpy.broadcast_arrays(r, psize)
+    f = numpy.zeros(r.shape, dtype=float)
+    inside = (psize > 0) & (r < psize)
+    x = r[inside] / psize[inside]
+    f[inside] = 1.0 - 1.5*x + 0.5*x*x*x
     return f
 
 def spheroidalCF(r, erad, prad):
@@ -85,6 +107,11 @@ def spheroidalCF2(r, psize, axrat):
     From Lei et al., Phys. Rev. B, 80, 024118 (2009)
 
     """
+    return _evaluateCF(_spheroidalCF2, False, spheroidalcache,
+                       r, psize, axrat)
+
+def _spheroidalCF2(r, psize, axrat):
+    """Calculate spheroidalCF2 for scalar psize and axrat."""
     pelpt = 1.0 * axrat
 
     if psize <= 0 or pelpt <= 0:
@@ -97,7 +124,7 @@ def spheroidalCF2(r, psize, axrat):
     v2 = v*v
 
     if v == 1:
-        return sphericalCF(r, psize)
+        return _sphericalCF(r, psize)
 
     rx = r
     if v < 1:
@@ -166,8 +193,13 @@ def lognormalSphericalCF(r, psize, psig):
 
     Source unknown
     """
+    return _evaluateCF(_lognormalSphericalCF, False, lognormalcache,
+                       r, psize, psig)
+
+def _lognormalSphericalCF(r, psize, psig):
+    """Calculate lognormalSphericalCF for scalar psize and psig."""
     if psize <= 0: return numpy.zeros_like(r)
-    if psig <= 0: return sphericalCF(r, psize)
+    if psig <= 0: return _sphericalCF(r, psize)
 
     erfc = lambda x: 1.0-erf(x)
 
@@ -232,8 +264,11 @@ def shellCF2(r, a, delta):
     From Lei et al., Phys. Rev. B, 80, 024118 (2009)
 
     """
-    a = 1.0*a
-    d = 1.0*delta
+    return _evaluateCF(_shellCF2, True, shellcache, r, a, delta)
+
+def _shellCF2(r, a, delta):
+    """Calculate shellCF2 elementwise for broadcast r, a and delta."""
+    r, a, d = numpy.broadcast_arrays(r, 1.0*a, 1.0*delta)
     a2 = a**2
     d2 = d**2
     dmr = d-r
@@ -254,6 +289,65 @@ def shellCF2(r, a, delta):
     return f
 
 
+def _evaluateCF(kernel, elementwise, cache, r, *params):
+    """Evaluate a characteristic function for scalar or array parameters.
+
+    kernel      --  Function of (r, *params) that calculates the
+                    characteristic function for scalar parameters.
+    elementwise --  The kernel broadcasts r with array parameters.
+                    Otherwise the kernel is called for each set of
+                    parameters.
+    cache       --  LRUCache of the results on uniform r-grids or None.
+    r           --  The r-grid.
+    params      --  Shape parameters, scalars or arrays.
+
+    Return a new array of shape (broadcast params shape) + (r shape).  The
+    cache keeps its own read-only copy.
+    """
+    ra = numpy.asarray(r, dtype=float)
+    pa = numpy.broadcast_arrays(*[numpy.asarray(p, dtype=float)
+                                  for p in params])
+    key = None
+    gkey = None if cache is None else _gridKey(ra)
+    if gkey is not None:
+        key = gkey + tuple((p.shape, p.tobytes()) for p in pa)
+        f = cache.get(key)
+        if f is not None:
+            return f.copy()
+    pshape = pa[0].shape
+    if not pshape:
+        f = kernel(ra, *[p[()] for p in pa])
+    elif elementwise:
+        idx = (Ellipsis,) + ra.ndim * (None,)
+        f = kernel(ra, *[p[idx] for p in pa])
+    else:
+        f = [kernel(ra, *v) for v in zip(*[p.ravel() for p in pa])]
+    f = numpy.asarray(f, dtype=float).reshape(pshape + ra.shape)
+    if key is not None:
+        fcached = f.copy()
+        fcached.setflags(write=False)
+        cache.put(key, fcached)
+    return f
+
+
+def _gridKey(r):
+    """Get the (r0, dr, npoints) key of a uniform r-grid.
+
+    Return None when r is not a uniform 1D grid.
+    """
+    n = r.size
+    if r.ndim != 1 or n < 2:
+        return None
+    r0 = float(r[0])
+    dr = (float(r[-1]) - r0) / (n - 1)
+    if not dr > 0:
+        return None
+    # allow for the round-off in the grid steps
+    if numpy.ptp(numpy.diff(r)) > 1e-9 * dr:
+        return None
+    return (r0, dr, n)
+
+
 class SASCF(Calculator):
     """Calculator class for characteristic functions from sas-models.
 
@@ -264,6 +358,9 @@ class SASCF(Calculator):
 
     Attributes:
     _model      --  BaseModel object this adapts.
+    _transforms --  LRUCache of the transformation setups indexed by the
+                    r-grid, the r-range and the number of FFT points.  See
+                    _getTransform.
 
     Managed Parameters:
     These depend on the parameters of the BaseModel object held by _model. They
@@ -284,6 +381,7 @@ class SASCF(Calculator):
         Calculator.__init__(self, name)
 
         self._model = model
+        self._transforms = LRUCache(4)
 
         from diffpy.srfit.sas.sasparameter import SASParameter
         # Wrap normal parameters
@@ -316,6 +414,7 @@ class SASCF(Calculator):
         #
         # We also have to make a q-spacing small enough to compute out to at
         # least the size of the signal.
+        r = numpy.asarray(r, dtype=float)
         dr = min(0.01, r[1] - r[0])
         ed = 2 * self._model.calculate_ER()
 
@@ -328,32 +427,29 @@ class SASCF(Calculator):
         dq = pi / rmax
         qmax = pi / dr
         numpoints = int(2**(ceil(log2(qmax/dq))))
-        qmax = dq * numpoints
+        q, buf, idx, w = self._getTransform(r, rmax, numpoints)
 
-        # Calculate F(q) = q * I(q) from model
-        q = fftfreq(int(qmax/dq)) * qmax
+        # Calculate F(q) = q * I(q) from model at positive q
         fq = q * self._model.evalDistribution(q)
 
-        # Calculate g(r) and the effective r-points
-        rp = fftfreq(numpoints) * 2 * pi / dq
-        # Note sine transform = imaginary part of ifft
-        gr = ifft(fq).imag
-
-        # Calculate full-fr for normalization
-        assert (rp[0] == 0.0)
-        frp = numpy.zeros_like(gr)
-        frp[1:] = gr[1:] / rp[1:]
-
-        # Inerpolate onto requested grid, do not use data after jump in rp
-        assert (numpoints % 2 == 0)
-        nhalf = numpoints / 2
-        fr = numpy.interp(r, rp[:nhalf], gr[:nhalf])
+        # The sine transform of F(q) is the imaginary part of the inverse
+        # FFT of its odd extension, here evaluated with the real FFT.
+        nhalf = numpoints // 2
+        buf[1:nhalf] = fq
+        buf[nhalf+1:] = -fq[::-1]
+        gr = rfft(buf)[:nhalf].imag
+        gr /= -numpoints
+
+        # Interpolate onto requested grid.  The effective r-points are
+        # rp = drp * arange(nhalf).
+        drp = 2 * rmax / numpoints
+        fr = gr[idx] * (1 - w) + gr[idx + 1] * w
         vmask = (r != 0)
         fr[vmask] /= r[vmask]
 
         # Normalize. We approximate fr[0] by using the fact that f(r) is linear
         # at low r. By definition, fr[0] should equal 1.
-        fr0 = 2*frp[2] - frp[1]
+        fr0 = (gr[2] - gr[1]) / drp
         fr /= fr0
 
         # Fix potential divide-by-zero issue, fr is 1 at r == 0
@@ -361,5 +457,36 @@ class SASCF(Calculator):
 
         return fr
 
+    def _getTransform(self, r, rmax, numpoints):
+        """Get the cached setup of the sine transformation.
+
+        r           --  The r-grid of the characteristic function.
+        rmax        --  The r-range of the transformation, which sets the
+                        q-spacing pi / rmax.
+        numpoints   --  The number of points of the odd-extended F(q),
+                        a power of 2.
+
+        Return a tuple of (q, buf, idx, w), where q is the array of positive
+        q-values, buf the work array of numpoints elements for the odd
+        extension of F(q), and idx, w are the interpolation indices and
+        weights of r with respect to the effective r-points.
+        """
+        gkey = _gridKey(r)
+        key = (r.tobytes() if gkey is None else gkey, rmax, numpoints)
+        rv = self._transforms.get(key)
+        if rv is None:
+            nhalf = numpoints // 2
+            dq = pi / rmax
+            q = dq * numpy.arange(1, nhalf)
+            buf = numpy.zeros(numpoints)
+            drp = 2 * rmax / numpoints
+            rp = drp * numpy.arange(nhalf)
+            idx = numpy.searchsorted(rp, r, side='right') - 1
+            idx = numpy.clip(idx, 0, nhalf - 2)
+            w = numpy.clip((r - rp[idx]) / drp, 0, 1)
+            rv = (q, buf, idx, w)
+            self._transforms.put(key, rv)
+        return rv
+
 
 # End of file
@@ -0,0 +1,596 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2008 The Trustees of Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE_DANSE.txt for license information.
+#
+##############################################################################
+
+"""Vectorized Debye calculator of the PDF and scattering intensity.
+
+The DebyeCalculator class evaluates the Debye scattering equation for
+isolated scatterers using NumPy only.  Interatomic distances are processed
+in blocks of bounded size and accumulated into a histogram resolved by
+pairs of elements.  Each bin also keeps the mean of the summed isotropic
+displacement parameters of its atom pairs, which gives the Debye-Waller
+factor at the bin distance.  The blocks are evaluated in a thread pool
+shared within the process.  The histogram is reused for structures that
+differ only by isotropic expansion and by a common change of the
+displacement parameters of each element, as in fits of rigid
+nanoparticles.
+
+DebyeCalculator can be used in place of the srreal DebyePDFCalculator in the
+DebyePDFGenerator.  Its iofq method returns the Debye intensity.
+"""
+
+__all__ = ["DebyeCalculator", "DistanceHistogram"]
+
+import os
+
+import numpy
+
+
+class DistanceHistogram(object):
+    """Histogram of interatomic distances resolved by element pairs.
+
+    Attributes
+    binwidth    --  Width of the distance bins.
+    rscale      --  Scale factor of the distances.  Bin k is centered at
+                    k * binwidth * rscale.
+    elements    --  List of the element symbols.
+    ntypeatoms  --  Array of occupancy-weighted number of atoms of each
+                    element.
+    pairs       --  List of (ta, tb) index pairs of the elements, ta <= tb.
+    counts      --  Array of shape (len(pairs), nbins) with the
+                    occupancy-weighted number of atom pairs i < j per bin.
+    sigma2      --  Array of the same shape as counts with the weighted
+                    mean of Ui + Uj of the atom pairs in each bin.
+    """
+
+    def __init__(self, binwidth, elements, ntypeatoms, pairs, counts, sigma2,
+                 rscale = 1.0):
+        """Initialization.  See the class attributes."""
+        self.binwidth = binwidth
+        self.elements = list(elements)
+        self.ntypeatoms = numpy.asarray(ntypeatoms, dtype=float)
+        self.pairs = list(pairs)
+        self.counts = counts
+        self.sigma2 = sigma2
+        self.rscale = rscale
+        return
+
+    def getMaxDistance(self):
+        """Return the upper bound of the histogram distances."""
+        return self.counts.shape[1] * self.binwidth * self.rscale
+
+    def rescaled(self, rscale, dsigma2):
+        """Get the histogram for scaled distances and shifted pair Uiso.
+
+        rscale  --  Scale factor of the distances relative to this
+                    histogram.
+        dsigma2 --  Array of the changes of Ui + Uj for each element pair.
+
+        Return a new DistanceHistogram that shares the counts array.
+        """
+        dsigma2 = numpy.asarray(dsigma2, dtype=float)
+        sigma2 = self.sigma2
+        if dsigma2.any():
+            sigma2 = sigma2 + dsigma2[:, None]
+        return DistanceHistogram(self.binwidth, self.elements,
+                                 self.ntypeatoms, self.pairs, self.counts,
+                                 sigma2, self.rscale * rscale)
+
+    def getDistances(self, ip):
+        """Get the occupied bins for a pair of elements.
+
+        ip      --  Index of the element pair in the pairs list.
+
+        Return a tuple of (r, c, s2) arrays of the bin distances, counts
+        and the mean Ui + Uj values.
+        """
+        k = numpy.flatnonzero(self.counts[ip])
+        r = k * (self.binwidth * self.rscale)
+        return r, self.counts[ip][k], self.sigma2[ip][k]
+
+# End class DistanceHistogram
+
+
+class DebyeCalculator(object):
+    """Calculator of the PDF and intensity from the Debye equation.
+
+    The reduced structure function is
+        F(Q) = Q/(N <f>**2) * sum(i != j) fi fj sinc(Q rij) exp(-sij**2 Q**2/2)
+    where the pair broadening
+        sij**2 = (Ui + Uj) * (1 - delta1/rij - delta2/rij**2) + qbroad**2 rij**2
+    uses isotropic equivalents of the atom displacement parameters.  The
+    Ui + Uj term is averaged over the pairs in each histogram bin, which is
+    exact when all atoms of an element have the same Uiso.  The PDF is the
+    sine Fourier transformation of F(Q) from qmin to qmax multiplied by the
+    scale and the Q-resolution envelope exp(-(qdamp r)**2/2).
+
+    Attributes
+    rmin        --  Lower bound of the r-grid.
+    rmax        --  Upper bound of the r-grid, exclusive.
+    rstep       --  Spacing of the r-grid.
+    qmin        --  Lower bound of the Fourier transformation.
+    qmax        --  Upper bound of the Fourier transformation.
+    scale       --  Scale factor of the PDF.
+    delta1      --  Coefficient of the 1/r sharpening of the pair
+                    displacements due to correlated motion.
+    delta2      --  Coefficient of the 1/r**2 sharpening of the pair
+                    displacements due to correlated motion.
+    qbroad      --  Peak broadening due to Q-resolution.
+    qdamp       --  Width of the Gaussian envelope due to Q-resolution.
+    binwidth    --  Width of the distance histogram bins (default 1e-3).
+    chunksize   --  Number of atoms in a block of the pair distances
+                    (default 1000).  Other intermediate arrays are limited
+                    to chunksize**2 elements as well.
+    nthreads    --  Number of threads that process the blocks.  Use the
+                    number of CPUs when None (default).
+    reusehistogram -- Flag for reusing the distance histogram of the last
+                    structure (default True).  The histogram is rescaled
+                    when the structure only differs by isotropic expansion
+                    and by a common change of the Uiso of each element.
+    usedenvelopetypes -- Tuple of the names of applied envelopes.
+    rgrid       --  The r-grid of the last calculated PDF.
+    pdf         --  The last calculated PDF.
+    _sftable    --  Scattering factor table or None for unit scattering
+                    factors.  The table must have the lookup(symbol, q) and
+                    radiationType() methods, as the ScatteringFactorTable
+                    classes from diffpy.srreal.
+    _sfcache    --  Tuple of (q, dict) with the Q-grid and the scattering
+                    factors of the elements on that grid or None.
+    _histcache  --  Tuple of (xyz, elements, occ, uiso, tidx, hist) with
+                    the centered atom positions, elements, occupancies,
+                    Uiso, element indices of the atoms and the distance
+                    histogram of the last structure or None.
+    """
+
+    usedenvelopetypes = ('scale', 'qresolution')
+
+    _doubleattrs = ('binwidth', 'delta1', 'delta2', 'qbroad', 'qdamp',
+                    'qmax', 'qmin', 'rmax', 'rmin', 'rstep', 'scale')
+
+    def __init__(self, **kwargs):
+        """Initialization.
+
+        kwargs  --  Initial values of the calculator attributes.
+
+        Raises AttributeError for invalid attribute names.
+        """
+        self.rmin = 0.0
+        self.rmax = 10.0
+        self.rstep = 0.01
+        self.qmin = 0.0
+        self.qmax = 25.0
+        self.scale = 1.0
+        self.delta1 = 0.0
+        self.delta2 = 0.0
+        self.qbroad = 0.0
+        self.qdamp = 0.0
+        self.binwidth = 1e-3
+        self.chunksize = 1000
+        self.nthreads = None
+        self.reusehistogram = True
+        self.rgrid = numpy.empty(0)
+        self.pdf = numpy.empty(0)
+        self._sftable = None
+        self._sfcache = None
+        self._histcache = None
+        for name, value in kwargs.items():
+            if not hasattr(self, name):
+                raise AttributeError("Invalid attribute '%s'" % name)
+            setattr(self, name, value)
+        return
+
+    def __call__(self, stru):
+        """Calculate the PDF of a structure.
+
+        stru    --  diffpy.structure.Structure or any object that can be
+                    converted to diffpy.srreal StructureAdapter.
+
+        Return a tuple of (rgrid, pdf) arrays.
+        """
+        self.eval(stru)
+        return self.rgrid.copy(), self.pdf.copy()
+
+    def eval(self, stru):
+        """Calculate the PDF of a structure and store it in the pdf attribute.
+
+        Return the pdf array.
+        """
+        hist = self.getDistanceHistogram(stru)
+        self.rgrid, self.pdf = self._pdfFromHistogram(hist)
+        return self.pdf
+
+    def fofq(self, stru, q):
+        """Calculate the reduced structure function F(Q).
+
+        stru    --  The structure object.  See __call__.
+        q       --  Array of the Q values.
+
+        Return an array of F(Q).
+        """
+        hist = self.getDistanceHistogram(stru)
+        return self._fofqFromHistogram(hist, q)
+
+    def iofq(self, stru, q):
+        """Calculate the Debye scattering intensity I(Q).
+
+        I(Q) = sum(i) fi**2 + sum(i != j) fi fj sinc(Q rij) exp(-sij**2 Q**2/2)
+        where the sums are weighted by atom occupancies.
+
+        stru    --  The structure object.  See __call__.
+        q       --  Array of the Q values.
+
+        Return an array of I(Q).
+        """
+        hist = self.getDistanceHistogram(stru)
+        return self._iofqFromHistogram(hist, q)
+
+    def getDistanceHistogram(self, stru):
+        """Calculate the histogram of interatomic distances.
+
+        stru    --  The structure object.  See __call__.
+
+        The histogram of the previous structure is rescaled when reusehistogram
+        is set and the atom positions only differ by a common scale factor.
+
+        Return a DistanceHistogram instance.
+        """
+        xyz, elements, occ, uiso = _getAtomData(stru)
+        typekeys = {}
+        tidx = numpy.array([typekeys.setdefault(e, len(typekeys))
+                            for e in elements], dtype=int)
+        tkeys = sorted(typekeys, key=typekeys.get)
+        if len(xyz):
+            xyz = xyz - xyz.mean(axis=0)
+        hist = self._getCachedHistogram(xyz, elements, occ, uiso, tidx)
+        if hist is not None:
+            return hist
+        ntypes = len(tkeys)
+        pairmap = numpy.empty((ntypes, ntypes), dtype=int)
+        pairs = []
+        for ta in range(ntypes):
+            for tb in range(ta, ntypes):
+                pairmap[ta, tb] = pairmap[tb, ta] = len(pairs)
+                pairs.append((ta, tb))
+        ntypeatoms = numpy.bincount(tidx, occ, minlength=ntypes)
+        n = len(xyz)
+        bw = float(self.binwidth)
+        dmax = numpy.sqrt(numpy.sum(numpy.ptp(xyz, axis=0)**2)) if n else 0
+        nbins = int(dmax / bw) + 2
+        nflat = len(pairs) * nbins
+        cs = max(1, int(self.chunksize))
+
+        def blockcounts(blk):
+            i0, j0 = blk
+            a = xyz[i0:i0 + cs]
+            b = xyz[j0:j0 + cs]
+            d = numpy.sqrt(numpy.sum((a[:, None, :] - b[None, :, :])**2, -1))
+            k = numpy.rint(d / bw).astype(int)
+            p = pairmap[tidx[i0:i0 + cs, None], tidx[None, j0:j0 + cs]]
+            w = numpy.outer(occ[i0:i0 + cs], occ[j0:j0 + cs])
+            u = uiso[i0:i0 + cs, None] + uiso[None, j0:j0 + cs]
+            if i0 == j0:
+                iu = numpy.triu_indices(len(a), 1)
+                k, p, w, u = k[iu], p[iu], w[iu], u[iu]
+            flat = (p * nbins + k).ravel()
+            w = w.ravel()
+            c = numpy.bincount(flat, w, minlength=nflat)
+            cu = numpy.bincount(flat, w * u.ravel(), minlength=nflat)
+            return c, cu
+
+        blocks = [(i0, j0) for i0 in range(0, n, cs)
+                  for j0 in range(i0, n, cs)]
+        counts = numpy.zeros(nflat)
+        usums = numpy.zeros(nflat)
+        for c, cu in self._map(blockcounts, blocks):
+            counts += c
+            usums += cu
+        counts = counts.reshape(len(pairs), nbins)
+        usums = usums.reshape(len(pairs), nbins)
+        sigma2 = numpy.zeros_like(usums)
+        nz = counts != 0
+        sigma2[nz] = usums[nz] / counts[nz]
+        hist = DistanceHistogram(bw, tkeys, ntypeatoms, pairs, counts, sigma2)
+        self._histcache = None
+        if self.reusehistogram:
+            self._histcache = (xyz, elements, occ, uiso, tidx, hist)
+        return hist
+
+    def setScatteringFactorTable(self, sftable):
+        """Set the scattering factor table.
+
+        sftable --  Object with lookup(symbol, q) and radiationType()
+                    methods or None for unit scattering factors.
+        """
+        self._sftable = sftable
+        self._sfcache = None
+        return
+
+    def getScatteringFactorTable(self):
+        """Get the scattering factor table or None for unit factors.
+        """
+        return self._sftable
+
+    def setScatteringFactorTableByType(self, stype):
+        """Set the diffpy.srreal scattering factor table of given type.
+
+        stype   --  "X" for x-ray, "N" for neutron, "E" for electrons or any
+                    type registered in diffpy.srreal.
+
+        Raises ValueError for unknown scattering type.
+        """
+        from diffpy.srreal.scatteringfactortable import ScatteringFactorTable
+        self.setScatteringFactorTable(ScatteringFactorTable.createByType(stype))
+        return
+
+    def getRadiationType(self):
+        """Get the radiation type of the scattering factor table.
+
+        Return an empty string for unit scattering factors.
+        """
+        if self._sftable is None:
+            return ""
+        return self._sftable.radiationType()
+
+    # methods of the srreal calculator interface used by the generators
+
+    def _namesOfDoubleAttributes(self):
+        return set(self._doubleattrs)
+
+    def _getDoubleAttr(self, name):
+        return getattr(self, name)
+
+    # Protected methods
+
+    def _getCachedHistogram(self, xyz, elements, occ, uiso, tidx):
+        """Return the rescaled cached histogram or None if it cannot be used.
+
+        xyz     --  Array of atom positions relative to their centroid.
+        elements -- List of atom elements.
+        occ     --  Array of atom occupancies.
+        uiso    --  Array of atom Uiso values.
+        tidx    --  Array of element indices of the atoms.
+        """
+        if not self.reusehistogram or self._histcache is None:
+            return None
+        xyz0, elements0, occ0, uiso0, tidx0, hist0 = self._histcache
+        if (hist0.binwidth != self.binwidth or elements != elements0 or
+                not numpy.array_equal(occ, occ0) or
+                not numpy.array_equal(tidx, tidx0)):
+            return None
+        # Uiso must change by the same amount for all atoms of an element
+        du = uiso - uiso0
+        dut = numpy.zeros(len(hist0.elements))
+        dut[tidx] = du
+        if not numpy.allclose(du, dut[tidx], rtol=0, atol=1e-12):
+            return None
+        dsigma2 = [dut[ta] + dut[tb] for ta, tb in hist0.pairs]
+        norm0 = numpy.sum(xyz0**2)
+        if norm0 == 0:
+            return hist0.rescaled(1.0, dsigma2) if not xyz.any() else None
+        s = numpy.sum(xyz * xyz0) / norm0
+        tol = 1e-10 * (1 + numpy.abs(xyz).max())
+        if s <= 0 or numpy.abs(xyz - s * xyz0).max() > tol:
+            return None
+        return hist0.rescaled(s, dsigma2)
+
+
+    def _getRgrid(self):
+        """Return the r-grid of the PDF.
+
+        Raises ValueError for invalid r-grid.
+        """
+        if self.rstep <= 0:
+            raise ValueError("rstep must be positive.")
+        npts = max(0, int(numpy.ceil((self.rmax - self.rmin) / self.rstep)))
+        return self.rmin + self.rstep * numpy.arange(npts)
+
+    def _getScatteringFactors(self, hist, q):
+        """Return list of scattering factor arrays for the elements.
+
+        The scattering factors are cached for the last Q-grid.
+        """
+        sft = self._sftable
+        if sft is None:
+            return [numpy.ones_like(q)] * len(hist.elements)
+        cache = self._sfcache
+        if cache is None or not numpy.array_equal(cache[0], q):
+            cache = self._sfcache = (q.copy(), {})
+        sfs = cache[1]
+        for smbl in hist.elements:
+            if smbl not in sfs:
+                sfs[smbl] = _lookupArray(sft, smbl, q)
+        return [sfs[smbl] for smbl in hist.elements]
+
+    def _pairSums(self, hist, q):
+        """Sum the Debye terms of the histogram bins per atom-type pair.
+
+        Return array of shape (len(hist.pairs), len(q)) with the sums of
+        c * sinc(Q r) * exp(-s**2 Q**2 / 2) over the occupied bins.
+        """
+        q = numpy.asarray(q, dtype=float)
+        nq = max(len(q), 1)
+        blksize = max(1, int(self.chunksize)**2 // nq)
+        qq = q * q
+        tasks = []
+        for ip in range(len(hist.pairs)):
+            r, c, sigma2 = hist.getDistances(ip)
+            for i in range(0, len(r), blksize):
+                tasks.append((ip, r[i:i + blksize], c[i:i + blksize],
+                              sigma2[i:i + blksize]))
+
+        def blocksum(task):
+            ip, r, c, sigma2 = task
+            s2 = self._pairBroadening(r, sigma2)
+            m = numpy.sinc(numpy.outer(q, r) / numpy.pi)
+            m *= numpy.exp(-0.5 * numpy.outer(qq, s2))
+            return ip, m.dot(c)
+
+        rv = numpy.zeros((len(hist.pairs), len(q)))
+        for ip, v in self._map(blocksum, tasks):
+            rv[ip] += v
+        return rv
+
+    def _pairBroadening(self, r, sigma2):
+        """Return the mean-square pair broadening at distances r.
+
+        sigma2  --  Array of Ui + Uj at the distances r.
+        """
+        with numpy.errstate(divide='ignore'):
+            rinv = numpy.where(r > 0, 1.0 / r, 0.0)
+        corr = 1 - self.delta1 * rinv - self.delta2 * rinv**2
+        s2 = numpy.maximum(sigma2 * corr, 0) + (self.qbroad * r)**2
+        return s2
+
+    def _debyeSums(self, hist, q):
+        """Return the self term and the pair term of the Debye intensity.
+
+        Also return the average scattering factor <f>.
+        """
+        sfs = self._getScatteringFactors(hist, q)
+        psums = self._pairSums(hist, q)
+        selfterm = numpy.zeros(len(q))
+        favg = numpy.zeros(len(q))
+        for n, f in zip(hist.ntypeatoms, sfs):
+            selfterm += n * f**2
+            favg += n * f
+        natoms = hist.ntypeatoms.sum()
+        if natoms > 0:
+            favg /= natoms
+        pairterm = numpy.zeros(len(q))
+        for (ta, tb), v in zip(hist.pairs, psums):
+            pairterm += 2 * sfs[ta] * sfs[tb] * v
+        return selfterm, pairterm, favg
+
+    def _iofqFromHistogram(self, hist, q):
+        """Calculate I(Q) from the distance histogram."""
+        q = numpy.asarray(q, dtype=float)
+        selfterm, pairterm, favg = self._debyeSums(hist, q)
+        return selfterm + pairterm
+
+    def _fofqFromHistogram(self, hist, q):
+        """Calculate F(Q) from the distance histogram."""
+        q = numpy.asarray(q, dtype=float)
+        selfterm, pairterm, favg = self._debyeSums(hist, q)
+        natoms = hist.ntypeatoms.sum()
+        denom = natoms * favg**2
+        rv = numpy.zeros(len(q))
+        nz = denom != 0
+        rv[nz] = q[nz] * pairterm[nz] / denom[nz]
+        return rv
+
+    def _pdfFromHistogram(self, hist):
+        """Calculate the PDF from the distance histogram.
+
+        Return a tuple of (rgrid, pdf) arrays.
+
+        Raises ValueError if qmax is not larger than qmin.
+        """
+        if not self.qmax > self.qmin:
+            raise ValueError("qmax must be larger than qmin.")
+        rgrid = self._getRgrid()
+        dmax = hist.getMaxDistance()
+        rhi = rgrid[-1] if len(rgrid) else 0
+        qstep = numpy.pi / (2 * max(dmax, rhi, 1.0))
+        nq = int(numpy.ceil((self.qmax - self.qmin) / qstep)) + 1
+        q = numpy.linspace(self.qmin, self.qmax, nq)
+        fq = self._fofqFromHistogram(hist, q)
+        # trapezoid weights for the sine transformation
+        wq = numpy.full(nq, q[1] - q[0])
+        wq[[0, -1]] *= 0.5
+        fqw = fq * wq * (2 / numpy.pi)
+        pdf = numpy.empty(len(rgrid))
+        blksize = max(1, int(self.chunksize)**2 // nq)
+        for i in range(0, len(rgrid), blksize):
+            rblk = rgrid[i:i + blksize]
+            pdf[i:i + blksize] = numpy.sin(numpy.outer(rblk, q)).dot(fqw)
+        pdf *= self.scale
+        if self.qdamp > 0:
+            pdf *= numpy.exp(-0.5 * (self.qdamp * rgrid)**2)
+        return rgrid, pdf
+
+    def _map(self, func, items):
+        """Map func over items in the thread pool in an arbitrary order."""
+        nthreads = self.nthreads
+        if nthreads is None:
+            import multiprocessing
+            nthreads = multiprocessing.cpu_count()
+        if nthreads <= 1 or len(items) <= 1:
+            for item in items:
+                yield func(item)
+            return
+        pool = _getThreadPool(nthreads)
+        for rv in pool.imap_unordered(func, items):
+            yield rv
+        return
+
+# End class DebyeCalculator
+
+# Local helpers --------------------------------------------------------------
+
+# Thread pools shared by the calculators indexed by (pid, nthreads).
+_threadpools = {}
+
+
+def _getThreadPool(nthreads):
+    """Return the ThreadPool with nthreads shared in this process.
+
+    The pools are created once and reused.  Pools inherited from a parent
+    process have no running threads and are replaced.
+    """
+    pid = os.getpid()
+    key = (pid, nthreads)
+    pool = _threadpools.get(key)
+    if pool is None:
+        from multiprocessing.pool import ThreadPool
+        for k in [k for k in _threadpools if k[0] != pid]:
+            del _threadpools[k]
+        pool = _threadpools[key] = ThreadPool(nthreads)
+    return pool
+
+
+def _lookupArray(sftable, smbl, q):
+    """Return array of the scattering factors of an element at q values.
+
+    Use one lookup call for the whole array if the table supports it.
+    """
+    try:
+        rv = numpy.asarray(sftable.lookup(smbl, q), dtype=float)
+        if rv.shape == q.shape:
+            return rv
+    except (TypeError, ValueError):
+        pass
+    rv = numpy.array([sftable.lookup(smbl, qi) for qi in q], dtype=float)
+    return rv
+
+
+def _getAtomData(stru):
+    """Return Cartesian positions, elements, occupancies and Uiso of atoms.
+    """
+    if hasattr(stru, 'xyz_cartn'):
+        xyz = numpy.array(stru.xyz_cartn, dtype=float).reshape(-1, 3)
+        elements = list(stru.element)
+        occ = numpy.array(stru.occupancy, dtype=float)
+        uiso = numpy.array(stru.Uisoequiv, dtype=float)
+        return xyz, elements, occ, uiso
+    from diffpy.srreal.structureadapter import createStructureAdapter
+    adpt = createStructureAdapter(stru)
+    n = adpt.countSites()
+    xyz = numpy.array([adpt.siteCartesianPosition(i) for i in range(n)],
+                      dtype=float).reshape(-1, 3)
+    elements = [adpt.siteAtomType(i) for i in range(n)]
+    occ = numpy.array([adpt.siteOccupancy(i) * adpt.siteMultiplicity(i)
+                       for i in range(n)], dtype=float)
+    uiso = numpy.array([numpy.trace(adpt.siteCartesianUij(i)) / 3.0
+                        for i in range(n)], dtype=float)
+    return xyz, elements, occ, uiso
+
+# End of file
@@ -18,12 +18,16 @@
 The DebyePDFGenerator class can take a diffpy.structure,
 pyobjcryst.crystal.Crystal or pyobjcryst.molecule.Molecule object and calculate
 the PDF from it. This generator is especially appropriate for isolated
-scatterers, such as nanoparticles and molecules.
+scatterers, such as nanoparticles and molecules.  The PDF is calculated
+with the srreal DebyePDFCalculator or with the NumPy DebyeCalculator.
+DebyeCalculator keeps the distance histogram when only the scale, isotropic
+expansion or displacement parameters of the structure are refined.
 """
 
 __all__ = ["DebyePDFGenerator"]
 
 from diffpy.srfit.pdf.basepdfgenerator import BasePDFGenerator
+from diffpy.srfit.pdf.debyecalculator import DebyeCalculator
 
 
 class DebyePDFGenerator(BasePDFGenerator):
@@ -34,7 +38,8 @@ class DebyePDFGenerator(BasePDFGenerator):
     are not created until the structure is added.
 
     Attributes:
-    _calc   --  DebyePDFCalculator instance for calculating the PDF
+    _calc   --  DebyePDFCalculator or DebyeCalculator instance for
+                calculating the PDF
     _phase  --  The structure ParameterSets used to calculate the profile.
     stru    --  The structure objected adapted by _phase.
     _lastr  --  The last value of r over which the PDF was calculated. This is
@@ -107,14 +112,47 @@ class DebyePDFGenerator(BasePDFGenerator):
         return BasePDFGenerator.setPhase(self, parset, periodic)
 
 
-    def __init__(self, name = "pdf"):
+    def __init__(self, name = "pdf", calculator = None):
         """Initialize the generator.
+
+        name        --  The name of the generator (default "pdf").
+        calculator  --  The PDF calculator.  Use the srreal
+                        DebyePDFCalculator when None (default).  Use
+                        DebyeCalculator for the NumPy implementation.
         """
-        from diffpy.srreal.pdfcalculator import DebyePDFCalculator
+        if calculator is None:
+            from diffpy.srreal.pdfcalculator import DebyePDFCalculator
+            calculator = DebyePDFCalculator()
         BasePDFGenerator.__init__(self, name)
-        self._setCalculator(DebyePDFCalculator())
+        self._setCalculator(calculator)
         return
 
+
+    def parallel(self, ncpu, mapfunc = None):
+        """Run calculation in parallel.
+
+        ncpu    -- Number of parallel processes.  Revert to serial mode when 1.
+                   This is the number of threads for DebyeCalculator.
+        mapfunc -- A mapping function to use.  See BasePDFGenerator.parallel.
+                   This is ignored for DebyeCalculator.
+
+        No return value.
+        """
+        if isinstance(self._calc, DebyeCalculator):
+            self._calc.nthreads = max(1, ncpu)
+            return
+        return BasePDFGenerator.parallel(self, ncpu, mapfunc)
+
+
+    def _getCalculatorStructure(self):
+        """Get the structure object for the calculator.
+
+        DebyeCalculator uses the structure object of the phase directly.
+        """
+        if isinstance(self._calc, DebyeCalculator):
+            return self._phase.stru
+        return BasePDFGenerator._getCalculatorStructure(self)
+
 # End class DebyePDFGenerator
 
 # End of file
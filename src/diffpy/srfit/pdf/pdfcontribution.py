@@ -22,6 +22,7 @@ __all__ = ["PDFContribution"]
 
 from diffpy.srfit.fitbase import FitContribution
 from diffpy.srfit.fitbase import Profile
+from diffpy.srfit.pdf.phasesum import PhaseSumOperator
 
 class PDFContribution(FitContribution):
     """PDFContribution class.
@@ -54,6 +55,10 @@ class PDFContribution(FitContribution):
     _xname          --  Name of the x-variable
     _yname          --  Name of the y-variable
     _dyname         --  Name of the dy-variable
+    _phasesum       --  PhaseSumOperator that sums the PDFs of the phases
+                        in a multi-phase fit.  It is available as
+                        "phasesum" in the equation.  The sum keeps the
+                        floating point type of the profile, see setDtype.
 
     Managed Parameters:
     scale   --  Scale factor
@@ -80,6 +85,7 @@ class PDFContribution(FitContribution):
         # Profile-related parameters that will be shared between the generators
         self.newParameter("qdamp", 0)
         self.newParameter("qbroad", 0)
+        self._phasesum = PhaseSumOperator()
         return
 
     # Data methods
@@ -240,10 +246,15 @@ class PDFContribution(FitContribution):
         self.addProfileGenerator(gen)
 
         # Set the proper equation for the fit, depending on the number of
-        # phases we have.
-        gnames = self._generators.keys()
-        eqstr = " + ".join(gnames)
-        eqstr = "scale * (%s)" % eqstr
+        # phases we have.  Multiple phases are added in place by the phasesum
+        # operator.  The phase fractions are given by the generator scales.
+        self._phasesum.addPhase(gen)
+        gnames = list(self._generators.keys())
+        if len(gnames) > 1:
+            self._eqfactory.registerOperator("phasesum", self._phasesum)
+            eqstr = "scale * phasesum"
+        else:
+            eqstr = "scale * (%s)" % gnames[0]
         self.setEquation(eqstr)
 
         # Update with our metadata
@@ -255,6 +266,60 @@ class PDFContribution(FitContribution):
         self.constrain(gen.qbroad, self.qbroad)
         return
 
+    def makeWindowContributions(self, windows, name = None):
+        """Create contributions that fit r-windows of the data.
+
+        Each new PDFContribution holds the observed data of this
+        contribution over one window and generators that share the phases
+        of this contribution.  It has the same floating point type.  The
+        generators calculate the PDF over the union of the windows (see
+        BasePDFGenerator.setFullRange), so that when all contributions are
+        added to one FitRecipe the windows are refined together from a
+        single PDF calculation per phase.  This requires the generators of
+        different windows to have the same configuration, e.g. by
+        constraining their delta2 to one variable.
+
+        windows --  List of (rmin, rmax) pairs of the window ranges.
+        name    --  Prefix of the contribution names.  The contributions are
+                    named "<name>_w0", "<name>_w1", etc.  Use the name of
+                    this contribution when None (default).
+
+        Return a list of the new PDFContributions.
+
+        Raises AttributeError if there is no observed data.
+        Raises ValueError if a window is empty.
+        """
+        import copy
+        if name is None:
+            name = self.name
+        prof = self.profile
+        rv = []
+        for i, (rmin, rmax) in enumerate(windows):
+            wc = PDFContribution("%s_w%i" % (name, i))
+            wc._meta.update(self._meta)
+            wc.setDtype(self.getDtype())
+            wc.profile.setObservedProfile(prof.xobs, prof.yobs, prof.dyobs)
+            wc.profile.meta.update(prof.meta)
+            wc.setCalculationRange(rmin, rmax)
+            if not len(wc.profile.x):
+                raise ValueError("Window (%s, %s) has no data." % (rmin, rmax))
+            for pname in ("scale", "qdamp", "qbroad"):
+                wc.get(pname).setValue(self.get(pname).getValue())
+            rv.append(wc)
+        # full range is the union of the window grids
+        xs = [wc.profile.x for wc in rv]
+        xlong = max(xs, key=len)
+        rstep = (xlong[-1] - xlong[0]) / max(len(xlong) - 1, 1) or 0.01
+        fullrange = (min(x[0] for x in xs), max(x[-1] for x in xs), rstep)
+        for wc in rv:
+            for gen in self._generators.values():
+                calc = copy.copy(getattr(gen._calc, 'pqobj', gen._calc))
+                wgen = type(gen)(gen.name, calculator=calc)
+                wgen.setPhase(gen.phase, gen.phase.usingSymmetry())
+                wgen.setFullRange(*fullrange)
+                wc._setupGenerator(wgen)
+        return rv
+
     # Calculation setup methods
 
     def _getMetaValue(self, kwd):
@@ -66,12 +66,18 @@ class PDFGenerator(BasePDFGenerator):
 
     """
 
-    def __init__(self, name = "pdf"):
+    def __init__(self, name = "pdf", calculator = None):
         """Initialize the generator.
+
+        name        --  The name of the generator (default "pdf").
+        calculator  --  The PDF calculator.  Use a new srreal PDFCalculator
+                        when None (default).
         """
-        from diffpy.srreal.pdfcalculator import PDFCalculator
+        if calculator is None:
+            from diffpy.srreal.pdfcalculator import PDFCalculator
+            calculator = PDFCalculator()
         BasePDFGenerator.__init__(self, name)
-        self._setCalculator(PDFCalculator())
+        self._setCalculator(calculator)
         return
 
 # End class PDFGenerator
@@ -24,9 +24,10 @@ __all__ = ["PDFParser"]
 
 import re
 import numpy
+import six
 
 from diffpy.srfit.exceptions import ParseError
-from diffpy.srfit.fitbase.profileparser import ProfileParser
+from diffpy.srfit.fitbase.profileparser import ProfileParser, _decodeText
 
 class PDFParser(ProfileParser):
     """Class for holding a diffraction pattern.
@@ -90,24 +91,37 @@ class PDFParser(ProfileParser):
         Raises ParseError if the string cannot be parsed
 
         """
-        # useful regex patterns:
-        rx = { 'f' : r'[-+]?(\d+(\.\d*)?|\d*\.\d+)([eE][-+]?\d+)?' }
-        # find where does the data start
-        res = re.search(r'^#+ start data\s*(?:#.*\s+)*', patstring, re.M)
-        # start_data is position where the first data line starts
-        if res:
-            start_data = res.end()
-        else:
-            # find line that starts with a floating point number
-            regexp = r'^\s*%(f)s' % rx
-            res = re.search(regexp, patstring, re.M)
-            if res:
-                start_data = res.start()
-            else:
-                start_data = 0
+        start_data = _findDataStart(patstring)
         header = patstring[:start_data]
         databody = patstring[start_data:].strip()
+        self._parseHeader(header)
+        if not databody:
+            raise ParseError("The data section is empty.")
+        data = _loadDataBody(databody.split("\n"))
+        self._banks.append(self._makeBank(data))
+        return
+
+
+    def _parseBuffer(self, buf):
+        """Parse the header of a file and defer parsing of the data.
+
+        The data lines are read from the buffer in chunks when the bank is
+        selected, which parseFile does right away.  The file is thus never
+        decoded to one string.  See ProfileParser._parseBuffer.
+        """
+        start_data = _findDataStart(buf)
+        header = _decodeText(buf[:start_data])
+        self._parseHeader(header)
+        if not _rxnonblank.search(buf, start_data):
+            raise ParseError("The data section is empty.")
+        lines = _MappedLines(buf, start_data)
+        self._banks.append(lambda: self._makeBank(_loadDataBody(lines)))
+        return
+
 
+    def _parseHeader(self, header):
+        """Parse the header string and update the _meta dictionary."""
+        rx = { 'f' : _rxfloat }
         # find where the metadata starts
         metadata = ''
         res = re.search(r'^#+\ +metadata\b\n', header, re.M)
@@ -174,50 +188,111 @@ class PDFParser(ProfileParser):
                 else:
                     break
 
-        # read actual data - robs, Gobs, drobs, dGobs
-        inf_or_nan = re.compile('(?i)^[+-]?(NaN|Inf)\\b')
-        has_drobs = True
-        has_dGobs = True
-        # raise ParseError if something goes wrong
-        robs = []
-        Gobs = []
-        drobs = []
-        dGobs = []
-        try:
-            for line in databody.split("\n"):
-                v = line.split()
-                # there should be at least 2 value in the line
-                robs.append(float(v[0]))
-                Gobs.append(float(v[1]))
-                # drobs is valid if all values are defined and positive
-                has_drobs = (has_drobs and
-                        len(v) > 2 and not inf_or_nan.match(v[2]))
-                if has_drobs:
-                    v2 = float(v[2])
-                    has_drobs = v2 > 0.0
-                    drobs.append(v2)
-                # dGobs is valid if all values are defined and positive
-                has_dGobs = (has_dGobs and
-                        len(v) > 3 and not inf_or_nan.match(v[3]))
-                if has_dGobs:
-                    v3 = float(v[3])
-                    has_dGobs = v3 > 0.0
-                    dGobs.append(v3)
-        except (ValueError, IndexError) as err:
-            raise ParseError(err)
-        if has_drobs:
-            drobs = numpy.asarray(drobs)
-        else:
-            drobs = None
-        if has_dGobs:
-            dGobs = numpy.asarray(dGobs)
-        else:
-            dGobs = None
-
-        robs = numpy.asarray(robs)
-        Gobs = numpy.asarray(Gobs)
-
-        self._banks.append([robs, Gobs, drobs, dGobs])
         return
 
+
+    def _makeBank(self, data):
+        """Make the (robs, Gobs, drobs, dGobs) bank from the data array."""
+        robs = data[:, 0].copy()
+        Gobs = data[:, 1].copy()
+        # drobs and dGobs are valid if all values are finite and positive
+        drobs = dGobs = None
+        ncols = data.shape[1]
+        if ncols > 2 and _isValidUncertainty(data[:, 2]):
+            drobs = data[:, 2].copy()
+        if ncols > 3 and _isValidUncertainty(data[:, 3]):
+            dGobs = data[:, 3].copy()
+        return [robs, Gobs, drobs, dGobs]
+
 # End of PDFParser
+
+# Local helpers --------------------------------------------------------------
+
+_rxfloat = r'[-+]?(\d+(\.\d*)?|\d*\.\d+)([eE][-+]?\d+)?'
+_rxnonblank = re.compile(br'\S')
+
+
+def _findDataStart(text):
+    """Find the position of the first data line.
+
+    text    --  String or bytes-like object, such as a memory map, with the
+                content of a PDF file.
+
+    Return the offset of the first data line in text.
+    """
+    pstart = r'^#+ start data\s*(?:#.*\s+)*'
+    pfloat = r'^\s*' + _rxfloat
+    if not isinstance(text, six.string_types):
+        pstart = pstart.encode('ascii')
+        pfloat = pfloat.encode('ascii')
+    res = re.search(pstart, text, re.M)
+    if res:
+        return res.end()
+    # find line that starts with a floating point number
+    res = re.search(pfloat, text, re.M)
+    return res.start() if res else 0
+
+
+class _MappedLines(object):
+    """Iterable over the text lines of a buffer from the given offset.
+
+    The buffer is decoded in chunks of about chunksize bytes, so that the
+    lines can be read without a copy of the whole buffer.
+    """
+
+    chunksize = 1 << 20
+
+    def __init__(self, buf, start):
+        self.buf = buf
+        self.start = start
+        return
+
+    def __iter__(self):
+        buf = self.buf
+        pos = self.start
+        n = len(buf)
+        while pos < n:
+            end = buf.find(b"\n", min(pos + self.chunksize, n))
+            end = n if end < 0 else end + 1
+            for line in _decodeText(buf[pos:end]).splitlines():
+                yield line
+            pos = end
+        return
+
+
+def _loadDataBody(lines):
+    """Convert the data lines to a 2-D array of floats.
+
+    lines   --  List or iterable of the data lines.  Blank lines are
+                ignored.  The lines are iterated over again if they have
+                different numbers of columns, in which case the missing
+                values of the shorter lines are filled with NaN.
+
+    Return an array of shape (nlines, ncols), where ncols >= 2.
+
+    Raises ParseError if a line has less than 2 columns or contains a value
+    that is not a number.
+    """
+    try:
+        data = numpy.loadtxt(lines, dtype=float, comments=None, ndmin=2)
+    except ValueError:
+        # lines have different numbers of columns or invalid values
+        rows = [v for v in (line.split() for line in lines) if v]
+        if min(len(v) for v in rows) < 2:
+            raise ParseError("Data lines must have at least 2 columns.")
+        ncols = max(len(v) for v in rows)
+        nan = ['nan']
+        rows = [v + (ncols - len(v)) * nan for v in rows]
+        try:
+            data = numpy.array(rows, dtype=float)
+        except ValueError as err:
+            raise ParseError(err)
+    if data.shape[1] < 2:
+        raise ParseError("Data lines must have at least 2 columns.")
+    return data
+
+
+def _isValidUncertainty(du):
+    """Check if all values in the uncertainty array are finite and positive.
+    """
+    return bool(numpy.all(numpy.isfinite(du) & (du > 0)))
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2008 The Trustees of Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE_DANSE.txt for license information.
+#
+##############################################################################
+
+"""PhaseSumOperator for the weighted sum of many phase profiles.
+
+The PhaseSumOperator accumulates the profiles of its phases in one
+preallocated array of the floating point type of the phase profiles.  When
+only some phases change, their previous contributions are subtracted from
+the sum and the new ones added, so that unchanged phases are not summed
+again.  The changed phases and weights are those that notified the operator
+since its last evaluation.
+"""
+
+__all__ = ["PhaseSumOperator"]
+
+import numpy
+
+from diffpy.srfit.equation.literals.operators import Operator
+
+
+class PhaseSumOperator(Operator):
+    """Operator that sums the profiles of phases with optional weights.
+
+    Use the addPhase method to add the phase Literals, such as
+    ProfileGenerators, and their weights.  The value of the operator is an
+    array that is updated in place by the next evaluation, it must be
+    copied if it needs to be kept.
+
+    Attributes
+    maxupdates  --  Number of incremental updates after which the sum is
+                    recalculated from all phases to remove the accumulated
+                    round-off error (default 64).
+    _layout     --  List of (iphase, iweight) indices of the phase and
+                    weight arguments.  iweight is None for unit weight.
+    _buffer     --  Array with the sum of the phase profiles or None.
+    _scratch    --  Work array for a weighted phase profile or None.
+    _terms      --  List of (profile, weight) pairs from the last evaluation.
+    _changed    --  Set of the indices of arguments that changed since the
+                    last evaluation.
+    _nupdates   --  Number of incremental updates since the sum was last
+                    recalculated.
+    """
+
+    name = "phasesum"
+    symbol = "phasesum"
+    nin = -1
+    nout = 1
+
+    maxupdates = 64
+
+    def __init__(self, name=None):
+        """Initialize the operator.
+
+        name    --  Name of the operator (default "phasesum").
+        """
+        Operator.__init__(self, name)
+        self._layout = []
+        self._buffer = None
+        self._scratch = None
+        self._terms = []
+        self._changed = set()
+        self._nupdates = 0
+        return
+
+
+    def addPhase(self, phase, weight=None):
+        """Add a phase to the sum.
+
+        phase   --  Literal that evaluates to the phase profile, for example
+                    a ProfileGenerator.
+        weight  --  Literal with the weight of the phase, for example its
+                    fraction Parameter.  Use unit weight when None (default).
+
+        Raises ValueError if the phase or weight causes a self-reference.
+        """
+        self.addLiteral(phase)
+        iphase = len(self.args) - 1
+        iweight = None
+        if weight is not None:
+            self.addLiteral(weight)
+            iweight = len(self.args) - 1
+        self._layout.append((iphase, iweight))
+        self._terms = []
+        return
+
+
+    def operation(self, *vals):
+        """Update and return the sum of the weighted phase profiles."""
+        if not self._layout:
+            return 0.0
+        ys = [numpy.asarray(vals[ip]) for ip, iw in self._layout]
+        ws = [1.0 if iw is None else vals[iw] for ip, iw in self._layout]
+        shape = numpy.broadcast(*ys).shape
+        dtype = numpy.result_type(*ys)
+        if dtype.kind not in "fc":
+            dtype = numpy.dtype(float)
+        changed = [i for i in range(len(ys)) if self._isChangedTerm(i)]
+        # phase profiles updated in place have lost their old values
+        inplace = any(self._layout[i][0] in self._changed and
+                      ys[i] is self._terms[i][0] for i in changed
+                      if i < len(self._terms))
+        self._changed.clear()
+        rebuild = (self._buffer is None or self._buffer.shape != shape or
+                   self._buffer.dtype != dtype or inplace or
+                   2 * len(changed) > len(ys) or
+                   self._nupdates >= self.maxupdates)
+        if rebuild:
+            self._buffer = numpy.zeros(shape, dtype=dtype)
+            self._scratch = numpy.empty(shape, dtype=dtype)
+            for y, w in zip(ys, ws):
+                self._buffer += numpy.multiply(y, w, out=self._scratch)
+            self._nupdates = 0
+        elif changed:
+            for i in changed:
+                y0, w0 = self._terms[i]
+                self._buffer -= numpy.multiply(y0, w0, out=self._scratch)
+                self._buffer += numpy.multiply(ys[i], ws[i],
+                                               out=self._scratch)
+            self._nupdates += 1
+        self._terms = list(zip(ys, ws))
+        return self._buffer
+
+
+    def _flush(self, other):
+        """Record the changed argument and invalidate the sum."""
+        source = other[0] if other else None
+        for i, arg in enumerate(self.args):
+            if arg is source:
+                self._changed.add(i)
+        Operator._flush(self, other)
+        return
+
+
+    def _isChangedTerm(self, i):
+        """Check if phase i or its weight changed since the last sum."""
+        if i >= len(self._terms):
+            return True
+        iphase, iweight = self._layout[i]
+        return iphase in self._changed or iweight in self._changed
+
+# End class PhaseSumOperator
+
+# End of file
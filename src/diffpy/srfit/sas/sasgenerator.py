@@ -30,6 +30,8 @@ class SASGenerator(ProfileGenerator):
 
     Attributes:
     _model      --  BaseModel object this adapts.
+    pointwise   --  True, I(Q) is calculated independently at each Q, so
+                    that it can be evaluated in chunks of the profile.
 
     Managed Parameters:
     These depend on the parameters of the BaseModel object held by _model. They
@@ -40,6 +42,8 @@ class SASGenerator(ProfileGenerator):
 
     """
 
+    pointwise = True
+
     def __init__(self, name, model):
         """Initialize the generator.
 
@@ -70,13 +70,15 @@ class SASParser(ProfileParser):
 
     _format = "SAS"
 
-    def parseFile(self, filename):
+    def parseFile(self, filename, cache=False):
         """Parse a file and set the _x, _y, _dx, _dy and _meta variables.
 
         This wipes out the currently loaded data and selected bank number.
 
         Arguments
         filename    --  The name of the file to parse
+        cache       --  Ignored.  The datainfo metadata cannot be stored in
+                        the on-disk cache.
 
         Raises IOError if the file cannot be read
         Raises ParseError if the file cannot be parsed
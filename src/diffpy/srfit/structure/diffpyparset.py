@@ -32,6 +32,7 @@ __all__ = ["DiffpyStructureParSet"]
 
 from diffpy.srfit.fitbase.parameter import ParameterProxy
 from diffpy.srfit.fitbase.parameter import ParameterAdapter
+from diffpy.srfit.fitbase.parameter import ArrayAdapterGroup
 from diffpy.srfit.fitbase.parameterset import ParameterSet
 from diffpy.srfit.structure.srrealparset import SrRealParSet
 from diffpy.srfit.util.argbinders import bind2nd
@@ -206,6 +207,10 @@ class DiffpyLatticeParSet(ParameterSet):
 # End class DiffpyLatticeParSet
 
 
+# Independent U-tensor elements in the order U11, U22, U33, U12, U13, U23
+_uijindices = ((0, 0), (1, 1), (2, 2), (0, 1), (0, 2), (1, 2))
+
+
 class DiffpyStructureParSet(SrRealParSet):
     """A wrapper for diffpy.structure.Structure.
 
@@ -215,6 +220,13 @@ class DiffpyStructureParSet(SrRealParSet):
     Attributes:
     atoms   --  The list of DiffpyAtomParSets, provided for convenience.
     stru    --  The diffpy.structure.Structure this is adapting
+    xyzgroup -- ArrayAdapterGroup of the x, y, z Parameters of all atoms
+                over Structure.xyz. Use xyzgroup.setValues to update all
+                positions in one assignment.
+    Ugroup  --  ArrayAdapterGroup of the U11, U22, U33, U12, U13, U23
+                Parameters over Structure.U. Only atoms that are anisotropic
+                when the structure is adapted are included, as isotropic
+                atoms derive their U tensor from Uiso.
 
     Managed ParameterSets:
     lattice     --  The managed DiffpyLatticeParSet
@@ -251,6 +263,18 @@ class DiffpyStructureParSet(SrRealParSet):
             self.addParameterSet(atom)
             self.atoms.append(atom)
 
+        self.xyzgroup = ArrayAdapterGroup(stru, "xyz")
+        self.Ugroup = ArrayAdapterGroup(stru, "U")
+        for i, atom in enumerate(self.atoms):
+            for j, pname in enumerate(("x", "y", "z")):
+                self.xyzgroup.addAdapter(atom.get(pname), (i, j))
+            if not atom.atom.anisotropy:
+                continue
+            for j, k in _uijindices:
+                pname = "U%i%i" % (j + 1, k + 1)
+                mirrors = [(i, k, j)] if j != k else []
+                self.Ugroup.addAdapter(atom.get(pname), (i, j, k), *mirrors)
+
         return
 
     def __repr__(self):
@@ -426,6 +426,188 @@ def profileTest():
 
     return
 
+def _legacyParseDataBody(databody):
+    """Parse the PDF data lines one by one as the former PDFParser."""
+    import re
+    inf_or_nan = re.compile('(?i)^[+-]?(NaN|Inf)\\b')
+    has_drobs = True
+    has_dGobs = True
+    robs = []
+    Gobs = []
+    drobs = []
+    dGobs = []
+    for line in databody.split("\n"):
+        v = line.split()
+        robs.append(float(v[0]))
+        Gobs.append(float(v[1]))
+        has_drobs = (has_drobs and
+                len(v) > 2 and not inf_or_nan.match(v[2]))
+        if has_drobs:
+            v2 = float(v[2])
+            has_drobs = v2 > 0.0
+            drobs.append(v2)
+        has_dGobs = (has_dGobs and
+                len(v) > 3 and not inf_or_nan.match(v[3]))
+        if has_dGobs:
+            v3 = float(v[3])
+            has_dGobs = v3 > 0.0
+            dGobs.append(v3)
+    drobs = numpy.asarray(drobs) if has_drobs else None
+    dGobs = numpy.asarray(dGobs) if has_dGobs else None
+    return numpy.asarray(robs), numpy.asarray(Gobs), drobs, dGobs
+
+def speedTestPDFParser(npoints = 100000):
+    """Compare PDFParser with the line-by-line parsing of the data."""
+    from diffpy.srfit.pdf import PDFParser
+
+    r = numpy.arange(1, npoints + 1) * 0.01
+    g = numpy.sin(r)
+    dg = 0.01 + 0.001 * numpy.random.random(npoints)
+    lines = ["%g %g 0 %g" % v for v in zip(r, g, dg)]
+    header = "# PDFgetX3\nqmax=25.0\n#### start data\n#S 1\n#L r G dr dG\n"
+    databody = "\n".join(lines)
+    patstring = header + databody
+
+    parser = PDFParser()
+    tnew = timeFunction(parser.parseString, patstring)
+    told = timeFunction(_legacyParseDataBody, databody)
+    x, y, dx, dy = parser.getData()
+    xo, yo, dxo, dyo = _legacyParseDataBody(databody)
+    assert numpy.array_equal(x, xo) and numpy.array_equal(y, yo)
+    assert dx is dxo is None and numpy.array_equal(dy, dyo)
+
+    print("Parse %i data points (ms):" % npoints)
+    print("line-by-line: ", told)
+    print("PDFParser: ", tnew)
+    print("ratio: ", told/tnew)
+
+    return
+
+def speedTestChunkedResidual(npoints = 2000000, chunksize = 65536):
+    """Compare peak memory of the full and chunked residual evaluation."""
+    import time
+    import tracemalloc
+    from diffpy.srfit.fitbase import FitContribution, FitRecipe, Profile
+
+    xobs = numpy.linspace(0, 100, npoints)
+    profile = Profile()
+    profile.setObservedProfile(xobs, numpy.sin(xobs), 0.1 + 0 * xobs)
+    fc = FitContribution("c")
+    fc.setProfile(profile)
+    fc.setEquation("A * sin(k * x) * exp(-x / 50) + B")
+    recipe = FitRecipe()
+    recipe.addContribution(fc)
+    recipe.addVar(fc.A, 1)
+    recipe.addVar(fc.k, 1)
+    recipe.addVar(fc.B, 0)
+    recipe.setResidualCacheSize(0)
+
+    def _measure(p):
+        recipe.residual(p)
+        tracemalloc.start()
+        t0 = time.time()
+        chiv = recipe.residual(numpy.add(p, 0.01))
+        t1 = time.time()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return chiv, peak, 1000 * (t1 - t0)
+
+    chiv0, mfull, tfull = _measure([1, 1, 0])
+    fc.setChunkSize(chunksize)
+    chiv1, mchunk, tchunk = _measure([1, 1, 0])
+    assert numpy.allclose(chiv0, chiv1)
+
+    print("Residual of %i points, chunksize %i:" % (npoints, chunksize))
+    print("full peak memory (MB), time (ms): ", mfull / 1e6, tfull)
+    print("chunked peak memory (MB), time (ms): ", mchunk / 1e6, tchunk)
+    print("memory ratio: ", mfull / float(mchunk))
+
+    return
+
+def speedTestFloat32(npoints = 2000000, nevals = 20):
+    """Compare throughput and accuracy of float32 and float64 residuals."""
+    import time
+    from diffpy.srfit.fitbase import FitContribution, FitRecipe, Profile
+    from diffpy.srfit.fitbase import ProfileGenerator
+
+    class _Damped(ProfileGenerator):
+        pointwise = True
+        def __init__(self):
+            ProfileGenerator.__init__(self, "g")
+            self.newParameter("k", 1.0)
+            self.newParameter("tau", 50.0)
+        def __call__(self, x):
+            return numpy.sin(self.k.value * x) * numpy.exp(-x / self.tau.value)
+
+    xobs = numpy.linspace(0, 100, npoints)
+    profile = Profile()
+    yobs = numpy.sin(1.01 * xobs) * numpy.exp(-xobs / 50)
+    profile.setObservedProfile(xobs, yobs, 0.01 + 0 * xobs)
+    fc = FitContribution("c")
+    fc.setProfile(profile)
+    gen = _Damped()
+    fc.addProfileGenerator(gen)
+    fc.setEquation("A * g + B")
+    recipe = FitRecipe()
+    recipe.addContribution(fc)
+    recipe.addVar(fc.A, 1)
+    recipe.addVar(fc.B, 0)
+    recipe.addVar(gen.k, 1)
+    recipe.setResidualCacheSize(0)
+
+    def _measure():
+        p = numpy.array([1.0, 0.0, 1.0])
+        chiv = recipe.residual(p).copy()
+        t0 = time.time()
+        for i in range(nevals):
+            p[2] += 1e-3
+            recipe.residual(p)
+        t1 = time.time()
+        return chiv, 1000 * (t1 - t0) / nevals
+
+    chiv64, t64 = _measure()
+    fc.setDtype(numpy.float32)
+    chiv32, t32 = _measure()
+    c64 = numpy.dot(chiv64, chiv64)
+    c32 = numpy.dot(chiv32, chiv32)
+
+    print("Residual of %i points, float64 and float32 profiles:" % npoints)
+    print("float64 time per residual (ms): ", t64)
+    print("float32 time per residual (ms): ", t32)
+    print("speedup: ", t64 / t32)
+    print("max |chiv32 - chiv64|: ", numpy.fabs(chiv32 - chiv64).max())
+    print("relative chi2 difference: ", abs(c32 - c64) / c64)
+
+    return
+
+def speedTestCFCache(npoints = 200000, nevals = 10):
+    """Compare calculated and cached characteristic functions."""
+    import diffpy.srfit.pdf.characteristicfunctions as cf
+
+    r = numpy.arange(npoints) * 0.001
+    tests = (("sphericalCF", cf.sphericalCF, None, (30,)),
+             ("shellCF2", cf.shellCF2, cf.shellcache, (15, 5)),
+             ("spheroidalCF2", cf.spheroidalCF2, cf.spheroidalcache,
+                 (30, 1.3)),
+             ("lognormalSphericalCF", cf.lognormalSphericalCF,
+                 cf.lognormalcache, (30, 5)))
+
+    print("Characteristic functions of %i points (ms):" % npoints)
+    for name, f, cache, args in tests:
+        if cache is not None:
+            cache.resize(0)
+        tcalc = sum(timeFunction(f, r, *args) for i in range(nevals))
+        print(name, "calculated: ", tcalc / nevals)
+        if cache is None:
+            continue
+        cache.resize(4)
+        f(r, *args)
+        tcached = sum(timeFunction(f, r, *args) for i in range(nevals))
+        print(name, "cached: ", tcached / nevals)
+        print(name, "ratio: ", tcalc / tcached)
+
+    return
+
 
 if __name__ == "__main__":
     for i in range(1, 13):
@@ -13,13 +13,14 @@
 #
 ##############################################################################
 
-"""Tests for sas package."""
+"""Tests for characteristic functions and the sas package."""
 
 import unittest
 
 import numpy
 
 from diffpy.srfit.tests.utils import has_sas, _msg_nosas
+from diffpy.srfit.tests.utils import has_scipy, _msg_noscipy
 from diffpy.srfit.sas.sasimport import sasimport
 
 # Global variables to be assigned in setUp
@@ -152,5 +153,181 @@ class TestSASCF(unittest.TestCase):
 
 # End of class TestSASCF
 
+# ----------------------------------------------------------------------------
+
+@unittest.skipUnless(has_scipy, _msg_noscipy)
+class TestCFCache(unittest.TestCase):
+
+    def setUp(self):
+        global cf
+        import diffpy.srfit.pdf.characteristicfunctions as cf
+        for cache in (cf.spheroidalcache, cf.lognormalcache, cf.shellcache):
+            cache.clear()
+            cache.resetCounters()
+        return
+
+
+    def test_cache(self):
+        """check reuse of the calculated characteristic functions.
+        """
+        cache = cf.lognormalcache
+        r = numpy.arange(0, 60, 0.1)
+        f1 = cf.lognormalSphericalCF(r, 30, 5)
+        self.assertTrue(f1.flags.writeable)
+        f1 *= 2
+        f2 = cf.lognormalSphericalCF(r.copy(), 30, 5)
+        self.assertEqual(1, cache.hits)
+        self.assertFalse(f1 is f2)
+        self.assertTrue(f2.flags.writeable)
+        self.assertTrue(numpy.array_equal(f1, 2 * f2))
+        cf.lognormalSphericalCF(r, 30, 6)
+        cf.lognormalSphericalCF(r[:-1], 30, 5)
+        cf.lognormalSphericalCF(r + 0.05, 30, 5)
+        self.assertEqual(4, cache.misses)
+        # non-uniform grids are not cached
+        rn = r**1.5
+        fn = cf.lognormalSphericalCF(rn, 30, 5)
+        self.assertTrue(fn.flags.writeable)
+        self.assertEqual(4, len(cache))
+        self.assertEqual(4, cache.misses)
+        # cheap sphericalCF is not cached
+        fs = cf.sphericalCF(r, 30)
+        self.assertTrue(fs.flags.writeable)
+        self.assertFalse(fs is cf.sphericalCF(r, 30))
+        cf.spheroidalCF2(r, 30, 1.3)
+        cf.spheroidalCF2(r, 30, 1.3)
+        self.assertEqual(1, cf.spheroidalcache.hits)
+        cf.shellCF(r, 12.5, 5)
+        cf.shellCF2(r, 15, 5)
+        self.assertEqual(1, cf.shellcache.hits)
+        return
+
+
+    def test_cacheGain(self):
+        """check cached lookup is faster than the calculation.
+        """
+        import time
+        r = numpy.arange(0, 200, 0.001)
+        def _tmin(f, *args):
+            rv = []
+            for i in range(3):
+                t0 = time.time()
+                f(*args)
+                rv.append(time.time() - t0)
+            return min(rv)
+        for f, cache in ((cf.lognormalSphericalCF, cf.lognormalcache),
+                         (cf.spheroidalCF2, cf.spheroidalcache),
+                         (cf.shellCF2, cf.shellcache)):
+            cache.resize(0)
+            tcalc = _tmin(f, r, 30, 1.3)
+            cache.resize(4)
+            f(r, 30, 1.3)
+            tcached = _tmin(f, r, 30, 1.3)
+            self.assertTrue(tcached < 0.5 * tcalc)
+        return
+
+
+    def test_batch(self):
+        """check characteristic functions for arrays of shape parameters.
+        """
+        r = numpy.arange(0, 60, 0.1)
+        psize = numpy.array([20.0, 30.0, 40.0])
+        for f, args in ((cf.sphericalCF, (psize,)),
+                        (cf.spheroidalCF2, (psize, 1.3)),
+                        (cf.lognormalSphericalCF, (psize, [[4], [5]])),
+                        (cf.shellCF2, (psize, 5))):
+            fb = f(r, *args)
+            pa = numpy.broadcast_arrays(*args)
+            self.assertEqual(pa[0].shape + r.shape, fb.shape)
+            for idx in numpy.ndindex(pa[0].shape):
+                fi = f(r, *[a[idx] for a in pa])
+                self.assertTrue(numpy.allclose(fi, fb[idx]))
+        return
+
+
+    def test_SASCFTransform(self):
+        """check SASCF reuses the transformation setup.
+        """
+        model = _SphereModel(25.0)
+        ff = cf.SASCF("sphere", model)
+        r = numpy.arange(1, 60, 0.1)
+        fr1 = ff(r)
+        fr2 = cf.sphericalCF(r, 2 * model.radius)
+        res = numpy.dot(fr1 - fr2, fr1 - fr2) / numpy.dot(fr2, fr2)
+        self.assertAlmostEqual(0, res, 4)
+        model.radius = 26.0
+        fr1 = ff(r)
+        self.assertEqual(1, ff._transforms.hits)
+        fr2 = cf.sphericalCF(r, 2 * model.radius)
+        res = numpy.dot(fr1 - fr2, fr1 - fr2) / numpy.dot(fr2, fr2)
+        self.assertAlmostEqual(0, res, 4)
+        return
+
+
+    def test_SASCFBaseline(self):
+        """check SASCF agrees with the complex FFT transformation.
+        """
+        r = numpy.arange(0, 30, 0.05)
+        for radius in (25.0, 40.0, 41.3):
+            model = _SphereModel(radius)
+            ff = cf.SASCF("sphere", model)
+            fr = ff(r)
+            fr0 = _legacySASCF(model, r)
+            self.assertTrue(numpy.allclose(fr0, fr, rtol=1e-10, atol=1e-12))
+        return
+
+# End of class TestCFCache
+
+# Local helpers --------------------------------------------------------------
+
+class _SphereModel(object):
+    """Minimal sas model of the sphere form factor."""
+
+    params = {}
+    dispersion = {}
+
+    def __init__(self, radius):
+        self.radius = radius
+        return
+
+    def calculate_ER(self):
+        return self.radius
+
+    def evalDistribution(self, q):
+        x = q * self.radius
+        return (3 * (numpy.sin(x) - x * numpy.cos(x)) / x**3)**2
+
+# End of class _SphereModel
+
+
+def _legacySASCF(model, r):
+    """Calculate SASCF characteristic function with the complex FFT.
+
+    This is the original SASCF transformation of the full q-grid.
+    """
+    from numpy.fft import ifft, fftfreq
+    dr = min(0.01, r[1] - r[0])
+    ed = 2 * model.calculate_ER()
+    rmax = max(ed, 2 * r[-1])
+    dq = numpy.pi / rmax
+    qmax = numpy.pi / dr
+    numpoints = int(2**(numpy.ceil(numpy.log2(qmax/dq))))
+    qmax = dq * numpoints
+    q = fftfreq(int(qmax/dq)) * qmax
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        fq = q * model.evalDistribution(q)
+    fq[0] = 0
+    rp = fftfreq(numpoints) * 2 * numpy.pi / dq
+    gr = ifft(fq).imag
+    frp = numpy.zeros_like(gr)
+    frp[1:] = gr[1:] / rp[1:]
+    nhalf = numpoints // 2
+    fr = numpy.interp(r, rp[:nhalf], gr[:nhalf])
+    vmask = (r != 0)
+    fr[vmask] /= r[vmask]
+    fr /= 2 * frp[2] - frp[1]
+    fr[~vmask] = 1
+    return fr
+
 if __name__ == "__main__":
     unittest.main()
@@ -17,7 +17,8 @@
 
 import unittest
 
-from numpy import arange, dot, array_equal, sin
+from numpy import arange, dot, array_equal, sin, allclose
+from numpy import finfo, float32, float64
 
 from diffpy.srfit.fitbase.fitcontribution import FitContribution
 from diffpy.srfit.fitbase.profilegenerator import ProfileGenerator
@@ -295,5 +296,121 @@ class TestContribution(unittest.TestCase):
         return
 
 
+    def test_chunkedResidual(self):
+        """check residual evaluation over chunks of the profile.
+        """
+        from diffpy.srfit.fitbase import FitRecipe
+        fc = self.fitcontribution
+        x = arange(0, 10, 0.01)
+        self.profile.setObservedProfile(x, sin(x), 0.5 + 0 * x)
+        fc.setProfile(self.profile)
+        gen = _SineGenerator("g")
+        fc.addProfileGenerator(gen)
+        fc.setEquation("A * g + B * x")
+        fc.A.value, fc.B.value = 2, 0.1
+        recipe = FitRecipe()
+        recipe.addContribution(fc)
+        recipe.addVar(gen.k, 1.1)
+        chiv0 = recipe.residual().copy()
+        ycalc0 = self.profile.ycalc
+        self.assertEqual(None, fc.getChunkSize())
+        self.assertFalse(fc.isChunked())
+        fc.setChunkSize(64)
+        self.assertTrue(fc.isChunked())
+        recipe.setResidualCacheSize(0)
+        chiv1 = recipe.residual([1.1])
+        self.assertTrue(allclose(chiv0, chiv1))
+        self.assertTrue(allclose(ycalc0, self.profile.ycalc))
+        self.assertEqual(len(x), len(self.profile.x))
+        self.assertTrue(self.profile.x is fc.x.value)
+        chiv2 = recipe.residual([0.9])
+        self.assertFalse(allclose(chiv0, chiv2))
+        self.assertTrue(allclose(chiv0, recipe.residual([1.1])))
+        # the chunks do not change the profile arrays
+        xversion = self.profile.xversion
+        recipe.residual([0.8])
+        self.assertEqual(xversion, self.profile.xversion)
+        # pointwise generators are required
+        gen.pointwise = False
+        fc.setEquation("A * g + B * x")
+        self.assertFalse(fc.isChunked())
+        gen.pointwise = True
+        # non-pointwise functions or residual are evaluated at once
+        fc.setEquation("A * g + B * sum(x)")
+        self.assertFalse(fc.isChunked())
+        fc.setEquation("A * g + B * x")
+        fc.setResidualEquation("resv")
+        self.assertFalse(fc.isChunked())
+        fc.setResidualEquation("chiv")
+        self.assertTrue(fc.isChunked())
+        fc.setChunkSize(None)
+        self.assertFalse(fc.isChunked())
+        self.assertRaises(ValueError, fc.setChunkSize, 0)
+        return
+
+
+    def test_setDtype(self):
+        """check accuracy of single precision contributions.
+
+        The profile and generator output are kept in float32, the residual
+        and the fit results are calculated in float64.  The float32 results
+        agree with the default float64 mode within the single precision
+        round-off, i.e., about 1e-6 relative to the profile values.
+        """
+        from diffpy.srfit.fitbase import FitRecipe, FitResults
+        fc = self.fitcontribution
+        self.assertEqual(float64, fc.getDtype())
+        self.assertRaises(SrFitError, fc.setDtype, float32)
+        x = arange(0, 10, 0.001)
+        self.profile.setObservedProfile(x, sin(1.02 * x), 0.05 + 0 * x)
+        fc.setProfile(self.profile)
+        gen = _SineGenerator("g")
+        fc.addProfileGenerator(gen)
+        fc.setEquation("A * g + B")
+        fc.A.value = 0.98
+        recipe = FitRecipe()
+        recipe.addContribution(fc)
+        recipe.addVar(gen.k, 1)
+        recipe.addVar(fc.B, 0.01)
+        recipe.setResidualCacheSize(0)
+        self.assertEqual(finfo(float64).eps, recipe.getResidualEpsilon())
+        chiv64 = recipe.residual([1, 0.01])
+        res64 = FitResults(recipe)
+        fc.setDtype(float32)
+        self.assertEqual(float32, fc.getDtype())
+        self.assertEqual(finfo(float32).eps, recipe.getResidualEpsilon())
+        chiv32 = recipe.residual([1, 0.01])
+        self.assertEqual(float64, chiv32.dtype)
+        self.assertEqual(float32, gen.value.dtype)
+        self.assertEqual(float32, self.profile.ycalc.dtype)
+        # chiv = (ycalc - y) / dy has the float32 error of ycalc / dy
+        self.assertTrue(allclose(chiv64, chiv32, rtol=0, atol=1e-4))
+        res32 = FitResults(recipe)
+        self.assertAlmostEqual(1, res32.chi2 / res64.chi2, 5)
+        self.assertAlmostEqual(1, res32.rw / res64.rw, 5)
+        self.assertTrue(allclose(res64.varunc, res32.varunc, rtol=1e-3))
+        # chunked evaluation keeps the dtype
+        fc.setChunkSize(1000)
+        self.assertTrue(allclose(chiv32, recipe.residual([1, 0.01])))
+        self.assertEqual(float32, self.profile.ycalc.dtype)
+        return
+
+# End of class TestContribution
+
+
+class _SineGenerator(ProfileGenerator):
+    """Pointwise-separable generator for the chunked evaluation test."""
+
+    pointwise = True
+
+    def __init__(self, name):
+        ProfileGenerator.__init__(self, name)
+        self.newParameter("k", 1.0)
+        return
+
+    def __call__(self, x):
+        return sin(self.k.value * x)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -128,6 +128,33 @@ class TestParameterAdapter(unittest.TestCase):
         return
 
 
+    def test_groups(self):
+        """Test xyzgroup and Ugroup of DiffpyStructureParSet.
+        """
+        a1 = Atom("C", [0, 0.2, 0.5], Uisoequiv=0.01)
+        a2 = Atom("O", [0.5, 0.5, 0.5], anisotropy=True,
+                  U=[[0.01, 0.002, 0], [0.002, 0.02, 0], [0, 0, 0.03]])
+        stru = Structure([a1, a2], lattice=Lattice(3, 4, 5, 90, 90, 90))
+        dsps = DiffpyStructureParSet("dsps", stru)
+        self.assertEqual(6, len(dsps.xyzgroup))
+        self.assertEqual(6, len(dsps.Ugroup))
+        flushed = []
+        dsps.addObserver(lambda semaphors: flushed.append(semaphors))
+        xyz = numpy.arange(6) / 10.0
+        dsps.xyzgroup.setValues(xyz)
+        self.assertTrue(numpy.array_equal(xyz.reshape(2, 3), stru.xyz))
+        self.assertEqual(0.4, dsps.O0.y.value)
+        self.assertEqual(2, len(flushed))
+        uij = [0.1, 0.2, 0.3, 0.04, 0.05, 0.06]
+        dsps.Ugroup.setValues(uij)
+        self.assertEqual(0.04, stru[1].U12)
+        self.assertEqual(0.04, dsps.O0.U21.value)
+        self.assertEqual(0.06, stru[1].U[2, 1])
+        self.assertTrue(numpy.allclose(uij, dsps.Ugroup.getValues()))
+        self.assertEqual(0.01, stru[0].Uisoequiv)
+        return
+
+
     def test_pickling(self):
         """Test pickling of DiffpyStructureParSet.
         """
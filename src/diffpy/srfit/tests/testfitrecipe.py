@@ -240,6 +240,136 @@ class TestFitRecipe(unittest.TestCase):
         return
 
 
+    def testSnapshotRestore(self):
+        """Test the snapshot and restore methods."""
+        recipe = self.recipe
+        con = self.fitcontribution
+        recipe.addVar(con.A, 2)
+        recipe.addVar(con.k, 1, fixed=True)
+        recipe.newVar("B", 0.5)
+        recipe.constrain(con.c, "2 * B")
+        y0 = con.evaluate().copy()
+        state = recipe.snapshot()
+        # A, k, c and B are stored once, the profile arrays are skipped
+        self.assertEqual(4, len(state))
+        self.assertEqual(sorted([2, 1, 1, 0.5]), sorted(state))
+        recipe.residual([3, 0.7])
+        self.assertEqual(3, con.A.value)
+        self.assertEqual(1.4, con.c.value)
+        self.assertFalse(array_equal(y0, con.evaluate()))
+        recipe.restore(state)
+        self.assertEqual(2, con.A.value)
+        self.assertEqual(0.5, recipe.B.value)
+        self.assertEqual(1, con.c.value)
+        self.assertTrue(array_equal(y0, con.evaluate()))
+        self.assertRaises(ValueError, recipe.restore, state[:-1])
+        # layout is refreshed when recipe changes
+        recipe.newVar("D", 3)
+        self.assertEqual(5, len(recipe.snapshot()))
+        # and when a Parameter is added to a contribution
+        con.newParameter("E", 4)
+        state = recipe.snapshot()
+        self.assertEqual(6, len(state))
+        con.E.setValue(5)
+        recipe.restore(state)
+        self.assertEqual(4, con.E.value)
+        # observers of several changed Parameters are notified once
+        calls = []
+        def observer(other):
+            calls.append(other)
+            return
+        con.E.addObserver(observer)
+        con.k.addObserver(observer)
+        con.E.setValue(5)
+        con.k.setValue(2)
+        del calls[:]
+        recipe.restore(state)
+        self.assertEqual(1, len(calls))
+        self.assertEqual(4, con.E.value)
+        self.assertEqual(1, con.k.value)
+        self.assertFalse('notify' in vars(con.E))
+        return
+
+    def testDumpsLoads(self):
+        """Test serialization with the dumps and loads methods."""
+        recipe = self.recipe
+        con = self.fitcontribution
+        recipe.addVar(con.A, 2, tag="amp")
+        recipe.addVar(con.k, 1, fixed=True)
+        recipe.newVar("B", 0.5)
+        recipe.constrain(con.c, "2 * B")
+        chiv = recipe.residual()
+        data = recipe.dumps()
+        recipe2 = FitRecipe.loads(data)
+        self.assertEqual(recipe.names, recipe2.names)
+        self.assertEqual(recipe.fixednames, recipe2.fixednames)
+        self.assertTrue(array_equal(chiv, recipe2.residual()))
+        self.assertTrue(array_equal(self.profile.x, recipe2.cont.profile.x))
+        recipe2.residual([3, 0.7])
+        self.assertEqual(1.4, recipe2.cont.c.value)
+        self.assertEqual(2, con.A.value)
+        recipe2.fix("amp")
+        self.assertEqual(["B"], recipe2.names)
+        # out-of-band buffers
+        buffers = []
+        data2 = recipe.dumps(buffers)
+        self.assertTrue(len(data2) <= len(data))
+        recipe3 = FitRecipe.loads(data2, buffers)
+        self.assertTrue(array_equal(chiv, recipe3.residual()))
+        self.assertRaises(ValueError, FitRecipe.loads, data2)
+        self.assertRaises(ValueError, FitRecipe.loads, b"invalid")
+        return
+
+    def testResidualCache(self):
+        """Test reuse of the residual for repeated variable values."""
+        recipe = self.recipe
+        con = self.fitcontribution
+        cache = recipe.residualcache
+        recipe.addVar(con.A, 2)
+        recipe.addVar(con.k, 1, fixed=True)
+        chiv1 = recipe.residual([3])
+        y1 = con.profile.ycalc.copy()
+        self.assertEqual(0, cache.hits)
+        self.assertTrue(array_equal(chiv1, recipe.residual([3])))
+        self.assertTrue(array_equal(chiv1, recipe.residual()))
+        self.assertEqual(2, cache.hits)
+        chiv2 = recipe.residual([4])
+        self.assertFalse(array_equal(chiv1, chiv2))
+        # returning to the older point restores values and ycalc
+        self.assertTrue(array_equal(chiv1, recipe.residual([3])))
+        self.assertEqual(3, cache.hits)
+        self.assertEqual(3, con.A.value)
+        self.assertTrue(array_equal(y1, con.profile.ycalc))
+        self.assertTrue(array_equal(chiv2, recipe.residual([4])))
+        self.assertEqual(4, cache.hits)
+        # revisit older points after evaluating others
+        chiv5 = recipe.residual([5])
+        y5 = con.profile.ycalc.copy()
+        self.assertTrue(array_equal(chiv1, recipe.residual([3])))
+        self.assertTrue(array_equal(chiv2, recipe.residual([4])))
+        self.assertTrue(array_equal(chiv5, recipe.residual([5])))
+        self.assertEqual(7, cache.hits)
+        self.assertTrue(array_equal(y5, con.profile.ycalc))
+        # cached ycalc is not changed with the profile array
+        con.profile.ycalc[:] = 0
+        recipe.residual([3])
+        self.assertTrue(array_equal(y1, con.profile.ycalc))
+        self.assertTrue(array_equal(chiv5, recipe.residual([5])))
+        self.assertTrue(array_equal(y5, con.profile.ycalc))
+        self.assertEqual(9, cache.hits)
+        # change of a fixed variable invalidates the cached values
+        nmiss = cache.misses
+        recipe.k.setValue(2)
+        chiv3 = recipe.residual([4])
+        self.assertEqual(nmiss + 1, cache.misses)
+        self.assertFalse(array_equal(chiv2, chiv3))
+        # disabled cache
+        recipe.setResidualCacheSize(0)
+        self.assertTrue(array_equal(chiv3, recipe.residual([4])))
+        self.assertEqual(0, len(cache))
+        self.assertRaises(ValueError, recipe.setResidualCacheSize, -1)
+        return
+
     def testPrintFitHook(self):
         "check output from default PrintFitHook."
         self.recipe.addVar(self.fitcontribution.c)
@@ -17,8 +17,11 @@
 
 import unittest
 
+import numpy
+
+from diffpy.srfit.fitbase import FitContribution, Profile
 from diffpy.srfit.fitbase.fitrecipe import FitRecipe
-from diffpy.srfit.fitbase.fitresults import initializeRecipe
+from diffpy.srfit.fitbase.fitresults import FitResults, initializeRecipe
 from diffpy.srfit.tests.utils import datafile
 
 
@@ -76,6 +79,57 @@ class TestInitializeRecipe(unittest.TestCase):
         self.assertAlmostEqual(self.x0val, recipe.x0.value)
         return
 
+# End of class TestInitializeRecipe
+
+# ----------------------------------------------------------------------------
+
+class TestFitResults(unittest.TestCase):
+
+    def setUp(self):
+        self.x = x = numpy.linspace(0, 10, 101)
+        profile = Profile()
+        profile.setObservedProfile(x, 2 * x + 1, 0.1 + 0 * x)
+        contribution = FitContribution("c")
+        contribution.setProfile(profile, xname="x")
+        contribution.setEquation("A * x + B")
+        self.recipe = recipe = FitRecipe()
+        recipe.addContribution(contribution)
+        recipe.addVar(contribution.A, 2.1)
+        recipe.addVar(contribution.B, 0.9)
+        return
+
+
+    def test_variablesRestored(self):
+        """check the Jacobian leaves the variables at their values.
+        """
+        recipe = self.recipe
+        res = FitResults(recipe)
+        self.assertEqual([2.1, 0.9], list(recipe.getValues()))
+        self.assertEqual([2.1, 0.9], list(res.varvals))
+        ycalc = 2.1 * self.x + 0.9
+        self.assertTrue(numpy.allclose(ycalc, recipe.c.profile.ycalc))
+        self.assertTrue(numpy.allclose(ycalc, res.conresults["c"].ycalc))
+        return
+
+
+    def test_perfectFitRw(self):
+        """check Rw of a perfect fit is zero.
+        """
+        recipe = self.recipe
+        recipe.residual([2, 1])
+        res = FitResults(recipe)
+        self.assertEqual(0, res.conresults["c"].rw)
+        self.assertEqual(0, res.rw)
+        self.assertEqual(0, res.chi2)
+        # Rw of the recipe agrees with the contribution
+        recipe.residual([2.1, 0.9])
+        res = FitResults(recipe)
+        self.assertTrue(res.rw > 0)
+        self.assertAlmostEqual(res.conresults["c"].rw, res.rw)
+        return
+
+# End of class TestFitResults
+
 if __name__ == "__main__":
 
     unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2010 The Trustees of Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE_DANSE.txt for license information.
+#
+##############################################################################
+
+"""Tests for multiresolution module."""
+
+import unittest
+
+import numpy
+
+from diffpy.srfit.fitbase import FitContribution, FitRecipe, Profile
+from diffpy.srfit.fitbase.multiresolution import MultiResolutionRefinement
+from diffpy.srfit.fitbase.multiresolution import nyquistStride
+
+
+def _gaussNewton(recipe, niter=10):
+    """Refine the recipe with Gauss-Newton steps.
+
+    Return the number of residual evaluations.
+    """
+    nfev = 0
+    for i in range(niter):
+        p = numpy.array(recipe.values)
+        r = recipe.residual(p)
+        J = numpy.empty((len(r), len(p)))
+        for j in range(len(p)):
+            h = 1e-6 * max(1, abs(p[j]))
+            dp = p.copy()
+            dp[j] += h
+            J[:, j] = (recipe.residual(dp) - r) / h
+        step = numpy.linalg.lstsq(J, -r, rcond=None)[0]
+        recipe.residual(p + step)
+        nfev += len(p) + 2
+        if numpy.all(numpy.fabs(step) < 1e-10 * (1 + numpy.fabs(p))):
+            break
+    return nfev
+
+
+class TestMultiResolutionRefinement(unittest.TestCase):
+
+    def setUp(self):
+        x = numpy.arange(0, 10.0005, 0.001)
+        y = 3 * numpy.exp(-0.5 * (x - 5.2)**2 / 0.7**2)
+        self.profile = profile = Profile()
+        profile.setObservedProfile(x, y)
+        profile.meta["qmax"] = 25.0
+        contribution = FitContribution("c")
+        contribution.setProfile(profile, xname="x")
+        contribution.setEquation("A * exp(-0.5 * (x - x0)**2 / w**2)")
+        self.recipe = recipe = FitRecipe()
+        recipe.addContribution(contribution)
+        recipe.addVar(contribution.A, 2.5)
+        recipe.addVar(contribution.x0, 5)
+        recipe.addVar(contribution.w, 0.8)
+        return
+
+
+    def test_nyquistStride(self):
+        """check nyquistStride()
+        """
+        x = numpy.arange(0, 10.0005, 0.001)
+        self.assertEqual(125, nyquistStride(x, 25))
+        self.assertEqual(1, nyquistStride(x, 1e4))
+        self.assertEqual(1, nyquistStride(x[:1], 25))
+        x = numpy.arange(0, 10, 0.1)
+        self.assertEqual(3, nyquistStride(x, numpy.pi / 0.3))
+        return
+
+
+    def test_schedule(self):
+        """check the decimation strides of the levels.
+        """
+        mr = MultiResolutionRefinement(self.recipe)
+        self.assertEqual([125, 62, 31, 15, 7, 3, 1], mr.strides["c"])
+        mr = MultiResolutionRefinement(self.recipe, qmax=5, factor=4)
+        self.assertEqual([628, 157, 39, 9, 2, 1], mr.strides["c"])
+        mr = MultiResolutionRefinement(self.recipe, strides=(8, 4))
+        self.assertEqual([8, 4, 1], mr.strides["c"])
+        self.assertRaises(ValueError, MultiResolutionRefinement,
+                          self.recipe, strides=(4, 0))
+        self.assertRaises(ValueError, MultiResolutionRefinement,
+                          self.recipe, factor=1)
+        del self.profile.meta["qmax"]
+        self.assertRaises(ValueError, MultiResolutionRefinement, self.recipe)
+        return
+
+
+    def test_run(self):
+        """check refinement from the coarse to full grid.
+        """
+        recipe = self.recipe
+        profile = self.profile
+        x0 = profile.x
+        mr = MultiResolutionRefinement(recipe, refine=_gaussNewton)
+        report = mr.run(compare=True)
+        self.assertTrue(numpy.allclose([3, 5.2, 0.7], recipe.getValues()))
+        # the coarse levels converge, the refinement ends on the full grid
+        self.assertEqual([125], report[0]["strides"])
+        self.assertEqual(81, report[0]["npoints"])
+        self.assertTrue(len(report) < len(mr.strides["c"]))
+        self.assertEqual([1], report[-1]["strides"])
+        self.assertEqual(len(x0), report[-1]["npoints"])
+        self.assertAlmostEqual(0, report[-1]["chi2"])
+        self.assertTrue(numpy.array_equal(x0, profile.x))
+        self.assertTrue(profile.x.flags.writeable)
+        # reference refinement from the same start
+        self.assertEqual(len(x0), mr.reference["npoints"])
+        self.assertTrue(mr.getTimingGain() > 0)
+        self.assertTrue("timing gain" in mr.formatReport())
+        return
+
+
+    def test_decimatedViews(self):
+        """check decimated calculation points are views of observed data.
+        """
+        profile = self.profile
+        profile.setCalculationPoints(profile.xobs[10:1001:7])
+        self.assertTrue(numpy.shares_memory(profile.x, profile.xobs))
+        self.assertTrue(numpy.shares_memory(profile.y, profile.yobs))
+        self.assertTrue(numpy.array_equal(profile.yobs[10:1001:7], profile.y))
+        self.assertTrue(profile.y.flags.writeable)
+        return
+
+# End of class TestMultiResolutionRefinement
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2010 The Trustees of Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE_DANSE.txt for license information.
+#
+##############################################################################
+
+"""
+Unit tests for the observable module.
+"""
+
+
+import unittest
+import pickle
+
+from diffpy.srfit.fitbase import FitContribution
+from diffpy.srfit.fitbase.parameter import Parameter, ParameterProxy
+from diffpy.srfit.util.observable import notifyAll
+from diffpy.srfit.util.weakrefcallable import weak_ref
+
+# ----------------------------------------------------------------------------
+
+class _CallSet(set):
+    """Set type that supports weak references."""
+    pass
+
+
+class TestObservable(unittest.TestCase):
+
+    def setUp(self):
+        self.f = FitContribution('f')
+        self.f.setEquation('7')
+        return
+
+
+    def test_addObserver(self):
+        """check Observable.addObserver() and removeObserver()
+        """
+        x = Parameter('x', 1)
+        feq = self.f._eq
+        x.addObserver(feq._flush)
+        x.addObserver(feq._flush)
+        x.addObserver(weak_ref(feq._flush))
+        self.assertEqual(1, len(x._observers))
+        self.assertTrue(x.hasObserver(feq._flush))
+        calls = []
+        x.addObserver(calls.append)
+        self.assertEqual(2, len(x._observers))
+        x.setValue(2)
+        self.assertEqual([(x,)], calls)
+        x.removeObserver(feq._flush)
+        self.assertFalse(x.hasObserver(feq._flush))
+        self.assertRaises(KeyError, x.removeObserver, feq._flush)
+        x.removeObserver(calls.append)
+        self.assertEqual(0, len(x._observers))
+        return
+
+
+    def test_proxy(self):
+        """check ParameterProxy shares observers with its Parameter.
+        """
+        x = Parameter('x', 1)
+        px = ParameterProxy('px', x)
+        px.addObserver(self.f._eq._flush)
+        self.assertTrue(x.hasObserver(self.f._eq._flush))
+        self.assertEqual(1, len(x._observers))
+        return
+
+
+    def test_builtinMethod(self):
+        """check weak registration of builtin bound methods.
+        """
+        x = Parameter('x', 1)
+        calls = _CallSet()
+        x.addObserver(calls.add)
+        self.assertTrue(x.hasObserver(calls.add))
+        x.setValue(2)
+        self.assertEqual(set([(x,)]), calls)
+        # the registry does not keep the observer alive
+        calls = None
+        x.setValue(3)
+        self.assertEqual(0, len(x._observers))
+        return
+
+
+    def test_notifyAll(self):
+        """check notifyAll() calls shared observers only once.
+        """
+        x = Parameter('x', 1)
+        y = Parameter('y', 2)
+        calls = []
+        x.addObserver(calls.append)
+        y.addObserver(calls.append)
+        y.addObserver(self.f._eq._flush)
+        self.f.evaluate()
+        notifyAll([x, y])
+        self.assertEqual([(x,)], calls)
+        self.assertTrue(None is self.f._eq._value)
+        return
+
+
+    def test_pickling(self):
+        """check pickling of the observer registry.
+        """
+        f = self.f
+        x = f.newParameter('x', 5)
+        f.setEquation('3 * x')
+        self.assertEqual(15, f.evaluate())
+        f2 = pickle.loads(pickle.dumps(f))
+        self.assertEqual(15, f2.evaluate())
+        f2.x.setValue(2)
+        self.assertEqual(6, f2.evaluate())
+        self.assertEqual(15, f.evaluate())
+        self.assertEqual(len(x._observers), len(f2.x._observers))
+        return
+
+# End of class TestObservable
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# End of file
@@ -17,8 +17,11 @@
 
 import unittest
 
+import numpy
+
 from diffpy.srfit.fitbase.parameter import Parameter
 from diffpy.srfit.fitbase.parameter import ParameterAdapter, ParameterProxy
+from diffpy.srfit.fitbase.parameter import ArrayAdapterGroup
 
 
 class TestParameter(unittest.TestCase):
@@ -115,5 +118,56 @@ class TestParameterAdapter(unittest.TestCase):
         return
 
 
+class TestArrayAdapterGroup(unittest.TestCase):
+
+    def testSetValues(self):
+        """Test vectorized assignment through ArrayAdapterGroup."""
+
+        class Holder(object):
+            arr = numpy.zeros((2, 2))
+
+        h = Holder()
+        pars = [ParameterAdapter("p%i" % i, h,
+                    _ElementGetter(idx), _ElementSetter(idx))
+                for i, idx in enumerate([(0, 0), (0, 1), (1, 1)])]
+        grp = ArrayAdapterGroup(h, "arr")
+        grp.addAdapter(pars[0], (0, 0))
+        grp.addAdapter(pars[1], (0, 1), (1, 0))
+        grp.addAdapter(pars[2], (1, 1))
+        self.assertEqual(3, len(grp))
+        self.assertRaises(ValueError, grp.addAdapter, pars[0], (0, 0))
+        self.assertRaises(ValueError, grp.setValues, [1, 2])
+
+        calls = []
+        observer = lambda semaphors: calls.append(semaphors[0])
+        for p in pars:
+            p.addObserver(observer)
+        grp.setValues([1, 2, 0])
+        self.assertTrue(numpy.array_equal([[1, 2], [2, 0]], h.arr))
+        self.assertEqual([1, 2, 0], [p.value for p in pars])
+        self.assertTrue(numpy.array_equal([1, 2, 0], grp.getValues()))
+        # observer is called only once for several changed adapters
+        self.assertEqual([pars[0]], calls)
+        # no notification when nothing changes
+        grp.setValues([1, 2, 0])
+        self.assertEqual(1, len(calls))
+        return
+
+
+class _ElementGetter(object):
+
+    def __init__(self, idx):
+        self.idx = idx
+
+    def __call__(self, obj):
+        return obj.arr[self.idx]
+
+
+class _ElementSetter(_ElementGetter):
+
+    def __call__(self, obj, value):
+        obj.arr[self.idx] = value
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -25,7 +25,8 @@ from diffpy.srfit.tests.utils import datafile
 from diffpy.srfit.tests.utils import has_srreal, _msg_nosrreal
 from diffpy.srfit.tests.utils import has_structure, _msg_nostructure
 from diffpy.srfit.pdf import PDFGenerator, PDFParser, PDFContribution
-from diffpy.srfit.exceptions import SrFitError
+from diffpy.srfit.fitbase import ProfileGenerator
+from diffpy.srfit.exceptions import SrFitError, ParseError
 
 # ----------------------------------------------------------------------------
 
@@ -111,6 +112,68 @@ class TestPDFParset(unittest.TestCase):
         self.assertTrue(dx is None)
         return
 
+
+    def testParserColumns(self):
+        """check parsing of data with missing or invalid uncertainties.
+        """
+        header = "# xray PDF\nqmax=25.0\n#### start data\n"
+        parser = PDFParser()
+        parser.parseString(header + "1 2 0.1 0.2\n2 3 0.1 0.3\n")
+        x, y, dx, dy = parser.getData()
+        self.assertTrue(numpy.array_equal([1, 2], x))
+        self.assertTrue(numpy.array_equal([2, 3], y))
+        self.assertTrue(numpy.array_equal([0.1, 0.1], dx))
+        self.assertTrue(numpy.array_equal([0.2, 0.3], dy))
+        self.assertEqual('X', parser._meta['stype'])
+        self.assertEqual(25, parser._meta['qmax'])
+        parser = PDFParser()
+        parser.parseString(header + "1 2 0.1 0.2\n2 3 0.1 nan\n")
+        x, y, dx, dy = parser.getData()
+        self.assertTrue(numpy.array_equal([0.1, 0.1], dx))
+        self.assertTrue(dy is None)
+        parser = PDFParser()
+        parser.parseString(header + "1 2 0.1 0.2\n2 3 0 0.3\n")
+        x, y, dx, dy = parser.getData()
+        self.assertTrue(dx is None)
+        self.assertTrue(numpy.array_equal([0.2, 0.3], dy))
+        parser = PDFParser()
+        parser.parseString(header + "1 2 0.1 0.2\n2 3 0.1\n3 4\n")
+        x, y, dx, dy = parser.getData()
+        self.assertTrue(numpy.array_equal([1, 2, 3], x))
+        self.assertTrue(numpy.array_equal([2, 3, 4], y))
+        self.assertTrue(dx is None)
+        self.assertTrue(dy is None)
+        self.assertRaises(ParseError, PDFParser().parseString,
+                header + "1 2\n2\n")
+        self.assertRaises(ParseError, PDFParser().parseString,
+                header + "1 2\n2 x\n")
+        self.assertRaises(ParseError, PDFParser().parseString, header)
+        return
+
+
+    def testParseFile(self):
+        """check parseFile reads the data from the mapped file.
+        """
+        from diffpy.srfit.pdf import pdfparser
+        data = datafile("si-q27r60-xray.gr")
+        p1 = PDFParser()
+        p1.parseFile(data)
+        p2 = PDFParser()
+        with open(data) as fp:
+            p2.parseString(fp.read())
+        for a1, a2 in zip(p1.getData(), p2.getData()):
+            self.assertTrue(a1 is a2 is None or numpy.array_equal(a1, a2))
+        meta2 = dict(p2.getMetaData(), filename=data)
+        self.assertEqual(meta2, p1.getMetaData())
+        # lines are the same when read in small chunks
+        with open(data, 'rb') as fp:
+            buf = fp.read()
+        start = pdfparser._findDataStart(buf)
+        lines = pdfparser._MappedLines(buf, start)
+        lines.chunksize = 100
+        self.assertEqual(buf[start:].decode().splitlines(), list(lines))
+        return
+
 # End of class TestPDFParset
 
 # ----------------------------------------------------------------------------
@@ -184,10 +247,535 @@ class TestPDFGenerator(unittest.TestCase):
         self.assertEqual(0.93, gen._calc.qmin)
         return
 
+
+    def test_scaleQdampReuse(self):
+        """Check reuse of the PDF when only scale or qdamp change.
+        """
+        from diffpy.structure import loadStructure
+        from diffpy.srreal.pdfcalculator import PDFCalculator
+        gen = self.gen
+        gen.setQmax(27.0)
+        ni = loadStructure(datafile("ni.cif"))
+        ni.Uisoequiv = 0.003
+        gen.setStructure(ni)
+        r = numpy.arange(1, 10, 0.05)
+        gen(r)
+        self.assertFalse(gen._barepdf is None)
+        gen.scale.value = 0.7
+        gen.qdamp.value = 0.05
+        self.assertFalse(gen._barepdf is None)
+        y = gen(r)
+        calc = PDFCalculator(qmax=27.0, scale=0.7, qdamp=0.05,
+                             rmin=gen._calc.rmin, rmax=gen._calc.rmax,
+                             rstep=gen._calc.rstep)
+        rcalc, yref = calc(ni)
+        self.assertTrue(numpy.allclose(numpy.interp(r, rcalc, yref), y))
+        # structure change forces new calculation
+        gen.phase.lattice.a.value = 3.6
+        self.assertTrue(gen._barepdf is None)
+        gen.delta2.value = 1
+        gen(r)
+        gen.delta2.value = 2
+        self.assertTrue(gen._barepdf is None)
+        return
+
+
+    def test_parallel(self):
+        """check parallel evaluation in the shared CalculatorPool.
+        """
+        from diffpy.structure import loadStructure
+        gen = self.gen
+        ni = loadStructure(datafile("ni.cif"))
+        ni.Uisoequiv = 0.003
+        gen.setStructure(ni)
+        r = numpy.arange(1, 10, 0.05)
+        y0 = gen(r)
+        gen.parallel(2)
+        self.assertFalse(gen._pool is None)
+        self.assertTrue(numpy.allclose(y0, gen(r)))
+        gen.phase.lattice.a.value = 3.6
+        y1 = gen(r)
+        gen.parallel(1)
+        self.assertTrue(gen._pool is None)
+        self.assertTrue(numpy.allclose(y1, gen(r)))
+        return
+
 # End of class TestPDFGenerator
 
 # ----------------------------------------------------------------------------
 
+class TestInterpolation(unittest.TestCase):
+
+    def test_interpolationSetup(self):
+        """check precomputed interpolation to the profile grid.
+        """
+        from diffpy.srfit.pdf.basepdfgenerator import _interpolationSetup
+        rcalc = numpy.arange(1, 10.001, 0.1)
+        y = numpy.sin(rcalc)
+        n, idx, w = _interpolationSetup(rcalc + 1e-12, rcalc)
+        self.assertEqual(len(rcalc), n)
+        self.assertTrue(idx is None)
+        r = numpy.arange(0.5, 11, 0.037)
+        n, idx, w = _interpolationSetup(r, rcalc)
+        yr = y[idx] * (1 - w) + y[idx + 1] * w
+        self.assertTrue(numpy.allclose(numpy.interp(r, rcalc, y), yr))
+        return
+
+# End of class TestInterpolation
+
+# ----------------------------------------------------------------------------
+
+class TestScaleQdampReuse(unittest.TestCase):
+
+    def setUp(self):
+        from diffpy.srfit.pdf.basepdfgenerator import BasePDFGenerator
+        self.calc = _EnvelopeCalculator()
+        self.gen = gen = BasePDFGenerator()
+        gen._setCalculator(self.calc)
+        gen._phase = _AmplitudePhase()
+        self.r = numpy.arange(1, 10, 0.05)
+        return
+
+
+    def test_reuse(self):
+        """check reuse of the bare PDF for scale and qdamp changes.
+        """
+        gen = self.gen
+        calc = self.calc
+        r = self.r
+        gen.scale.value = 2
+        y0 = gen(r)
+        self.assertTrue(numpy.allclose(2 * numpy.sin(r), y0))
+        self.assertEqual(1, calc.ncalls)
+        self.assertEqual(2, calc.scale)
+        gen.scale.value = 0.5
+        gen.qdamp.value = 0.3
+        y1 = gen(r)
+        self.assertEqual(1, calc.ncalls)
+        self.assertTrue(numpy.allclose(calc.evaluate(r), y1))
+        # large qdamp does not give inf or nan values
+        gen.qdamp.value = 40
+        self.assertTrue(numpy.all(numpy.isfinite(gen(r))))
+        gen.qdamp.value = 0.3
+        self.assertTrue(numpy.array_equal(y1, gen(r)))
+        self.assertEqual(1, calc.ncalls)
+        # peak width change requires new calculation
+        gen.delta2.value = 1
+        self.assertTrue(gen._barepdf is None)
+        gen(r)
+        self.assertEqual(2, calc.ncalls)
+        # no reuse for calculators without the standard envelopes
+        calc.usedenvelopetypes = ('scale',)
+        gen.scale.value = 3
+        gen(r)
+        gen(r)
+        self.assertEqual(4, calc.ncalls)
+        return
+
+# End of class TestScaleQdampReuse
+
+# ----------------------------------------------------------------------------
+
+class TestCalculatorPool(unittest.TestCase):
+
+    def test_register(self):
+        """check client registration in CalculatorPool.
+        """
+        from diffpy.srfit.pdf.calculatorpool import CalculatorPool
+        from diffpy.srfit.pdf.calculatorpool import getCalculatorPool
+        pool = CalculatorPool(2)
+        self.assertEqual(2, pool.ncpu)
+        self.assertRaises(ValueError, pool.setWorkerCount, 0)
+
+        class Client(object):
+            pass
+
+        c1, c2 = Client(), Client()
+        k1 = pool.register(c1)
+        k2 = pool.register(c2)
+        self.assertNotEqual(k1, k2)
+        self.assertEqual(2, len(pool._clients))
+        pool.unregister(k1)
+        self.assertEqual([k2], list(pool._clients))
+        # deallocated clients are unregistered
+        del c2
+        self.assertEqual(0, len(pool._clients))
+        self.assertNotEqual(pool.newVersion(), pool.newVersion())
+        # pickles as the shared pool
+        self.assertTrue(getCalculatorPool() is
+                        pickle.loads(pickle.dumps(pool)))
+        return
+
+
+    def test_evaluate(self):
+        """check evaluation of partial results in the worker processes.
+        """
+        from diffpy.srfit.pdf.calculatorpool import CalculatorPool
+
+        class Client(object):
+            pass
+
+        with CalculatorPool(2) as pool:
+            client = Client()
+            key = pool.register(client)
+            calc = _PartCalculator()
+            blob = pickle.dumps((calc, 3.0, True, [(calc, _setScale)]))
+            version = pool.newVersion()
+            rv = pool.evaluate(key, version, blob, [2.0], 2, sendblob=True)
+            self.assertEqual([((0, 2), 6.0), ((1, 2), 6.0)], sorted(rv))
+            # the workers reuse or reload the calculator of this version
+            rv = pool.evaluate(key, version, blob, [0.5], 2)
+            self.assertEqual([((0, 2), 1.5), ((1, 2), 1.5)], sorted(rv))
+            # deallocated client does not stop the workers
+            del client
+            self.assertEqual(0, len(pool._clients))
+            self.assertFalse(pool._pool is None)
+        self.assertTrue(pool._pool is None)
+        return
+
+
+    def test_unpicklableStructure(self):
+        """check in-process evaluation for structures that cannot be pickled.
+        """
+        from diffpy.srfit.pdf.basepdfgenerator import BasePDFGenerator
+        from diffpy.srfit.pdf.calculatorpool import CalculatorPool
+        calc = _EnvelopeCalculator()
+        gen = BasePDFGenerator()
+        gen._setCalculator(calc)
+        gen._phase = _AmplitudePhase()
+        gen.stru = lambda: None
+        gen._pool = pool = CalculatorPool(1)
+        r = numpy.arange(1, 10, 0.05)
+        self.assertTrue(numpy.allclose(numpy.sin(r), gen(r)))
+        self.assertTrue(gen._poolblob is False)
+        gen.delta2.value = 1
+        gen(r)
+        self.assertEqual(2, calc.ncalls)
+        self.assertTrue(pool._pool is None)
+        return
+
+# End of class TestCalculatorPool
+
+# ----------------------------------------------------------------------------
+
+@unittest.skipUnless(has_structure, _msg_nostructure)
+class TestDebyeCalculator(unittest.TestCase):
+
+    def setUp(self):
+        from diffpy.structure import Structure, Atom
+        atoms = [Atom('C', xyz) for xyz in
+                 numpy.random.RandomState(7).uniform(0, 6, (20, 3))]
+        atoms[-5:] = [Atom('O', a.xyz) for a in atoms[-5:]]
+        self.stru = Structure(atoms)
+        self.stru.Uisoequiv = 0.004
+        return
+
+
+    def test_histogram(self):
+        """check the distance histogram in DebyeCalculator.
+        """
+        from diffpy.srfit.pdf.debyecalculator import DebyeCalculator
+        calc = DebyeCalculator()
+        hist = calc.getDistanceHistogram(self.stru)
+        self.assertEqual(['C', 'O'], hist.elements)
+        self.assertEqual([(0, 0), (0, 1), (1, 1)], hist.pairs)
+        self.assertEqual(20 * 19 / 2, hist.counts.sum())
+        # block evaluation in several threads gives the same result
+        calc1 = DebyeCalculator(chunksize=7, nthreads=3)
+        hist1 = calc1.getDistanceHistogram(self.stru)
+        self.assertTrue(numpy.array_equal(hist.counts, hist1.counts))
+        r, c, s2 = hist.getDistances(1)
+        self.assertEqual(15 * 5, c.sum())
+        self.assertTrue(numpy.allclose(0.008, s2))
+        return
+
+
+    def test_reference(self):
+        """check DebyeCalculator against a reference pair-sum calculation.
+        """
+        from diffpy.srfit.pdf.debyecalculator import DebyeCalculator
+        stru = self.stru
+        uiso = numpy.random.RandomState(3).uniform(0.002, 0.01, len(stru))
+        stru.Uisoequiv = uiso
+        sftable = _GaussianFormFactors()
+        calc = DebyeCalculator(binwidth=1e-6, chunksize=7, nthreads=2,
+                               qmax=20, rmin=0.5, rmax=5, rstep=0.05,
+                               delta2=0.5)
+        calc.setScatteringFactorTable(sftable)
+        q = numpy.linspace(0.5, 20, 60)
+        iq = calc.iofq(stru, q)
+        iqref = _debyeIntensityReference(stru, q, sftable, delta2=0.5)
+        self.assertTrue(numpy.allclose(iqref, iq))
+        # scattering factors are evaluated once per element and Q-grid
+        nlookups = sftable.nlookups
+        self.assertTrue(numpy.allclose(iq, calc.iofq(stru, q)))
+        self.assertEqual(nlookups, sftable.nlookups)
+        # PDF from the sine transformation of the reference F(Q)
+        rgrid, pdf = calc(stru)
+        qf = numpy.linspace(0, 20, 4001)
+        sf = numpy.array([[sftable.lookup(e, qi) for qi in qf]
+                          for e in stru.element])
+        favg = sf.mean(axis=0)
+        iqf = _debyeIntensityReference(stru, qf, sftable, delta2=0.5)
+        fqf = qf * (iqf - (sf**2).sum(axis=0)) / (len(stru) * favg**2)
+        wq = numpy.full(len(qf), qf[1] - qf[0])
+        wq[[0, -1]] *= 0.5
+        pdfref = 2 / numpy.pi * numpy.sin(numpy.outer(rgrid, qf)).dot(fqf * wq)
+        self.assertTrue(numpy.allclose(pdfref, pdf,
+                                       atol=1e-3 * numpy.abs(pdfref).max()))
+        return
+
+
+    def test_iofq(self):
+        """check DebyeCalculator.iofq against the Debye equation.
+        """
+        from diffpy.srfit.pdf.debyecalculator import DebyeCalculator
+        calc = DebyeCalculator(binwidth=1e-6, chunksize=7, nthreads=2)
+        q = numpy.linspace(0.5, 20, 50)
+        xyz = self.stru.xyz_cartn
+        d = numpy.sqrt(((xyz[:,None,:] - xyz[None,:,:])**2).sum(axis=-1))
+        d = d[numpy.triu_indices(len(xyz), 1)]
+        s2 = 2 * 0.004
+        iq = len(xyz) + 2 * numpy.sum(numpy.sinc(numpy.outer(q, d) / numpy.pi)
+                * numpy.exp(-0.5 * s2 * q[:,None]**2), axis=1)
+        self.assertTrue(numpy.allclose(iq, calc.iofq(self.stru, q)))
+        fq = q * (iq / len(xyz) - 1)
+        self.assertTrue(numpy.allclose(fq, calc.fofq(self.stru, q), atol=1e-4))
+        return
+
+
+    def test_generator(self):
+        """check DebyePDFGenerator with the NumPy DebyeCalculator.
+        """
+        from diffpy.srfit.pdf import DebyePDFGenerator
+        from diffpy.srfit.pdf.debyecalculator import DebyeCalculator
+        gen = DebyePDFGenerator(calculator=DebyeCalculator())
+        gen.setStructure(self.stru)
+        gen.setQmax(25)
+        r = numpy.arange(0.5, 5, 0.01)
+        y = gen(r)
+        self.assertEqual(r.shape, y.shape)
+        self.assertTrue(numpy.all(numpy.isfinite(y)))
+        gen.scale.value = 2
+        self.assertTrue(numpy.allclose(2 * y, gen(r)))
+        gen.parallel(3)
+        self.assertEqual(3, gen._calc.nthreads)
+        gen.scale.value = 1
+        self.assertTrue(numpy.allclose(y, gen(r)))
+        return
+
+
+    def test_reuseHistogram(self):
+        """check reuse of the histogram for isotropic expansion and ADPs.
+        """
+        from diffpy.srfit.pdf import DebyePDFGenerator
+        from diffpy.srfit.pdf.debyecalculator import DebyeCalculator
+        calc = DebyeCalculator(binwidth=1e-5)
+        gen = DebyePDFGenerator(calculator=calc)
+        gen.setStructure(self.stru)
+        r = numpy.arange(0.5, 5, 0.01)
+        gen(r)
+        counts = calc._histcache[-1].counts
+        lat = gen.phase.lattice
+        for p in (lat.a, lat.b, lat.c):
+            p.value = 1.02
+        for a in gen.phase.getScatterers():
+            a.Uiso.value = 0.006 if a.element == 'C' else 0.003
+        y = gen(r)
+        self.assertTrue(calc._histcache[-1].counts is counts)
+        # compare with a calculation from scratch
+        calc1 = DebyeCalculator(reusehistogram=False, binwidth=1e-5,
+                                rmin=calc.rmin, rmax=calc.rmax,
+                                rstep=calc.rstep)
+        rcalc, y1 = calc1(gen.phase.stru)
+        self.assertTrue(calc1._histcache is None)
+        self.assertTrue(numpy.allclose(y1, y, atol=1e-3 * numpy.abs(y1).max()))
+        # anisotropic change needs new histogram
+        lat.a.value = 1.05
+        gen(r)
+        self.assertFalse(calc._histcache[-1].counts is counts)
+        return
+
+
+    def test_fullRange(self):
+        """check windows are sliced from the PDF over the full range.
+        """
+        from diffpy.srfit.pdf import DebyePDFGenerator
+        from diffpy.srfit.pdf.debyecalculator import DebyeCalculator
+        gen = DebyePDFGenerator(calculator=DebyeCalculator())
+        gen.setStructure(self.stru)
+        self.assertRaises(ValueError, gen.setFullRange, 1, 5)
+        self.assertRaises(ValueError, gen.setFullRange, 1, 5, 0)
+        gen.setFullRange(0.5, 6, 0.01)
+        self.assertEqual((0.5, 6, 0.01), gen.getFullRange())
+        r0 = numpy.arange(0.5, 6.005, 0.01)
+        y0 = gen(r0)
+        bare = gen._barepdf
+        r1 = r0[100:300]
+        y1 = gen(r1)
+        self.assertTrue(gen._barepdf is bare)
+        self.assertTrue(isinstance(gen._interp[1], slice))
+        self.assertTrue(numpy.allclose(y0[100:300], y1))
+        # windows outside of the full range are calculated directly
+        r2 = numpy.arange(5, 7, 0.01)
+        gen(r2)
+        self.assertFalse(gen._barepdf is bare)
+        self.assertEqual(5, gen._calc.rmin)
+        gen.setFullRange()
+        self.assertTrue(gen.getFullRange() is None)
+        return
+
+
+    def test_windowContributions(self):
+        """check refinement of windows with one PDF calculation.
+        """
+        from diffpy.srfit.fitbase import FitRecipe
+        from diffpy.srfit.pdf import DebyePDFGenerator
+        from diffpy.srfit.pdf.debyecalculator import DebyeCalculator
+        gen = DebyePDFGenerator('c', calculator=DebyeCalculator())
+        gen.setStructure(self.stru)
+        pc = PDFContribution('pc')
+        r = numpy.arange(0.5, 6, 0.01)
+        pc.profile.setObservedProfile(r, gen(r))
+        pc._setupGenerator(gen)
+        windows = [(1, 3), (2, 4), (3.5, 5.5)]
+        wcs = pc.makeWindowContributions(windows)
+        self.assertEqual(['pc_w0', 'pc_w1', 'pc_w2'], [wc.name for wc in wcs])
+        recipe = FitRecipe()
+        recipe.fithooks[:] = []
+        for wc in wcs:
+            self.assertTrue(wc.c.phase is gen.phase)
+            self.assertTrue(numpy.allclose((1, 5.5, 0.01),
+                                           wc.c.getFullRange()))
+            recipe.addContribution(wc)
+        recipe.addVar(gen.phase.lattice.a, 1.0)
+        res = recipe.residual()
+        self.assertTrue(numpy.allclose(0, res))
+        self.assertEqual(2, recipe.generatormemo.hits)
+        recipe.residual([1.01])
+        self.assertEqual(4, recipe.generatormemo.hits)
+        # different scattering factors are evaluated separately
+        wcs[2].c._calc.setScatteringFactorTable(_GaussianFormFactors())
+        recipe.residual([1.02])
+        self.assertEqual(5, recipe.generatormemo.hits)
+        self.assertRaises(ValueError, pc.makeWindowContributions, [(8, 9)])
+        return
+
+# End of class TestDebyeCalculator
+
+# ----------------------------------------------------------------------------
+
+class TestPhaseSumOperator(unittest.TestCase):
+
+    def test_phaseSum(self):
+        """check in-place summation of the phase profiles.
+        """
+        from diffpy.srfit.equation.literals import Argument
+        from diffpy.srfit.pdf.phasesum import PhaseSumOperator
+        op = PhaseSumOperator()
+        self.assertEqual(0, op.value)
+        x = numpy.linspace(0, 1, 7)
+        phases = [Argument(name="p%i" % i, value=(i + 1) * x)
+                  for i in range(4)]
+        fracs = [Argument(name="f%i" % i, value=1.0) for i in range(4)]
+        op.addPhase(phases[0])
+        for p, f in zip(phases[1:], fracs[1:]):
+            op.addPhase(p, f)
+        y = op.value
+        self.assertTrue(numpy.allclose(10 * x, y))
+        # update of one phase reuses the buffer
+        phases[2].value = 5 * x
+        fracs[3].value = 0.5
+        self.assertTrue(y is op.value)
+        self.assertEqual(1, op._nupdates)
+        self.assertTrue(numpy.allclose(10 * x, y))
+        # full recalculation after maxupdates or for many changes
+        op.maxupdates = 1
+        fracs[1].value = 2
+        self.assertTrue(numpy.allclose(12 * x, op.value))
+        self.assertEqual(0, op._nupdates)
+        # profile changed in place is summed again
+        op.maxupdates = 64
+        y1 = phases[1].value
+        y1 *= 2
+        phases[1].notify()
+        self.assertTrue(numpy.allclose(16 * x, op.value))
+        phases[0].value = x[:3]
+        self.assertRaises(ValueError, op.getValue)
+        return
+
+
+    def test_float32(self):
+        """check phase sum keeps the dtype of single precision profiles.
+        """
+        from diffpy.srfit.fitbase import FitContribution, Profile
+        from diffpy.srfit.pdf.phasesum import PhaseSumOperator
+        x = numpy.linspace(0, 10, 101)
+        profile = Profile()
+        profile.setObservedProfile(x, numpy.sin(x))
+        fc = FitContribution("c")
+        fc.setProfile(profile)
+        fc.setDtype(numpy.float32)
+        op = PhaseSumOperator()
+        gens = [_SineGenerator("g%i" % i) for i in range(4)]
+        for g in gens:
+            fc.addProfileGenerator(g)
+            op.addPhase(g)
+        fc._eqfactory.registerOperator("phasesum", op)
+        fc.setEquation("phasesum")
+        y = fc.evaluate()
+        self.assertEqual(numpy.float32, y.dtype)
+        self.assertEqual(numpy.float32, op.value.dtype)
+        self.assertTrue(numpy.allclose(4 * numpy.sin(x), y, atol=1e-6))
+        gens[2].k.value = 1.1
+        y = fc.evaluate()
+        self.assertEqual(1, op._nupdates)
+        self.assertEqual(numpy.float32, y.dtype)
+        y0 = 3 * numpy.sin(x) + numpy.sin(1.1 * x)
+        self.assertTrue(numpy.allclose(y0, y, atol=1e-6))
+        fc.evaluate()
+        self.assertEqual(1, op._nupdates)
+        return
+
+
+    def test_pdfContributionFloat32(self):
+        """check single precision PDFContribution with several phases.
+        """
+        from diffpy.srfit.pdf.basepdfgenerator import BasePDFGenerator
+        r = numpy.arange(1, 10, 0.05)
+        pc = PDFContribution("pc")
+        pc.profile.setObservedProfile(r, numpy.sin(r))
+        pc.setDtype(numpy.float32)
+        gens = []
+        for i in range(3):
+            gen = BasePDFGenerator("g%i" % i)
+            gen._setCalculator(_EnvelopeCalculator())
+            gen._phase = _AmplitudePhase()
+            pc._setupGenerator(gen)
+            gens.append(gen)
+        y = pc.evaluate()
+        self.assertEqual(numpy.float32, y.dtype)
+        self.assertEqual(numpy.float32, gens[0].value.dtype)
+        self.assertTrue(numpy.allclose(3 * numpy.sin(r), y, atol=1e-6))
+        # one phase is updated in the float32 sum
+        gens[1].scale.value = 2
+        y = pc.evaluate()
+        self.assertEqual(numpy.float32, y.dtype)
+        self.assertEqual(1, pc._phasesum._nupdates)
+        self.assertTrue(numpy.allclose(4 * numpy.sin(r), y, atol=1e-6))
+        self.assertEqual([1, 1, 1], [g._calc.ncalls for g in gens])
+        # window contributions keep the dtype
+        pc = PDFContribution("pc")
+        pc.profile.setObservedProfile(r, numpy.sin(r))
+        pc.setDtype(numpy.float32)
+        wcs = pc.makeWindowContributions([(1, 5), (5, 9)])
+        self.assertEqual([numpy.float32] * 2, [wc.getDtype() for wc in wcs])
+        return
+
+# End of class TestPhaseSumOperator
+
+# ----------------------------------------------------------------------------
+
 @unittest.skipUnless(has_srreal, _msg_nosrreal)
 @unittest.skipUnless(has_structure, _msg_nostructure)
 class TestPDFContribution(unittest.TestCase):
@@ -270,8 +858,166 @@ class TestPDFContribution(unittest.TestCase):
         self.assertTrue(numpy.array_equal(res1, pc2.residual()))
         return
 
+    def test_sharedEvaluation(self):
+        "check identical generators are evaluated once per residual."
+        from diffpy.structure import loadStructure
+        from diffpy.srfit.fitbase import FitRecipe
+        ni = loadStructure(datafile("ni.cif"))
+        ni.Uisoequiv = 0.003
+        pc1 = self.pc
+        pc1.loadData(datafile("ni-q27r100-neutron.gr"))
+        pc1.setCalculationRange(0, 10)
+        phase = pc1.addStructure('ni', ni)
+        pc2 = PDFContribution('pc2')
+        pc2.loadData(datafile("ni-q27r100-neutron.gr"))
+        pc2.setCalculationRange(0, 10)
+        pc2.addPhase('ni', phase)
+        recipe = FitRecipe()
+        recipe.fithooks[:] = []
+        recipe.addContribution(pc1)
+        recipe.addContribution(pc2)
+        recipe.addVar(phase.lattice.a)
+        res = recipe.residual()
+        self.assertEqual(1, recipe.generatormemo.hits)
+        n = len(res) // 2
+        self.assertTrue(numpy.array_equal(res[:n], res[n:]))
+        recipe.residual([3.6])
+        self.assertEqual(2, recipe.generatormemo.hits)
+        # different pair masks are evaluated separately
+        pc2.ni._calc.setPairMask(0, 1, False)
+        recipe.residual([3.58])
+        self.assertEqual(2, recipe.generatormemo.hits)
+        pc2.ni._calc.setPairMask('all', 'all', True)
+        recipe.residual([3.57])
+        self.assertEqual(3, recipe.generatormemo.hits)
+        # and different peak width models
+        pc2.ni._calc.peakwidthmodel = 'constant'
+        recipe.residual([3.56])
+        self.assertEqual(3, recipe.generatormemo.hits)
+        # different configuration is evaluated separately
+        pc2.ni.setQmax(20)
+        recipe.residual([3.55])
+        self.assertEqual(3, recipe.generatormemo.hits)
+        return
+
 # End of class TestPDFContribution
 
+# Local helpers --------------------------------------------------------------
+
+class _SineGenerator(ProfileGenerator):
+    """Generator of a sine profile with the wave vector k."""
+
+    def __init__(self, name):
+        ProfileGenerator.__init__(self, name)
+        self.newParameter("k", 1.0)
+        return
+
+    def __call__(self, x):
+        return numpy.sin(self.k.value * x)
+
+# End of class _SineGenerator
+
+
+class _EnvelopeCalculator(object):
+    """Calculator of a sine profile with the SrReal PDF envelopes."""
+
+    usedenvelopetypes = ('scale', 'qresolution')
+
+    def __init__(self):
+        self.scale = 1.0
+        self.qdamp = 0.0
+        self.delta1 = self.delta2 = self.qbroad = 0.0
+        self.rmin, self.rmax, self.rstep = 0.0, 10.0, 0.01
+        self.amplitude = 1.0
+        self.ncalls = 0
+        return
+
+
+    def __call__(self, amplitude):
+        self.ncalls += 1
+        self.amplitude = amplitude
+        n = int(numpy.ceil((self.rmax - self.rmin) / self.rstep))
+        r = self.rmin + self.rstep * numpy.arange(n)
+        return r, self.evaluate(r)
+
+
+    def evaluate(self, r):
+        rv = self.amplitude * numpy.sin(r) * self.scale
+        if self.qdamp > 0:
+            rv *= numpy.exp(-0.5 * (self.qdamp * r)**2)
+        return rv
+
+
+class _AmplitudePhase(object):
+    """Phase that gives the amplitude for _EnvelopeCalculator."""
+
+    def _getSrRealStructure(self):
+        return 1.0
+
+    def usingSymmetry(self):
+        return True
+
+
+class _PartCalculator(object):
+    """Calculator of scaled partial results for the CalculatorPool."""
+
+    def __init__(self):
+        self.scale = 1.0
+        self.part = None
+        self.value = None
+        return
+
+    def _setupParallelRun(self, cpuindex, ncpu):
+        self.part = (cpuindex, ncpu)
+        return
+
+    def eval(self, stru):
+        self.value = self.scale * stru
+        return
+
+    def _getParallelData(self):
+        return (self.part, self.value)
+
+
+def _setScale(calc, value):
+    calc.scale = value
+    return
+
+
+class _GaussianFormFactors(object):
+    """Scattering factor table of Gaussian form factors for scalar Q."""
+
+    widths = {'C' : 0.2, 'O' : 0.15}
+
+    def __init__(self):
+        self.nlookups = 0
+        return
+
+    def lookup(self, smbl, q):
+        self.nlookups += 1
+        q = float(q)
+        z = {'C' : 6, 'O' : 8}[smbl]
+        return z * numpy.exp(-(self.widths[smbl] * q)**2)
+
+    def radiationType(self):
+        return 'G'
+
+
+def _debyeIntensityReference(stru, q, sftable, delta2=0):
+    """Debye intensity from the sum over all pairs of atoms."""
+    xyz = stru.xyz_cartn
+    uiso = stru.Uisoequiv
+    sf = [numpy.array([sftable.lookup(e, qi) for qi in q])
+          for e in stru.element]
+    rv = numpy.sum([f**2 for f in sf], axis=0)
+    for i in range(len(xyz)):
+        for j in range(i + 1, len(xyz)):
+            d = numpy.sqrt(numpy.sum((xyz[i] - xyz[j])**2))
+            s2 = max(0, (uiso[i] + uiso[j]) * (1 - delta2 / d**2))
+            rv = rv + 2 * sf[i] * sf[j] * numpy.sinc(q * d / numpy.pi) * (
+                    numpy.exp(-0.5 * s2 * q**2))
+    return rv
+
 # ----------------------------------------------------------------------------
 
 if __name__ == "__main__":
@@ -18,12 +18,23 @@
 import unittest
 import re
 import io
+import os
+import shutil
+import tempfile
 
-from numpy import array, arange, array_equal, ones_like, allclose
+import numpy
+from numpy import array, arange, array_equal, ones_like, allclose, loadtxt
 
 from diffpy.srfit.fitbase.profile import Profile
-from diffpy.srfit.exceptions import SrFitError
+from diffpy.srfit.fitbase.profileparser import ProfileParser
+from diffpy.srfit.fitbase.npzprofileparser import NpzProfileParser
+from diffpy.srfit.fitbase.npzprofileparser import convertProfileFile
+from diffpy.srfit.fitbase.hdf5seriesparser import HDF5SeriesParser
+from diffpy.srfit.fitbase.profilecache import ProfileCache
+from diffpy.srfit.pdf import PDFParser
+from diffpy.srfit.exceptions import SrFitError, ParseError
 from diffpy.srfit.tests.utils import datafile
+from diffpy.srfit.tests.utils import has_h5py, _msg_noh5py
 
 
 class TestProfile(unittest.TestCase):
@@ -226,9 +237,364 @@ class TestProfile(unittest.TestCase):
         self.assertEqual(22, nlines)
         return
 
+
+    def test_xversion(self):
+        "Check xversion is incremented only when x changes."
+        prof = self.profile
+        v0 = prof.xversion
+        xobs = arange(0, 10, 0.5)
+        prof.setObservedProfile(xobs, xobs ** 2)
+        v1 = prof.xversion
+        self.assertTrue(v1 > v0)
+        prof.setCalculationRange(0, 9.5)
+        self.assertEqual(v1, prof.xversion)
+        prof.setCalculationRange(2, 8)
+        self.assertTrue(prof.xversion > v1)
+        v2 = prof.xversion
+        prof.ycalc = prof.y
+        prof.dy = 2 * ones_like(prof.x)
+        self.assertEqual(v2, prof.xversion)
+        return
+
+
+
+    def test_calculationViews(self):
+        "Check contiguous calculation ranges are views of the data."
+        prof = self.profile
+        xobs = arange(0, 10, 0.1)
+        yobs = xobs ** 2
+        prof.setObservedProfile(xobs, yobs, 0.1 + xobs)
+        prof.setCalculationRange(2, 5)
+        self.assertTrue(prof.y.base is prof.yobs)
+        self.assertTrue(prof.y.flags.writeable)
+        self.assertTrue(array_equal(yobs[20:51], prof.y))
+        self.assertTrue(array_equal(0.1 + xobs[20:51], prof.dy))
+        prof.setCalculationPoints(xobs[10:30])
+        self.assertTrue(prof.dy.base is prof.dyobs)
+        self.assertTrue(array_equal(yobs[10:30], prof.y))
+        # resampling is cached per grid
+        x1 = arange(0.05, 9, 0.2)
+        hits, misses = prof._gridcache.hits, prof._gridcache.misses
+        prof.setCalculationPoints(x1)
+        self.assertEqual(misses + 1, prof._gridcache.misses)
+        self.assertTrue(allclose(numpy.interp(x1, xobs, yobs), prof.y))
+        self.assertTrue(allclose(0.1 + x1, prof.dy))
+        prof.setCalculationPoints(x1 + 0.0)
+        self.assertEqual(hits + 1, prof._gridcache.hits)
+        prof.setCalculationRange(dx=0.1)
+        self.assertTrue(prof.x.base is prof.xobs)
+        # observed profile resets the cache
+        prof.setObservedProfile(xobs, 2 * yobs)
+        self.assertEqual(1, len(prof._gridcache))
+        i0 = xobs.searchsorted(prof.x[0])
+        self.assertTrue(array_equal(2 * yobs[i0:i0 + len(prof.x)], prof.y))
+        self.assertTrue(array_equal(ones_like(prof.x), prof.dy))
+        return
+
+
+    def test_setDtype(self):
+        "Check single precision profile arrays."
+        prof = self.profile
+        self.assertEqual(numpy.float64, prof.dtype)
+        xobs = arange(0, 10, 0.1)
+        prof.setObservedProfile(xobs, xobs ** 2)
+        prof.setCalculationRange(2, 5)
+        prof.setDtype(numpy.float32)
+        for a in (prof.xobs, prof.yobs, prof.dyobs, prof.x, prof.y, prof.dy):
+            self.assertEqual(numpy.float32, a.dtype)
+        # calculation range is kept and uses views of the data
+        self.assertEqual(31, len(prof.x))
+        self.assertTrue(prof.y.base is prof.yobs)
+        self.assertTrue(allclose(xobs[20:51] ** 2, prof.y))
+        prof.setCalculationPoints(arange(0.05, 9, 0.2))
+        self.assertEqual(numpy.float32, prof.x.dtype)
+        self.assertEqual(numpy.float32, prof.y.dtype)
+        prof.ycalc = numpy.ones(len(prof.x))
+        self.assertEqual(numpy.float32, prof.ycalc.dtype)
+        prof.setDtype(float)
+        self.assertEqual(numpy.float64, prof.yobs.dtype)
+        self.assertEqual(numpy.float64, prof.y.dtype)
+        self.assertRaises(ValueError, prof.setDtype, int)
+        return
+
 # End of class TestProfile
 
 # ----------------------------------------------------------------------------
 
+class TestProfileParser(unittest.TestCase):
+
+    def test_lazyBanks(self):
+        "Check the banks are parsed when selected."
+        parsed = []
+
+        class BankParser(ProfileParser):
+            def _parseBuffer(self, buf):
+                for i, block in enumerate(buf[:].split(b"#bank\n")[1:]):
+                    def loadbank(i=i, block=block):
+                        parsed.append(i)
+                        x, y = loadtxt(io.BytesIO(block), unpack=True)
+                        return x, y, None, None
+                    self._banks.append(loadbank)
+                return
+
+        parser = BankParser()
+        parser._parseBuffer(b"#bank\n1 2\n2 3\n#bank\n1 4\n2 5\n3 6\n")
+        self.assertEqual(2, parser.getNumBanks())
+        self.assertEqual([], parsed)
+        x, y, dx, dy = parser.getData(1)
+        self.assertTrue(array_equal([4, 5, 6], y))
+        self.assertEqual([1], parsed)
+        parser.getData(1)
+        parser.getData(0)
+        self.assertEqual([1, 0], parsed)
+        self.assertEqual(0, parser.getMetaData()['bank'])
+        return
+
+
+    def test_parseFileString(self):
+        "Check parsers without _parseBuffer get the file as a string."
+        strings = []
+
+        class StringParser(ProfileParser):
+            def parseString(self, patstring):
+                strings.append(patstring)
+                x, y = loadtxt(io.StringIO(patstring), unpack=True)
+                self._banks.append((x, y, None, None))
+                return
+
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        fname = os.path.join(tmpdir, "data.txt")
+        with open(fname, "wb") as fp:
+            fp.write(b"# \xb0C\r\n1 2\r\n2 3\r\n")
+        parser = StringParser()
+        parser.parseFile(fname)
+        self.assertEqual([u"# \ufffdC\n1 2\n2 3\n"], strings)
+        self.assertTrue(array_equal([2, 3], parser.getData()[1]))
+        self.assertEqual(fname, parser.getMetaData()["filename"])
+        with open(fname, "wb") as fp:
+            fp.write(b"# \xb0C\r1 2\r")
+        parser.parseFile(fname)
+        self.assertEqual(u"# \ufffdC\n1 2\n", strings[-1])
+        return
+
+
+    def test_npzProfile(self):
+        "Check saving and memory-mapped loading of binary profiles."
+        prof = Profile()
+        xobs = arange(0, 5, 0.5)
+        prof.setObservedProfile(xobs, xobs**2, 0.1 + xobs)
+        prof.meta.update(stype="X", qmax=25.0)
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        fname = os.path.join(tmpdir, "prof.npz")
+        prof.save(fname)
+        self.assertRaises(ValueError, prof.save, fname, format="txt")
+        parser = NpzProfileParser()
+        parser.parseFile(fname)
+        x, y, dx, dy = parser.getData()
+        self.assertTrue(array_equal(xobs, x))
+        self.assertTrue(array_equal(xobs**2, y))
+        self.assertTrue(dx is None)
+        self.assertTrue(array_equal(0.1 + xobs, dy))
+        self.assertFalse(y.flags.writeable)
+        self.assertEqual(fname, parser.getMetaData()["filename"])
+        self.assertEqual(25.0, parser.getMetaData()["qmax"])
+        p2 = Profile()
+        p2.loadParsedData(parser)
+        self.assertTrue(p2.yobs.base is not None)
+        self.assertTrue(array_equal(prof.dyobs, p2.dyobs))
+        self.assertEqual("X", p2.meta["stype"])
+        self.assertRaises(ParseError, parser.parseString, b"garbage")
+        # conversion of text data files
+        datfile = os.path.join(tmpdir, "si.gr")
+        shutil.copy(datafile("si-q27r60-xray.gr"), datfile)
+        fout, = convertProfileFile(datfile)
+        self.assertEqual(datfile + ".npz", fout)
+        pdfparser = PDFParser()
+        pdfparser.parseFile(datfile)
+        parser = NpzProfileParser(mmap=False)
+        parser.parseFile(fout)
+        for a1, a2 in zip(pdfparser.getData(), parser.getData()):
+            self.assertTrue(a1 is a2 is None or array_equal(a1, a2))
+        self.assertEqual(27, parser.getMetaData()["qmax"])
+        self.assertTrue(parser.getData()[0].flags.writeable)
+        return
+
+
+
+    def test_cache(self):
+        "Check the parsed profiles are reused from the cache."
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        cache = ProfileCache(os.path.join(tmpdir, "cache"))
+        datfile = os.path.join(tmpdir, "si.gr")
+        shutil.copy(datafile("si-q27r60-xray.gr"), datfile)
+        p0 = PDFParser()
+        p0.parseFile(datfile)
+        p1 = PDFParser()
+        p1.parseFile(datfile, cache=cache)
+        self.assertEqual(1, len(os.listdir(cache.cachedir)))
+        self.assertTrue(p1.getData()[1].flags.writeable)
+        p2 = PDFParser()
+        p2.parseFile(datfile, cache=cache)
+        self.assertFalse(p2.getData()[1].flags.writeable)
+        for a0, a2 in zip(p0.getData(), p2.getData()):
+            self.assertTrue(a0 is a2 is None or array_equal(a0, a2))
+        self.assertEqual(p0.getMetaData(), p2.getMetaData())
+        # changed file is parsed again
+        with open(datfile, "a") as fp:
+            fp.write("60.0 0.1 0.0 0.01\n")
+        p3 = PDFParser()
+        p3.parseFile(datfile, cache=cache)
+        self.assertEqual(len(p0.getData()[0]) + 1, len(p3.getData()[0]))
+        self.assertTrue(p3.getData()[1].flags.writeable)
+        self.assertEqual(2, len(os.listdir(cache.cachedir)))
+        # eviction by size and age
+        cache.maxsize = 1
+        cache.evict()
+        self.assertEqual(0, len(os.listdir(cache.cachedir)))
+        cache.maxsize = 2**30
+        p3.parseFile(datfile, cache=cache)
+        self.assertEqual(1, len(os.listdir(cache.cachedir)))
+        cache.maxage = -1
+        cache.evict()
+        self.assertEqual(0, len(os.listdir(cache.cachedir)))
+        # missing file
+        self.assertRaises(IOError, p3.parseFile, datfile + "-missing",
+                          cache=cache)
+        return
+
+
+    def test_cacheLazyBanks(self):
+        "Check the cache stores banks when they are parsed."
+        parsed = []
+
+        class BankParser(ProfileParser):
+            _format = "banks"
+            def _parseBuffer(self, buf):
+                self._meta["stype"] = "X"
+                self._meta["datainfo"] = object()
+                for i, block in enumerate(buf[:].split(b"#bank\n")[1:]):
+                    def loadbank(i=i, block=block):
+                        parsed.append(i)
+                        x, y = loadtxt(io.BytesIO(block), unpack=True)
+                        return x, y, None, None
+                    self._banks.append(loadbank)
+                return
+
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        cache = ProfileCache(os.path.join(tmpdir, "cache"))
+        fname = os.path.join(tmpdir, "banks.dat")
+        with open(fname, "wb") as fp:
+            fp.write(b"#bank\n1 2\n2 3\n#bank\n1 4\n2 5\n#bank\n1 6\n2 7\n")
+        p1 = BankParser()
+        p1.parseFile(fname, cache=cache)
+        self.assertEqual([0], parsed)
+        self.assertEqual(1, len(os.listdir(cache.cachedir)))
+        # entry with some banks is not loaded, but its banks are used
+        self.assertFalse(cache.load(BankParser(), fname))
+        p1.getData(2)
+        self.assertEqual([0, 2], parsed)
+        p2 = BankParser()
+        p2.parseFile(fname, cache=cache)
+        self.assertTrue(array_equal([6, 7], p2.getData(2)[1]))
+        self.assertEqual([0, 2], parsed)
+        self.assertTrue(array_equal([4, 5], p2.getData(1)[1]))
+        self.assertEqual([0, 2, 1], parsed)
+        # complete entry without the metadata that cannot be saved as JSON
+        p3 = BankParser()
+        p3.parseFile(fname, cache=cache)
+        self.assertEqual(3, p3.getNumBanks())
+        self.assertTrue(array_equal([2, 3], p3.getData(0)[1]))
+        self.assertEqual([0, 2, 1], parsed)
+        self.assertEqual("X", p3.getMetaData()["stype"])
+        self.assertFalse("datainfo" in p3.getMetaData())
+        self.assertEqual(1, len(os.listdir(cache.cachedir)))
+        return
+
+# End of class TestProfileParser
+
+# ----------------------------------------------------------------------------
+
+@unittest.skipUnless(has_h5py, _msg_noh5py)
+class TestHDF5SeriesParser(unittest.TestCase):
+
+    def setUp(self):
+        import h5py
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.filename = os.path.join(tmpdir, "series.h5")
+        self.x = arange(0, 5, 0.5)
+        self.y = array([self.x + i for i in range(4)])
+        with h5py.File(self.filename, "w") as fp:
+            fp.attrs["stype"] = "X"
+            fp["x"] = self.x
+            fp["y"] = self.y
+            fp["dy"] = 0.1 + self.y
+            fp["y"].attrs["qmax"] = 25.0
+            fp["meta/temperature"] = [300.0, 310, 320, 330]
+        return
+
+
+    def test_parseFile(self):
+        "Check the frames are read as banks."
+        parser = HDF5SeriesParser()
+        parser.parseFile(self.filename)
+        self.assertEqual(4, parser.getNumBanks())
+        meta = parser.getMetaData()
+        self.assertEqual("X", meta["stype"])
+        self.assertEqual(25.0, meta["qmax"])
+        self.assertEqual(300, meta["temperature"])
+        self.assertEqual(4, meta["nframes"])
+        # only the selected frame is read
+        self.assertFalse(callable(parser._banks[0]))
+        self.assertTrue(all(callable(b) for b in parser._banks[1:]))
+        x, y, dx, dy = parser.getData(2)
+        self.assertTrue(array_equal(self.x, x))
+        self.assertTrue(array_equal(self.y[2], y))
+        self.assertTrue(dx is None)
+        self.assertTrue(array_equal(0.1 + self.y[2], dy))
+        self.assertEqual(320, meta["temperature"])
+        self.assertEqual(2, meta["bank"])
+        self.assertTrue(callable(parser._banks[0]))
+        prof = Profile()
+        prof.loadParsedData(parser)
+        self.assertTrue(array_equal(self.y[2], prof.yobs))
+        self.assertEqual(320, prof.meta["temperature"])
+        parser.getData(-1)
+        self.assertEqual(330, meta["temperature"])
+        self.assertRaises(IndexError, parser.selectBank, -5)
+        parser.close()
+        self.assertRaises(ParseError, parser.selectBank, 1)
+        # the on-disk cache is not used for the series
+        cachedir = os.path.join(os.path.dirname(self.filename), "cache")
+        parser.parseFile(self.filename, cache=ProfileCache(cachedir))
+        self.assertEqual(4, parser.getNumBanks())
+        self.assertFalse(os.path.exists(cachedir))
+        return
+
+
+    def test_badFiles(self):
+        "Check errors for missing or invalid data."
+        parser = HDF5SeriesParser(y="G")
+        self.assertRaises(ParseError, parser.parseFile, self.filename)
+        parser = HDF5SeriesParser(y="x")
+        self.assertRaises(ParseError, parser.parseFile, self.filename)
+        self.assertRaises(IOError, parser.parseFile,
+                          self.filename + "-missing")
+        with open(self.filename, "rb") as fp:
+            content = fp.read()
+        self.assertRaises(ParseError, parser.parseString, content[:100])
+        parser = HDF5SeriesParser()
+        parser.parseString(content)
+        self.assertEqual(4, parser.getNumBanks())
+        return
+
+# End of class TestHDF5SeriesParser
+
+# ----------------------------------------------------------------------------
+
 if __name__ == "__main__":
     unittest.main()
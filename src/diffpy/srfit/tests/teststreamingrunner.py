@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2010 The Trustees of Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE_DANSE.txt for license information.
+#
+##############################################################################
+
+"""Tests for streamingrunner module."""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy
+
+from diffpy.srfit.fitbase import FitContribution, FitRecipe, Profile
+from diffpy.srfit.fitbase.streamingrunner import StreamingRunner
+from diffpy.srfit.fitbase.streamingrunner import watchDirectory
+from diffpy.srfit.pdf import PDFParser
+
+
+def _refineLinear(recipe):
+    """Refine the scale of the linear profile."""
+    prof = recipe.c.profile
+    recipe.A.value = numpy.dot(prof.x, prof.y) / numpy.dot(prof.x, prof.x)
+    return
+
+
+class TestStreamingRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        contribution = FitContribution("c")
+        contribution.setProfile(Profile(), xname="x")
+        contribution.setEquation("A * x")
+        self.recipe = recipe = FitRecipe()
+        recipe.addContribution(contribution)
+        recipe.addVar(contribution.A, 1)
+        return
+
+
+    def _writeFrame(self, name, scale):
+        """Write data file with a linear profile."""
+        x = numpy.arange(1, 10, 0.5)
+        fname = os.path.join(self.tmpdir, name)
+        numpy.savetxt(fname, numpy.transpose([x, scale * x]))
+        return fname
+
+
+    def test_run(self):
+        """check refinement of a sequence of files.
+        """
+        files = [self._writeFrame("f%i.gr" % i, 2 + i) for i in range(3)]
+        starts = []
+        def refine(recipe):
+            starts.append(recipe.A.value)
+            _refineLinear(recipe)
+        store = os.path.join(self.tmpdir, "results.dat")
+        runner = StreamingRunner(self.recipe, PDFParser, refine=refine,
+                                 store=store)
+        results = runner.run(files + [files[0] + "-missing"])
+        self.assertEqual(4, len(results))
+        self.assertEqual([1, 2, 3], starts)
+        for i in range(3):
+            self.assertEqual(files[i], results[i]["filename"])
+            self.assertAlmostEqual(2 + i, results[i]["values"]["A"])
+            self.assertAlmostEqual(0, results[i]["chi2"])
+        self.assertTrue("error" in results[-1])
+        table = numpy.loadtxt(store, usecols=(1, 2, 3))
+        self.assertTrue(numpy.allclose([2, 3, 4], table[:, 2]))
+        self.assertRaises(ValueError, StreamingRunner, self.recipe,
+                          PDFParser, contribution="d")
+        self.assertRaises(TypeError, StreamingRunner, self.recipe, object)
+        return
+
+
+    def test_workers(self):
+        """check refinement in a pool of worker processes.
+        """
+        files = [self._writeFrame("f%i.gr" % i, 2 + i) for i in range(4)]
+        runner = StreamingRunner(self.recipe, PDFParser(),
+                                 refine=_refineLinear, nworkers=2)
+        results = runner.run(files)
+        self.assertEqual(files, [r["filename"] for r in results])
+        values = [r["values"]["A"] for r in results]
+        self.assertTrue(numpy.allclose([2, 3, 4, 5], values))
+        # recipe of this process is not changed
+        self.assertEqual(1, self.recipe.A.value)
+        return
+
+
+    def test_watchDirectory(self):
+        """check reporting of new files in a directory.
+        """
+        self._writeFrame("old.gr", 1)
+        source = watchDirectory(self.tmpdir, "*.gr", poll=0.01, timeout=0.5)
+        timer = threading.Timer(0.05, self._writeFrame, ("new.gr", 2))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        self._writeFrame("new.dat", 2)
+        files = list(source)
+        self.assertEqual([os.path.join(self.tmpdir, "new.gr")], files)
+        return
+
+# End of class TestStreamingRunner
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,10 +20,11 @@ Unit tests for the weakrefcallable module.
 
 import unittest
 import pickle
+import weakref
 
 from diffpy.srfit.fitbase import FitContribution
 from diffpy.srfit.fitbase.parameter import Parameter
-from diffpy.srfit.util.weakrefcallable import weak_ref, WeakBoundMethod
+from diffpy.srfit.util.weakrefcallable import weak_ref
 
 # ----------------------------------------------------------------------------
 
@@ -132,7 +133,7 @@ class TestWeakBoundMethod(unittest.TestCase):
         self.assertEqual(15, f._eq._value)
         # get one of the observer callables that are associated with f
         xof = next(iter(x._observers))
-        self.assertTrue(isinstance(xof, WeakBoundMethod))
+        self.assertTrue(isinstance(x._observers[xof], weakref.ref))
         # changing value of x should reset f._eq
         x.setValue(x.value + 1)
         self.assertTrue(None is f._eq._value)
@@ -67,6 +67,27 @@ except ImportError:
     has_srreal = False
     logger.warning('Cannot import diffpy.srreal, PDF tests skipped.')
 
+# scipy
+
+_msg_noscipy = "No module named 'scipy'"
+try:
+    import scipy.special as m; del m
+    has_scipy = True
+except ImportError:
+    has_scipy = False
+    logger.warning('Cannot import scipy, characteristic function tests '
+                   'skipped.')
+
+# h5py
+
+_msg_noh5py = "No module named 'h5py'"
+try:
+    import h5py as m; del m
+    has_h5py = True
+except ImportError:
+    has_h5py = False
+    logger.warning('Cannot import h5py, HDF5 tests skipped.')
+
 # Helper functions for testing -----------------------------------------------
 
 def _makeArgs(num):
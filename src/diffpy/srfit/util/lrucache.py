@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2008 The Trustees of Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE_DANSE.txt for license information.
+#
+##############################################################################
+
+"""LRUCache class.
+
+The LRUCache class is a bounded dictionary-like storage that discards the
+least recently used items.  It counts cache hits and misses so that the
+cache size can be tuned.
+"""
+
+__all__ = ["LRUCache"]
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """Bounded storage of the most recently used items.
+
+    Attributes
+    maxsize     --  Maximum number of stored items.  Nothing is stored when
+                    maxsize is 0.
+    hits        --  Number of successful lookups.
+    misses      --  Number of failed lookups.
+    _items      --  OrderedDict of stored items with the most recently used
+                    item at the end.
+
+    The stored items are not pickled.  Unpickled cache is empty and has
+    its counters reset.
+    """
+
+    def __init__(self, maxsize=16):
+        """Initialization.
+
+        maxsize --  Maximum number of stored items (default 16).
+
+        Raises ValueError if maxsize is negative.
+        """
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.maxsize = 0
+        self.resize(maxsize)
+        return
+
+    def __len__(self):
+        """Get the number of stored items."""
+        return len(self._items)
+
+    def __contains__(self, key):
+        """Check if key is stored without changing the counters."""
+        return key in self._items
+
+    def get(self, key, default=None):
+        """Get stored item and mark it as recently used.
+
+        key     --  The key of the item.
+        default --  Value returned when key is not stored (default None).
+
+        Returns the stored item or default.
+        """
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._items[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Store an item and discard the least recently used ones over limit.
+        """
+        if not self.maxsize:
+            return
+        self._items.pop(key, None)
+        self._items[key] = value
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return
+
+    def resize(self, maxsize):
+        """Change the maximum number of stored items.
+
+        Raises ValueError if maxsize is negative.
+        """
+        maxsize = int(maxsize)
+        if maxsize < 0:
+            raise ValueError("maxsize must be non-negative.")
+        self.maxsize = maxsize
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return
+
+    def clear(self):
+        """Discard all stored items.  This does not reset the counters."""
+        self._items.clear()
+        return
+
+    def resetCounters(self):
+        """Reset the hits and misses counters to zero."""
+        self.hits = 0
+        self.misses = 0
+        return
+
+    # support pickling without the stored items
+
+    def __getstate__(self):
+        return {'maxsize' : self.maxsize}
+
+    def __setstate__(self, state):
+        self.__init__(state['maxsize'])
+        return
+
+# End class LRUCache
+
+# End of file
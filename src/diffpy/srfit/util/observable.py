@@ -11,10 +11,15 @@
 # Derived from pyre-1.0/packages/pyre/patterns/Observable.py
 # See pyre-1.0 for full copyright and license information
 
-__all__ = ["Observable"]
+__all__ = ["Observable", "notifyAll"]
 
 
-from diffpy.srfit.util.weakrefcallable import weak_ref
+import types
+import weakref
+
+import six
+
+from diffpy.srfit.util.weakrefcallable import WeakBoundMethod
 
 
 class Observable(object):
@@ -37,18 +42,41 @@ class Observable(object):
       removeObserver: remove an event handler from the list of handlers to invoke
       notify: invoke the registered handlers in the order in which they were registered
 
+    The handlers are kept in the `_observers` dictionary keyed by
+    (observer id, callback kind) pairs.  For a bound method the observer
+    id is the id of the bound object, the kind is the plain function to be
+    called with that object and the dictionary value a weak reference to
+    the object.  Builtin bound methods are referenced weakly as well when
+    their object supports weak references.  Other callables are used as
+    the observer id and value with None for their kind.  Notification
+    iterates over a tuple of the registry items, which is rebuilt only
+    after the registry changes.  Handlers of deallocated objects are purged
+    in bulk after notification.
     """
 
+    # Registry is created on the first addObserver call.
+    _observers = None
+    # Cached tuple of the registry items or None when it needs an update.
+    _obstuple = ()
+
 
     def notify(self, other=()):
         """
         Notify all observers
         """
-        # build a list before notification, just in case the observer's callback behavior
-        # involves removing itself from our callback set
         semaphors = (self,) + other
-        for callable in tuple(self._observers):
-            callable(semaphors)
+        dead = False
+        for (oid, kind), ref in self._getObserverItems():
+            if kind is None:
+                ref(semaphors)
+                continue
+            obj = ref()
+            if obj is None:
+                dead = True
+                continue
+            kind(obj, semaphors)
+        if dead:
+            self._purgeObservers()
         return
 
 
@@ -57,8 +85,14 @@ class Observable(object):
         """
         Add callable to the set of observers
         """
-        f = weak_ref(callable, fallback=_fbRemoveObserver)
-        self._observers.add(f)
+        key, ref = _observerKey(callable)
+        if key is None:
+            return
+        if self._observers is None:
+            self._observers = {}
+        if not _isRegistered(self._observers, key, ref):
+            self._observers[key] = ref
+            self._obstuple = None
         return
 
 
@@ -66,8 +100,11 @@ class Observable(object):
         """
         Remove callable from the set of observers
         """
-        f = weak_ref(callable)
-        self._observers.remove(f)
+        key, ref = _observerKey(callable)
+        if not _isRegistered(self._observers, key, ref):
+            raise KeyError(callable)
+        del self._observers[key]
+        self._obstuple = None
         return
 
 
@@ -75,27 +112,161 @@ class Observable(object):
         """
         True if `callable` is present in the set of observers.
         """
-        f = weak_ref(callable)
-        rv = f in self._observers
+        key, ref = _observerKey(callable)
+        rv = _isRegistered(self._observers, key, ref)
+        return rv
+
+
+    def _getObserverItems(self):
+        """
+        Return tuple of the ((observer id, callback kind), reference) items.
+        """
+        rv = self._obstuple
+        if rv is None:
+            rv = self._obstuple = tuple(self._observers.items())
         return rv
 
 
+    def _purgeObservers(self):
+        """
+        Remove all observers whose bound objects were deallocated.
+        """
+        dead = [key for key, ref in self._getObserverItems()
+                if key[1] is not None and ref() is None]
+        for key in dead:
+            del self._observers[key]
+        self._obstuple = None
+        return
+
+
+    # support pickling of the registry
+
+    def __getstate__(self):
+        """
+        Return state with the observer registry resolved to picklable pairs.
+        """
+        state = self.__dict__.copy()
+        state.pop('_obstuple', None)
+        observers = state.pop('_observers', None)
+        if observers:
+            state['_obspairs'] = _resolvePairs(observers)
+        return state
+
+
+    def __setstate__(self, state):
+        """
+        Restore the observer registry upon unpickling.
+        """
+        state = dict(state)
+        pairs = state.pop('_obspairs', ())
+        self.__dict__.update(state)
+        if pairs:
+            self._observers = dict(
+                    _unresolvePair(obj, nm) for obj, nm in pairs)
+            self._obstuple = None
+        return
+
+
     # meta methods
     def __init__(self, **kwds):
         super(Observable, self).__init__(**kwds)
-        self._observers = set()
         return
 
 # end of class Observable
 
-# Local helpers --------------------------------------------------------------
+# Routines -------------------------------------------------------------------
 
-def _fbRemoveObserver(fobs, semaphors):
-    # Remove WeakBoundMethod `fobs` from the observers of notifying object.
-    # This is called from Observable.notify when the WeakBoundMethod
-    # associated object dies.
-    observable = semaphors[0]
-    observable.removeObserver(fobs)
+def notifyAll(observables, other=()):
+    """
+    Notify observers of several Observable objects calling each only once.
+
+    An observer registered with several of the observables is called only
+    for the first one of them.
+
+    observables -- iterable of Observable objects to be notified.
+    other       -- additional semaphors passed to the observers.
+    """
+    called = set()
+    for observable in observables:
+        semaphors = (observable,) + other
+        dead = False
+        for key, ref in observable._getObserverItems():
+            if key[1] is not None and ref() is None:
+                dead = True
+                continue
+            if key in called:
+                continue
+            called.add(key)
+            if key[1] is None:
+                ref(semaphors)
+            else:
+                key[1](ref(), semaphors)
+        if dead:
+            observable._purgeObservers()
     return
 
+# Local helpers --------------------------------------------------------------
+
+def _observerKey(f):
+    # Return ((observer id, callback kind), reference) for callable `f`.
+    # The key is None for WeakBoundMethod of a deallocated object.
+    if isinstance(f, WeakBoundMethod):
+        obj = f._wref()
+        if obj is None:
+            return None, None
+        return (id(obj), f.function), f._wref
+    if isinstance(f, types.MethodType) and f.__self__ is not None:
+        obj = f.__self__
+        return (id(obj), six.get_method_function(f)), weakref.ref(obj)
+    if isinstance(f, types.BuiltinMethodType):
+        # builtin bound method, e.g., set.add of a set subclass instance
+        obj = f.__self__
+        kind = getattr(type(obj), f.__name__, None)
+        if kind is not None and not isinstance(obj, types.ModuleType):
+            try:
+                return (id(obj), kind), weakref.ref(obj)
+            except TypeError:
+                # objects of list, dict and similar types cannot be
+                # referenced weakly, keep a strong reference to `f`.
+                pass
+    return (f, None), f
+
+
+def _isRegistered(observers, key, ref):
+    # True if registry item for `key` refers to the same observer.
+    # The id of a deallocated object may be reused for a new one.
+    if not observers or key is None:
+        return False
+    r = observers.get(key)
+    if r is None:
+        return False
+    rv = (key[1] is None) or (r() is ref())
+    return rv
+
+
+def _resolvePairs(observers):
+    # Convert registry to a list of (observer, method name) pairs.
+    amsg = "Unable to pickle this unbound function by name."
+    rv = []
+    for (oid, kind), ref in observers.items():
+        if kind is None:
+            rv.append((ref, None))
+            continue
+        obj = ref()
+        if obj is None:
+            continue
+        nm = kind.__name__
+        f = six.get_unbound_function(getattr(type(obj), nm))
+        assert f is kind, amsg
+        rv.append((obj, nm))
+    return rv
+
+
+def _unresolvePair(obj, nm):
+    # Restore registry item from a pickled (observer, method name) pair.
+    if nm is None:
+        return (obj, None), obj
+    f = six.get_unbound_function(getattr(type(obj), nm))
+    return (id(obj), f), weakref.ref(obj)
+
 # end of file